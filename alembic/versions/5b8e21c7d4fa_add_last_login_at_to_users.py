@@ -0,0 +1,26 @@
+"""add last_login_at to users
+
+Revision ID: 5b8e21c7d4fa
+Revises: ca6b39042f47
+Create Date: 2026-10-18 10:12:41.203518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b8e21c7d4fa'
+down_revision: Union[str, None] = 'ca6b39042f47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('last_login_at', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'last_login_at')
@@ -0,0 +1,390 @@
+"""
+End-to-end benchmark of the auth flows against local stand-ins.
+
+Usage:
+    python -m benchmarks.auth_flows --users 100 --concurrency 10 --output auth_flows.json
+    python -m benchmarks.auth_flows --mode uvicorn --workers 4 --users 200
+    python -m benchmarks.auth_flows --database-url postgresql+asyncpg://... --redis-url redis://localhost:6379
+
+Runs, phase by phase for every user: signup, confirmed_email, login,
+enable_2fa, login_2fa, an authenticated route (``--auth-requests`` times),
+refresh_token and, with ``--avatar``, upload_avatar. Each phase reports
+throughput, p50/p95/p99 latency, errors and, in ``inprocess`` mode, database
+statements and Redis round trips per request.
+
+``inprocess`` drives the app through httpx's ASGITransport; ``uvicorn`` starts
+real uvicorn workers and drives them over HTTP. The stand-ins are a SQLite file
+(unless ``--database-url``), fakeredis (in memory, or a fakeredis TCP server
+shared by the workers, unless ``--redis-url``), an aiosmtpd server and avatar
+storage on the local filesystem. The fakeredis TCP server cannot run Lua
+scripts, so use ``--redis-url`` with uvicorn workers to exercise the Redis
+refresh-token store. Argon2 runs with the configured ARGON2_*
+costs, so set those to compare parameter choices.
+
+Results are written as JSON (``--output``) together with the git commit, so
+runs on two commits can be diffed.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import httpx
+
+from services.argon2_calibration import percentile
+
+ROOT = Path(__file__).resolve().parent.parent
+PASSWORD = "secret1"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def configure_environment(args, workdir: Path, redis_port: int | None) -> None:
+    """
+    Points the app's settings at the stand-ins. Must run before any app module is imported.
+    """
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite+aiosqlite:///{workdir / 'bench.db'}"
+    os.environ["DATABASE_REPLICA_URLS"] = ""
+    os.environ["AVATAR_STORAGE"] = "local"
+    os.environ["AVATAR_LOCAL_DIR"] = str(workdir / "avatars")
+    os.environ["MAIL_OUTBOX"] = ""
+    os.environ["CACHE_WARMUP_SIZE"] = "0"
+    os.environ["BENCH_SMTP_PORT"] = str(args.smtp_port)
+    os.environ.setdefault("SECRET_KEY", "benchmark-secret-key-0123456789abcdef")
+    # Every simulated user logs in from 127.0.0.1: keep the limiter in the path, but out of the way.
+    os.environ.setdefault("RATE_LIMIT_LOGIN_PER_IP", "1000000/60")
+    os.environ.setdefault("RATE_LIMIT_EMAIL_PER_IP", "1000000/60")
+    if args.redis_url:
+        host_port = args.redis_url.split("://", 1)[-1].split("/", 1)[0]
+        os.environ["REDIS_HOST"], _, port = host_port.partition(":")
+        os.environ["REDIS_PORT"] = port or "6379"
+    elif redis_port is not None:
+        os.environ["REDIS_HOST"], os.environ["REDIS_PORT"] = "127.0.0.1", str(redis_port)
+    # main.py mounts ./static at import time.
+    (ROOT / "static").mkdir(exist_ok=True)
+
+
+def create_app():
+    """
+    App factory used by both modes: the real app, the SMTP stand-in and one
+    authenticated probe route.
+    """
+    from fastapi import Depends
+
+    from benchmarks.mail_dispatch import local_config
+    from main import app
+    from services.auth import auth_service
+    from services.email import mail_dispatcher
+
+    mail_dispatcher.config = local_config(int(os.environ["BENCH_SMTP_PORT"]))
+
+    @app.get("/bench/me")
+    async def bench_me(user=Depends(auth_service.get_current_user)):
+        return {"email": user.email}
+
+    return app
+
+
+async def create_schema() -> None:
+    from database.db import engine
+    from database.models import Base
+
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+
+
+class CallCounter:
+    """
+    Counts SQL statements on the app's engines and Redis round trips (a pipeline counts once).
+    """
+
+    def __init__(self):
+        self.db = 0
+        self.redis = 0
+
+    def install(self, engines, redis) -> None:
+        from redis.asyncio.client import Pipeline
+        from sqlalchemy import event
+
+        for engine in engines:
+            event.listen(engine.sync_engine, "before_cursor_execute", self._on_statement)
+
+        execute_command = redis.execute_command
+
+        async def counted_execute_command(*args, **kwargs):
+            self.redis += 1
+            return await execute_command(*args, **kwargs)
+
+        redis.execute_command = counted_execute_command
+        pipeline_execute = Pipeline.execute
+        counter = self
+
+        async def counted_pipeline_execute(self, *args, **kwargs):
+            counter.redis += 1
+            return await pipeline_execute(self, *args, **kwargs)
+
+        Pipeline.execute = counted_pipeline_execute
+
+    def _on_statement(self, *args) -> None:
+        self.db += 1
+
+    def snapshot(self) -> tuple[int, int]:
+        return self.db, self.redis
+
+
+def tiny_png() -> bytes:
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (320, 240), "teal").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class Runner:
+    def __init__(self, client: httpx.AsyncClient, users: int, concurrency: int, counter: CallCounter | None):
+        self.client = client
+        self.concurrency = concurrency
+        self.counter = counter
+        self.users = [{"email": f"bench{i}@example.com", "username": f"bench{i:05d}"} for i in range(users)]
+        self.results = {}
+
+    async def phase(self, name: str, request, repeat: int = 1) -> None:
+        semaphore = asyncio.Semaphore(self.concurrency)
+        latencies = []
+        errors = 0
+
+        async def one(user):
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    ok = await request(user)
+                except httpx.HTTPError:
+                    ok = False
+                latencies.append(time.perf_counter() - start)
+                if not ok:
+                    errors += 1
+
+        before = self.counter.snapshot() if self.counter else None
+        start = time.perf_counter()
+        await asyncio.gather(*(one(user) for user in self.users for _ in range(repeat)))
+        elapsed = time.perf_counter() - start
+        requests = len(latencies)
+        result = {
+            "requests": requests,
+            "errors": errors,
+            "requests_per_second": requests / elapsed,
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p95_ms": percentile(latencies, 95) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+        }
+        if before is not None:
+            db, redis = self.counter.snapshot()
+            result["db_statements_per_request"] = (db - before[0]) / requests
+            result["redis_calls_per_request"] = (redis - before[1]) / requests
+        self.results[name] = result
+        print(f"{name:>16}: {result['requests_per_second']:8.1f} req/s  p50 {result['p50_ms']:7.1f} ms  "
+              f"p99 {result['p99_ms']:7.1f} ms  errors {errors}", file=sys.stderr)
+
+    async def run(self, auth_requests: int, avatar: bool) -> dict:
+        import pyotp
+
+        from services.auth import auth_service
+
+        client = self.client
+
+        async def signup(user):
+            response = await client.post("/auth/signup", json={**user, "password": PASSWORD})
+            if response.status_code == 201:
+                user["id"] = response.json()["user"]["id"]
+            return response.status_code == 201
+
+        async def confirm(user):
+            token = auth_service.create_email_token({"sub": user["email"]})
+            return (await client.get(f"/auth/auth/confirmed_email/{token}")).status_code == 200
+
+        async def login(user):
+            response = await client.post("/auth/login", data={"username": user["email"], "password": PASSWORD})
+            return response.status_code == 302
+
+        async def enable_2fa(user):
+            response = await client.post("/auth/enable_2fa", params={"user_id": user.get("id", 0)})
+            user["totp_secret"] = response.json().get("totp_secret") if response.status_code == 200 else None
+            return response.status_code == 200
+
+        async def login_2fa(user):
+            if not user.get("totp_secret"):
+                return False
+            response = await client.post("/auth/login_2fa", params={
+                "email": user["email"], "password": PASSWORD, "token": pyotp.TOTP(user["totp_secret"]).now()})
+            if response.status_code == 200:
+                user.update(response.json())
+            return response.status_code == 200
+
+        def bearer(token):
+            return {"Authorization": f"Bearer {token}"}
+
+        async def authenticated(user):
+            return (await client.get("/bench/me", headers=bearer(user.get("access_token")))).status_code == 200
+
+        async def refresh(user):
+            response = await client.get("/auth/refresh_token", headers=bearer(user.get("refresh_token")))
+            if response.status_code == 200:
+                user.update(response.json())
+            return response.status_code == 200
+
+        png = tiny_png()
+
+        async def upload_avatar(user):
+            response = await client.post("/auth/upload_avatar", headers=bearer(user.get("access_token")),
+                                         files={"file": ("avatar.png", png, "image/png")})
+            return response.status_code == 200
+
+        await self.phase("signup", signup)
+        await self.phase("confirmed_email", confirm)
+        await self.phase("login", login)
+        await self.phase("enable_2fa", enable_2fa)
+        await self.phase("login_2fa", login_2fa)
+        await self.phase("authenticated", authenticated, repeat=auth_requests)
+        await self.phase("refresh_token", refresh)
+        if avatar:
+            await self.phase("upload_avatar", upload_avatar)
+        return self.results
+
+
+async def run_inprocess(args) -> dict:
+    import fakeredis
+
+    from services import redis_cache
+
+    if not args.redis_url:
+        redis_cache.redis_client = fakeredis.FakeAsyncRedis()
+    app = create_app()
+    await create_schema()
+
+    from database.db import engine, replica_engines
+
+    counter = CallCounter()
+    counter.install([engine, *replica_engines], await redis_cache.get_redis())
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            return await Runner(client, args.users, args.concurrency, counter).run(args.auth_requests, args.avatar)
+
+
+async def wait_until_ready(client: httpx.AsyncClient, process: subprocess.Popen, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"uvicorn exited with code {process.returncode}")
+        try:
+            if (await client.get("/auth/dashboard")).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("uvicorn did not become ready")
+
+
+async def run_uvicorn(args) -> dict:
+    await create_schema()
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "benchmarks.auth_flows:create_app", "--factory",
+         "--workers", str(args.workers), "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env=os.environ.copy(),
+    )
+    limits = httpx.Limits(max_connections=args.concurrency)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60) as client:
+            await wait_until_ready(client, process)
+            return await Runner(client, args.users, args.concurrency, None).run(args.auth_requests, args.avatar)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def main(args) -> None:
+    from aiosmtpd.controller import Controller
+
+    from benchmarks.mail_dispatch import CountingHandler
+
+    workdir = Path(tempfile.mkdtemp(prefix="auth-bench-"))
+    args.smtp_port = args.smtp_port or free_port()
+    redis_server = None
+    redis_port = None
+    if args.mode == "uvicorn" and not args.redis_url:
+        import fakeredis
+
+        print("Using a fakeredis TCP server: Lua scripts (refresh token rotation) will fail, "
+              "pass --redis-url for complete results", file=sys.stderr)
+        redis_port = free_port()
+        redis_server = fakeredis.TcpFakeServer(("127.0.0.1", redis_port))
+        threading.Thread(target=redis_server.serve_forever, daemon=True).start()
+    configure_environment(args, workdir, redis_port)
+
+    smtp = CountingHandler()
+    controller = Controller(smtp, hostname="127.0.0.1", port=args.smtp_port)
+    controller.start()
+    try:
+        runner = run_uvicorn if args.mode == "uvicorn" else run_inprocess
+        flows = asyncio.run(runner(args))
+    finally:
+        controller.stop()
+        if redis_server is not None:
+            redis_server.shutdown()
+
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "mode": args.mode,
+            "workers": args.workers if args.mode == "uvicorn" else 1,
+            "users": args.users,
+            "concurrency": args.concurrency,
+            "database": "sqlite" if not args.database_url else args.database_url.split(":", 1)[0],
+            "redis": args.redis_url and "server" or "fakeredis",
+            "python": platform.python_version(),
+            "emails_received": smtp.received,
+        },
+        "flows": flows,
+    }
+    output = json.dumps(results, indent=2)
+    if args.output:
+        Path(args.output).write_text(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the auth flows end to end")
+    parser.add_argument("--mode", choices=["inprocess", "uvicorn"], default="inprocess")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--auth-requests", type=int, default=5, help="authenticated requests per user")
+    parser.add_argument("--avatar", action="store_true", help="also benchmark avatar uploads")
+    parser.add_argument("--database-url", help="defaults to a temporary SQLite file")
+    parser.add_argument("--redis-url", help="defaults to fakeredis")
+    parser.add_argument("--smtp-port", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON results to this file")
+    main(parser.parse_args())
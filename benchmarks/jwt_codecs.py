@@ -0,0 +1,61 @@
+"""
+Compares JWT backends for encode and decode throughput.
+
+Usage:
+    python -m benchmarks.jwt_codecs --iterations 20000
+
+For every backend reports encodes and decodes per second, plus decodes per
+second through ``TokenCodec`` when the verified-token cache is warm (the case
+of a client sending the same bearer token on consecutive requests).
+"""
+import argparse
+import json
+import time
+from datetime import datetime, timedelta
+
+from services.jwt_codec import BACKENDS, TokenCodec
+
+SECRET = "benchmark-secret-key-0123456789abcdef"
+ALGORITHM = "HS256"
+
+
+def sample_claims(i: int) -> dict:
+    now = datetime.utcnow()
+    return {"sub": f"user{i}@example.com", "iat": now, "exp": now + timedelta(minutes=15),
+            "scope": "access_token"}
+
+
+def rate(iterations: int, func) -> float:
+    start = time.perf_counter()
+    for i in range(iterations):
+        func(i)
+    return iterations / (time.perf_counter() - start)
+
+
+def bench_backend(name: str, iterations: int) -> dict:
+    backend = BACKENDS[name]()
+    tokens = [backend.encode(sample_claims(i), SECRET, ALGORITHM) for i in range(iterations)]
+    codec = TokenCodec(backend, SECRET, ALGORITHM, cache_size=1)
+    codec.decode(tokens[0])
+    return {
+        "encode_per_second": rate(iterations, lambda i: backend.encode(sample_claims(i), SECRET, ALGORITHM)),
+        "decode_per_second": rate(iterations, lambda i: backend.decode(tokens[i], SECRET, [ALGORITHM])),
+        "cached_decode_per_second": rate(iterations, lambda i: codec.decode(tokens[0])),
+    }
+
+
+def main(args):
+    results = {}
+    for name in args.backends:
+        try:
+            results[name] = bench_backend(name, args.iterations)
+        except RuntimeError as e:
+            results[name] = {"error": str(e)}
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark JWT encode/decode backends")
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=list(BACKENDS))
+    main(parser.parse_args())
@@ -0,0 +1,109 @@
+"""
+Benchmarks the pooled mail dispatcher against a local aiosmtpd server.
+
+Usage:
+    pip install aiosmtpd
+    python -m benchmarks.mail_dispatch --messages 500 --pool-size 2 --batch-size 20
+
+Reports messages per second, SMTP connections opened and the peak queue depth,
+next to a baseline that opens one connection per message like the old
+``FastMail(conf).send_message`` path.
+"""
+import argparse
+import asyncio
+import json
+import time
+from pathlib import Path
+
+from aiosmtpd.controller import Controller
+from fastapi_mail import ConnectionConfig
+
+from services.mail_queue import MailDispatcher, MailMessage
+
+TEMPLATE_FOLDER = Path(__file__).resolve().parent.parent / "services" / "templates"
+
+
+class CountingHandler:
+    def __init__(self):
+        self.received = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received += 1
+        return "250 OK"
+
+
+def local_config(port: int) -> ConnectionConfig:
+    return ConnectionConfig(
+        MAIL_USERNAME="bench",
+        MAIL_PASSWORD="bench",
+        MAIL_FROM="noreply@example.com",
+        MAIL_PORT=port,
+        MAIL_SERVER="127.0.0.1",
+        MAIL_FROM_NAME="Benchmark",
+        MAIL_STARTTLS=False,
+        MAIL_SSL_TLS=False,
+        USE_CREDENTIALS=False,
+        VALIDATE_CERTS=False,
+        TEMPLATE_FOLDER=TEMPLATE_FOLDER,
+    )
+
+
+def make_message(i: int) -> MailMessage:
+    return MailMessage(
+        recipient=f"user{i}@example.com",
+        subject="Confirm your email ",
+        template_name="email_template.html",
+        template_body={"host": "http://localhost/", "username": f"user{i}", "token": "x" * 120},
+    )
+
+
+async def run_dispatcher(config: ConnectionConfig, messages: int, pool_size: int, batch_size: int) -> dict:
+    dispatcher = MailDispatcher(config, pool_size=pool_size, batch_size=batch_size, queue_size=messages)
+    peak_depth = 0
+    start = time.perf_counter()
+    for i in range(messages):
+        await dispatcher.enqueue(make_message(i))
+        peak_depth = max(peak_depth, dispatcher.queue_depth)
+    while dispatcher.queue_depth:
+        peak_depth = max(peak_depth, dispatcher.queue_depth)
+        await asyncio.sleep(0.01)
+    await dispatcher.stop()
+    elapsed = time.perf_counter() - start
+    return {"messages_per_second": messages / elapsed, "peak_queue_depth": peak_depth, **dispatcher.stats()}
+
+
+async def run_baseline(config: ConnectionConfig, messages: int) -> dict:
+    # One connection per message, sent serially.
+    start = time.perf_counter()
+    for i in range(messages):
+        dispatcher = MailDispatcher(config, pool_size=1)
+        smtp = await dispatcher._deliver(None, make_message(i))
+        await smtp.quit()
+    elapsed = time.perf_counter() - start
+    return {"messages_per_second": messages / elapsed, "connections_opened": messages}
+
+
+async def main(args):
+    handler = CountingHandler()
+    controller = Controller(handler, hostname="127.0.0.1", port=args.port)
+    controller.start()
+    try:
+        config = local_config(args.port)
+        results = {
+            "baseline": await run_baseline(config, min(args.messages, args.baseline_messages)),
+            "dispatcher": await run_dispatcher(config, args.messages, args.pool_size, args.batch_size),
+        }
+    finally:
+        controller.stop()
+    results["received"] = handler.received
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the SMTP mail dispatcher")
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--baseline-messages", type=int, default=100)
+    parser.add_argument("--pool-size", type=int, default=2)
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--port", type=int, default=8025)
+    asyncio.run(main(parser.parse_args()))
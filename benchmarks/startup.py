@@ -0,0 +1,181 @@
+"""
+Import-time and startup-time benchmark.
+
+Usage:
+    python -m benchmarks.startup --repeat 5 --output startup.json
+
+Every measurement runs in a fresh interpreter so nothing is already imported:
+
+* ``import``   - ``python -X importtime -c "import main"``: total import time of
+  ``main`` and the slowest modules (cumulative), plus interpreter wall time;
+* ``lifespan`` - the app's lifespan startup against a temporary SQLite database
+  and fakeredis: time per resource step (``services.resources`` timings) and
+  the shutdown time;
+* ``first use`` - the cost of the lazily initialized subsystems (mail config,
+  Cloudinary SDK, Pillow, TOTP) that is no longer paid at import.
+
+Medians over ``--repeat`` runs are printed; ``--output`` writes all runs as
+JSON with the git commit, so two commits can be compared.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+HEAVY_MODULES = ("fastapi_mail", "cloudinary", "pyotp", "passlib", "PIL", "jose", "cryptography", "sqlalchemy")
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def child_environment(workdir: str) -> dict:
+    env = os.environ.copy()
+    env.setdefault("SECRET_KEY", "benchmark-secret-key-0123456789abcdef")
+    env["DATABASE_URL"] = f"sqlite+aiosqlite:///{workdir}/startup.db"
+    env["DATABASE_REPLICA_URLS"] = ""
+    env["AVATAR_STORAGE"] = "local"
+    env["AVATAR_LOCAL_DIR"] = f"{workdir}/avatars"
+    env["CACHE_WARMUP_SIZE"] = "0"
+    return env
+
+
+def parse_importtime(stderr: str) -> dict[str, int]:
+    """
+    Returns the cumulative import time in microseconds per module.
+    """
+    cumulative = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, _, rest = line.partition(":")
+        _, total, name = (part.strip() for part in rest.split("|"))
+        cumulative[name] = int(total)
+    return cumulative
+
+
+def measure_import(env: dict) -> dict:
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"],
+                            cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    wall = time.perf_counter() - start
+    cumulative = parse_importtime(result.stderr)
+    slowest = sorted(((total, name) for name, total in cumulative.items() if name != "main"), reverse=True)
+    return {
+        "interpreter_seconds": wall,
+        "main_import_seconds": cumulative.get("main", 0) / 1e6,
+        "heavy_modules_imported": sorted(name for name in HEAVY_MODULES if name in cumulative),
+        "slowest_modules": [{"module": name, "seconds": total / 1e6} for total, name in slowest[:15]],
+    }
+
+
+def measure_in_child(env: dict) -> dict:
+    result = subprocess.run([sys.executable, "-m", "benchmarks.startup", "--child"],
+                            cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+async def child() -> dict:
+    """
+    Runs in a fresh interpreter: imports the app, runs its lifespan, then times first use of lazy subsystems.
+    """
+    import fakeredis
+
+    start = time.perf_counter()
+    from main import app
+    from database.db import engine
+    from database.models import Base
+    from services import redis_cache
+    from services.resources import resources
+    imported = time.perf_counter() - start
+
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    redis_cache.redis_client = fakeredis.FakeAsyncRedis()
+
+    start = time.perf_counter()
+    async with app.router.lifespan_context(app):
+        startup = time.perf_counter() - start
+        steps = {name: seconds for name, seconds in resources.timings.items() if name != "startup"}
+        # Let the pub/sub listeners subscribe; fakeredis hangs if they are cancelled mid-subscribe.
+        await asyncio.sleep(0.1)
+
+        first_use = {}
+        from services.auth import auth_service
+        from services.email import mail_config
+        from services.storage import cloudinary_sdk
+
+        for name, use in [
+            ("mail_config", mail_config.get),
+            ("cloudinary", cloudinary_sdk.get),
+            ("pillow", lambda: __import__("PIL.Image")),
+            ("totp", auth_service.generate_totp_secret),
+            ("passlib", lambda: auth_service.pwd_context),
+        ]:
+            use_start = time.perf_counter()
+            use()
+            first_use[name] = time.perf_counter() - use_start
+        shutdown_start = time.perf_counter()
+    shutdown = time.perf_counter() - shutdown_start
+    return {"import_seconds": imported, "startup_seconds": startup, "steps": steps,
+            "first_use": first_use, "shutdown_seconds": shutdown}
+
+
+def median_of(runs: list[dict], *path) -> float:
+    values = []
+    for run in runs:
+        value = run
+        for key in path:
+            value = value[key]
+        values.append(value)
+    return statistics.median(values)
+
+
+def main(args) -> None:
+    with tempfile.TemporaryDirectory() as workdir:
+        env = child_environment(workdir)
+        # The first interpreter start fills the bytecode cache; don't count it.
+        measure_import(env)
+        imports = [measure_import(env) for _ in range(args.repeat)]
+        lifespans = [measure_in_child(env) for _ in range(args.repeat)]
+
+    print(f"interpreter + import main: {median_of(imports, 'interpreter_seconds') * 1000:8.1f} ms")
+    print(f"import main:               {median_of(imports, 'main_import_seconds') * 1000:8.1f} ms")
+    print(f"heavy modules at import:   {', '.join(imports[-1]['heavy_modules_imported']) or 'none'}")
+    print(f"lifespan startup:          {median_of(lifespans, 'startup_seconds') * 1000:8.1f} ms")
+    for name in lifespans[-1]["steps"]:
+        print(f"  {name:<24}{median_of(lifespans, 'steps', name) * 1000:8.1f} ms")
+    print(f"lifespan shutdown:         {median_of(lifespans, 'shutdown_seconds') * 1000:8.1f} ms")
+    print("deferred to first use:")
+    for name in lifespans[-1]["first_use"]:
+        print(f"  {name:<24}{median_of(lifespans, 'first_use', name) * 1000:8.1f} ms")
+    print("slowest imports (cumulative):")
+    for entry in imports[-1]["slowest_modules"][:10]:
+        print(f"  {entry['module']:<40}{entry['seconds'] * 1000:8.1f} ms")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"commit": git_commit(), "python": sys.version, "repeat": args.repeat,
+                       "imports": imports, "lifespans": lifespans}, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark import and startup time")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="write the JSON results to this file")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        print(json.dumps(asyncio.run(child())))
+    else:
+        main(args)
@@ -19,6 +19,7 @@ class User(Base):
     refresh_token = Column(String(255), nullable=True)
     totp_secret = Column(String, nullable=True)
     confirmed = Column(Boolean, default=False)
+    last_login_at = Column(DateTime, nullable=True)
 
     def as_dict(self):
         return {column.name: getattr(self, column.name) for column in self.__table__.columns}
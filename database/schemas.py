@@ -31,6 +31,25 @@ class TokenModel(BaseModel):
     refresh_token: str
     token_type: str = "bearer"
 
+class IntrospectionRequest(BaseModel):
+    tokens: list[str] = Field(min_length=1, max_length=100)
+
+
+class TokenIntrospection(BaseModel):
+    active: bool
+    sub: Optional[str] = None
+    user_id: Optional[int] = None
+    username: Optional[str] = None
+    confirmed: Optional[bool] = None
+    scope: Optional[str] = None
+    jti: Optional[str] = None
+    iat: Optional[int] = None
+    exp: Optional[int] = None
+
+
+class IntrospectionResponse(BaseModel):
+    results: list[TokenIntrospection]
+
 class Enable2FAModel(BaseModel):
     user_id: int
 
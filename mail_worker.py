@@ -0,0 +1,49 @@
+"""
+Standalone mail worker: drains the Redis mail outbox and sends over pooled SMTP.
+
+Usage:
+    MAIL_OUTBOX=redis python mail_worker.py
+
+Run as many copies as needed; they share the ``mail-workers`` consumer group.
+"""
+import asyncio
+import logging
+import os
+import signal
+import socket
+
+from services.email import mail_dispatcher
+from services.outbox import OutboxConsumer
+from services.redis_cache import get_redis
+from settings import settings
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+async def main():
+    redis = await get_redis()
+    consumer = OutboxConsumer(
+        redis,
+        mail_dispatcher,
+        consumer_name=f"{socket.gethostname()}-{os.getpid()}",
+        batch_size=settings.MAIL_OUTBOX_BATCH_SIZE,
+        claim_idle_ms=settings.MAIL_OUTBOX_CLAIM_IDLE_MS,
+        dead_letter_maxlen=settings.MAIL_OUTBOX_DEAD_LETTER_MAXLEN,
+    )
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, consumer.stop)
+
+    mail_dispatcher.start()
+    logger.info(f"Mail worker {consumer.consumer_name} started")
+    try:
+        await consumer.run()
+    finally:
+        await mail_dispatcher.stop()
+        logger.info(f"Mail worker stopped: {consumer.processed} sent, {consumer.duplicates} duplicates skipped, "
+                    f"{consumer.dead_lettered} dead-lettered, {consumer.deferred} deferred on a full queue")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
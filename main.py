@@ -1,24 +1,36 @@
 from fastapi import FastAPI
 from routes.auth import router as auth_router
+from routes.jwks import router as jwks_router
+from routes.metrics import router as metrics_router
+import asyncio
 import logging
 import os
 from dotenv import load_dotenv
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
-from services.redis_cache import get_redis
+from services.redis_cache import close_redis, get_redis
+from services.resources import resources
+from services.hashing import password_hasher
+from services.avatars import avatar_service
+from services.email import mail_dispatcher
+from services.principal_cache import principal_cache
+from services.registered_emails import registered_emails
+from services.revocation import revocation_list
+from services.write_behind import user_updates
+from services.auth import auth_service
+from repository import cached_users
+from database.db import SessionLocal, engine, pool_status, replica_engines, session_metrics, warm_engine
+from database.models import User
+from sqlalchemy import select
+from services import metrics
+from services.rate_limit import RateLimitHeadersMiddleware, rate_limiter
+from settings import settings
 from fastapi.middleware.cors import CORSMiddleware
-import cloudinary
-import cloudinary.uploader
+from contextlib import asynccontextmanager
 
 
 load_dotenv()
 
-cloudinary.config(
-    cloud_name=os.getenv('CLOUDINARY_CLOUD_NAME'),
-    api_key=os.getenv('CLOUDINARY_API_KEY'),
-    api_secret=os.getenv('CLOUDINARY_API_SECRET')
-)
-
 SECRET_KEY = os.getenv("SECRET_KEY")
 if not SECRET_KEY:
     raise ValueError("SECRET_KEY is not set in environment variables")
@@ -26,7 +38,17 @@ if not SECRET_KEY:
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await resources.startup()
+    try:
+        yield
+    finally:
+        await resources.shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
 
 origins = [
     "http://localhost",
@@ -41,13 +63,107 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-@app.on_event("startup")
-async def startup_event():
+app.add_middleware(RateLimitHeadersMiddleware)
+
+# The profiler and its admin routes are only imported when profiling is configured.
+profiling_enabled = bool(settings.PROFILING_SECRET or settings.PROFILING_SAMPLE_RATE)
+if profiling_enabled:
+    from services.profiling import ProfilingMiddleware, profile_store, stack_sampler
+
+    app.add_middleware(ProfilingMiddleware, sampler=stack_sampler, store=profile_store,
+                       secret=settings.PROFILING_SECRET, sample_rate=settings.PROFILING_SAMPLE_RATE)
+
+def register_metrics_sources():
+    metrics.register_stats("db_pool_primary", lambda: pool_status(engine))
+    for index, replica_engine in enumerate(replica_engines):
+        metrics.register_stats(f"db_pool_replica_{index}", lambda e=replica_engine: pool_status(e))
+    metrics.register_stats("db_sessions", session_metrics.stats)
+    metrics.register_stats("principal_cache", principal_cache.stats)
+    metrics.register_stats("revocation_list", revocation_list.stats)
+    metrics.register_stats("token_cache", auth_service.codec.cache.stats)
+    metrics.register_stats("mail_dispatcher", mail_dispatcher.stats)
+    metrics.register_stats("password_hasher", password_hasher.stats)
+    metrics.register_stats("rate_limiter", rate_limiter.stats)
+    metrics.register_stats("registered_emails", registered_emails.stats)
+    metrics.register_stats("user_updates", user_updates.stats)
+    metrics.register_stats("avatars", lambda: {"processed": avatar_service.processed,
+                                               "deduplicated": avatar_service.deduplicated})
+
+async def warm_redis():
+    redis = await get_redis()
+    await redis.ping()
+    await cached_users.refresh_generation(force=True)
+
+
+async def warm_database():
+    # The same statement as repository.users.get_user_by_email, so its SQL is compiled and prepared.
+    statements = [select(User).filter(User.email == "")]
+    opened = await warm_engine(engine, settings.DB_WARM_CONNECTIONS, statements)
+    for replica_engine in replica_engines:
+        await warm_engine(replica_engine, settings.DB_WARM_CONNECTIONS, statements)
+    logger.info(f"Opened {opened} database connections per engine")
+
+
+async def dispose_engines():
+    for each in [engine, *replica_engines]:
+        await each.dispose()
+
+
+async def warm_user_cache():
+    if settings.CACHE_WARMUP_SIZE:
+        async with SessionLocal() as db:
+            warmed = await cached_users.warm_up(db, settings.CACHE_WARMUP_SIZE)
+        logger.info(f"Warmed user cache with {warmed} users")
+
+
+async def start_listeners():
     redis = await get_redis()
-    await redis.flushall()
-    print("Redis cache cleared at startup.")
+    await principal_cache.start(redis)
+    await revocation_list.start(redis)
+
+
+async def stop_listeners():
+    await principal_cache.stop()
+    await revocation_list.stop()
+
+
+async def start_registered_emails():
+    if settings.REGISTERED_EMAIL_FILTER:
+        await registered_emails.start(await get_redis(), SessionLocal)
+
+
+def start_metrics():
+    register_metrics_sources()
+    app.state.metrics_task = asyncio.create_task(metrics.refresh_loop(settings.METRICS_REFRESH_SECONDS))
+
+
+async def stop_metrics():
+    app.state.metrics_task.cancel()
+    await asyncio.gather(app.state.metrics_task, return_exceptions=True)
+    metrics.mark_process_dead()
+
+
+# Startup runs top to bottom before the worker accepts requests, shutdown bottom to top.
+# Mail, Cloudinary and the hashing processes start on first use. A worker that cannot reach
+# Redis or the database fails startup instead of serving with cold or unreachable pools.
+resources.add("redis", start=warm_redis, stop=close_redis, required=True)
+resources.add("database", start=warm_database, stop=dispose_engines, required=True)
+resources.add("user_cache", start=warm_user_cache)
+resources.add("listeners", start=start_listeners, stop=stop_listeners)
+resources.add("registered_emails", start=start_registered_emails, stop=registered_emails.stop)
+resources.add("user_updates", start=lambda: user_updates.start(engine), stop=user_updates.stop)
+resources.add("mail", stop=mail_dispatcher.stop)
+resources.add("password_hasher", stop=password_hasher.shutdown)
+resources.add("avatars", stop=avatar_service.shutdown)
+resources.add("metrics", start=start_metrics, stop=stop_metrics)
 
 app.include_router(auth_router)
+app.include_router(jwks_router)
+app.include_router(metrics_router)
+if profiling_enabled:
+    from routes.profiles import router as profiles_router
+
+    app.include_router(profiles_router)
 
 templates = Jinja2Templates(directory="templates")
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -56,6 +172,9 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 def read_root():
     return {"message": "the messenger on FastAPI"}
 
+# Must run after the last route is registered.
+metrics.instrument_routes(app)
+
 
 if __name__ == "__main__":
     import uvicorn
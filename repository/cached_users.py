@@ -0,0 +1,311 @@
+"""
+Redis-backed read-through / write-through cache around ``repository.users``.
+
+Users are stored under versioned, namespaced keys as msgpack arrays in column
+order. The key version includes a fingerprint of the ``users`` columns, so a
+schema change moves to fresh keys instead of decoding stale payloads. Redis
+errors are logged and the call falls back to the database.
+
+Keys also carry a cache generation stored in Redis. A deploy that needs a cold
+cache bumps the generation (``python -m services.cache_admin bump``) instead of
+flushing Redis; old keys simply expire.
+"""
+import asyncio
+import logging
+import time
+import zlib
+from datetime import datetime
+
+import msgpack
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from database.models import User
+from database.schemas import UserModel
+from repository import users as repository_users
+from services.redis_cache import get_redis
+from services.registered_emails import registered_emails
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "users"
+SCHEMA_VERSION = 1
+CACHE_TTL = 3600
+GENERATION_KEY = f"{KEY_PREFIX}:generation"
+GENERATION_REFRESH_SECONDS = 5
+LOCK_TTL_MS = 5000
+LOCK_POLL_INTERVAL = 0.02
+LOCK_POLL_ATTEMPTS = 10
+
+_COLUMNS = [column.name for column in User.__table__.columns]
+_FINGERPRINT = format(zlib.crc32(",".join(_COLUMNS).encode()), "x")
+_DATETIME_EXT = 1
+
+_generation = 0
+_generation_checked_at = 0.0
+_inflight: dict[str, asyncio.Future] = {}
+
+
+def user_key(email: str) -> str:
+    return f"{KEY_PREFIX}:g{_generation}:v{SCHEMA_VERSION}.{_FINGERPRINT}:email:{email}"
+
+
+def lock_key(email: str) -> str:
+    return f"{KEY_PREFIX}:g{_generation}:lock:email:{email}"
+
+
+async def refresh_generation(force: bool = False) -> int:
+    """
+    Re-reads the cache generation from Redis at most every few seconds.
+    """
+    global _generation, _generation_checked_at
+    now = time.monotonic()
+    if not force and now - _generation_checked_at < GENERATION_REFRESH_SECONDS:
+        return _generation
+    _generation_checked_at = now
+    try:
+        redis = await get_redis()
+        value = await redis.get(GENERATION_KEY)
+        _generation = int(value or 0)
+    except Exception as e:
+        logger.warning(f"Could not read cache generation: {e}")
+    return _generation
+
+
+async def bump_generation() -> int:
+    global _generation, _generation_checked_at
+    redis = await get_redis()
+    _generation = await redis.incr(GENERATION_KEY)
+    _generation_checked_at = time.monotonic()
+    return _generation
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return msgpack.ExtType(_DATETIME_EXT, value.isoformat().encode())
+    raise TypeError(f"Cannot serialize {type(value)!r}")
+
+
+def _decode(code: int, data: bytes):
+    if code == _DATETIME_EXT:
+        return datetime.fromisoformat(data.decode())
+    return msgpack.ExtType(code, data)
+
+
+def serialize(user: User) -> bytes:
+    return msgpack.packb([getattr(user, name) for name in _COLUMNS], default=_encode)
+
+
+def deserialize(payload: bytes) -> User:
+    values = msgpack.unpackb(payload, ext_hook=_decode)
+    return User(**dict(zip(_COLUMNS, values)))
+
+
+async def _cache_get(emails: list[str]) -> list:
+    try:
+        await refresh_generation()
+        redis = await get_redis()
+        return await redis.mget([user_key(email) for email in emails])
+    except Exception as e:
+        logger.warning(f"User cache read failed: {e}")
+        return [None] * len(emails)
+
+
+async def _cache_set(users: list[User]) -> None:
+    if not users:
+        return
+    try:
+        redis = await get_redis()
+        async with redis.pipeline(transaction=False) as pipe:
+            for user in users:
+                pipe.set(user_key(user.email), serialize(user), ex=CACHE_TTL)
+            await pipe.execute()
+    except Exception as e:
+        logger.warning(f"User cache write failed: {e}")
+
+
+async def invalidate(email: str) -> None:
+    try:
+        redis = await get_redis()
+        await redis.delete(user_key(email))
+    except Exception as e:
+        logger.warning(f"User cache invalidation failed for {email}: {e}")
+
+
+async def get_user_by_email(email: str, db: Session) -> User | None:
+    """
+    Read-through lookup of a single user with stampede protection.
+
+    Emails the registered-email filter rules out return None without touching
+    the database. Concurrent misses for the same email inside this process wait on one future,
+    and a short Redis lock lets only one worker query the database while the
+    others poll the cache. Waiters get their own detached copy of the user.
+    """
+    payload = (await _cache_get([email]))[0]
+    if payload is not None:
+        try:
+            return deserialize(payload)
+        except Exception as e:
+            logger.warning(f"Dropping undecodable cache entry for {email}: {e}")
+
+    if not registered_emails.might_exist(email):
+        return None
+
+    pending = _inflight.get(email)
+    if pending is not None:
+        payload = await asyncio.shield(pending)
+        return deserialize(payload) if payload is not None else None
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[email] = future
+    try:
+        user = await _load_user(email, db)
+        future.set_result(serialize(user) if user is not None else None)
+        return user
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        future.exception()  # mark retrieved when nobody else is waiting
+        raise
+    finally:
+        _inflight.pop(email, None)
+
+
+async def _load_user(email: str, db: Session) -> User | None:
+    locked = False
+    redis = None
+    try:
+        redis = await get_redis()
+        locked = await redis.set(lock_key(email), 1, nx=True, px=LOCK_TTL_MS)
+        if not locked:
+            for _ in range(LOCK_POLL_ATTEMPTS):
+                await asyncio.sleep(LOCK_POLL_INTERVAL)
+                payload = await redis.get(user_key(email))
+                if payload is not None:
+                    return deserialize(payload)
+    except Exception as e:
+        logger.warning(f"User cache lock failed for {email}: {e}")
+
+    try:
+        user = await repository_users.get_user_by_email(email, db)
+        if user is not None:
+            await _cache_set([user])
+        return user
+    finally:
+        if locked:
+            try:
+                await redis.delete(lock_key(email))
+            except Exception as e:
+                logger.warning(f"Could not release user cache lock for {email}: {e}")
+
+
+async def get_users_by_emails(emails: list[str], db: Session) -> dict[str, User]:
+    """
+    Looks up many users with one MGET and one ``IN`` query for the misses.
+
+    Returns:
+        dict: Found users keyed by the requested email; unknown emails are absent.
+    """
+    emails = list(dict.fromkeys(emails))
+    if not emails:
+        return {}
+    payloads = await _cache_get(emails)
+
+    found = {}
+    missing = []
+    for email, payload in zip(emails, payloads):
+        if payload is None:
+            missing.append(email)
+            continue
+        try:
+            found[email] = deserialize(payload)
+        except Exception as e:
+            logger.warning(f"Dropping undecodable cache entry for {email}: {e}")
+            missing.append(email)
+
+    missing = [email for email in missing if registered_emails.might_exist(email)]
+    if missing:
+        loaded = await repository_users.get_users_by_emails(missing, db)
+        await _cache_set(loaded)
+        by_email = {user.email: user for user in loaded}
+        for email in missing:
+            user = by_email.get(email)
+            if user is not None:
+                found[email] = user
+    return found
+
+
+async def warm_up(db: Session, limit: int) -> int:
+    """
+    Preloads the most recently active users (then the newest) into the cache.
+
+    Returns:
+        int: The number of users written to the cache.
+    """
+    await refresh_generation(force=True)
+    result = await db.execute(select(User).order_by(User.last_login_at.desc().nulls_last(), User.created_at.desc())
+                              .limit(limit))
+    users = list(result.scalars().all())
+    await _cache_set(users)
+    return len(users)
+
+
+async def peek(email: str) -> User | None:
+    """
+    Returns the cached user without falling back to the database.
+    """
+    payload = (await _cache_get([email]))[0]
+    if payload is None:
+        return None
+    try:
+        return deserialize(payload)
+    except Exception:
+        return None
+
+
+async def create_user(body: UserModel, db: Session) -> User | None:
+    user = await repository_users.create_user(body, db)
+    if user is not None:
+        await _cache_set([user])
+        await registered_emails.add(user.email)
+    return user
+
+
+async def update_token(email: str, token: str | None, db: Session, expected: str | None = None) -> bool:
+    updated = await repository_users.update_token(email, token, db, expected)
+    await invalidate(email)
+    return updated
+
+
+async def clear_token_family(email: str, family_id: str, db: Session) -> bool:
+    updated = await repository_users.clear_token_family(email, family_id, db)
+    await invalidate(email)
+    return updated
+
+
+async def update_password(email: str, password: str, db: Session, expected: str | None = None) -> bool:
+    updated = await repository_users.update_password(email, password, db, expected)
+    await invalidate(email)
+    return updated
+
+
+async def update_avatar(email: str, url: str, db: Session) -> bool:
+    updated = await repository_users.update_avatar(email, url, db)
+    await invalidate(email)
+    return updated
+
+
+async def update_totp_secret(user_id: int, totp_secret: str, db: Session) -> str | None:
+    email = await repository_users.update_totp_secret(user_id, totp_secret, db)
+    if email is not None:
+        await invalidate(email)
+    return email
+
+
+async def confirmed_email(email: str, db: Session) -> bool:
+    updated = await repository_users.confirmed_email(email, db)
+    await invalidate(email)
+    return updated
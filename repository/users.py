@@ -1,41 +1,144 @@
+from sqlalchemy import update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import Session
 from sqlalchemy.future import select
+from database.db import replica_router
 from database.models import User
 from database.schemas import UserModel
+from services.principal_cache import principal_cache
 import logging
 
+users_table = User.__table__
+
+
+async def _after_write(email: str) -> None:
+    replica_router.mark_write(email)
+    await principal_cache.invalidate(email)
+
+
+# Writes made by other workers also pin this user's reads to the primary.
+principal_cache.subscribe(replica_router.mark_write)
+
 
 async def get_user_by_email(email: str, db: Session):
-    result = await db.execute(select(User).filter(User.email == email))
+    result = await db.execute(select(User).filter(User.email == email).execution_options(sticky_key=email))
     scalar_result = result.scalars()
     return scalar_result.first()
 
-async def create_user(user: UserModel, db: Session):
-    new_user = User(**user.model_dump(), totp_secret=None)
-    db.add(new_user)
+async def get_users_by_emails(emails: list[str], db: Session) -> list[User]:
+    result = await db.execute(select(User).filter(User.email.in_(emails)))
+    return list(result.scalars().all())
+
+def _insert_for(db: Session):
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return pg_insert
+    if dialect == "sqlite":
+        return sqlite_insert
+    raise RuntimeError(f"INSERT ... ON CONFLICT is not supported for {dialect}")
+
+async def create_user(user: UserModel, db: Session) -> User | None:
+    """
+    Inserts a user with a single INSERT ... ON CONFLICT (email) DO NOTHING RETURNING.
+
+    Returns:
+        User | None: The new user, or None if the email is already registered.
+    """
+    stmt = (
+        _insert_for(db)(User)
+        .values(**user.model_dump(), totp_secret=None)
+        .on_conflict_do_nothing(index_elements=[User.email])
+        .returning(User)
+    )
+    result = await db.scalars(stmt)
+    new_user = result.first()
+    if new_user is not None:
+        # Detach before commit so the returned attributes are not expired.
+        db.expunge(new_user)
     await db.commit()
-    await db.refresh(new_user)
     return new_user
 
-async def update_token(user: User, token: str | None, db: Session) -> None:
-    user.refresh_token = token
+async def _update_returning(db: Session, where: list, values: dict, returning):
+    """
+    Runs one Core UPDATE ... WHERE ... RETURNING and commits, without loading ORM objects.
+
+    Returns:
+        The first RETURNING value, or None if no row matched.
+    """
+    result = await db.execute(update(users_table).where(*where).values(**values).returning(returning))
+    value = result.scalar()
     await db.commit()
+    return value
+
+async def update_token(email: str, token: str | None, db: Session, expected: str | None = None) -> bool:
+    """
+    Sets users.refresh_token; with ``expected``, only if the current value matches it.
+    """
+    where = [users_table.c.email == email]
+    if expected is not None:
+        where.append(users_table.c.refresh_token == expected)
+    updated = await _update_returning(db, where, {"refresh_token": token}, users_table.c.id)
+    if updated is not None:
+        await _after_write(email)
+    return updated is not None
+
+async def clear_token_family(email: str, family_id: str, db: Session) -> bool:
+    where = [users_table.c.email == email, users_table.c.refresh_token.startswith(f"{family_id}:", autoescape=True)]
+    updated = await _update_returning(db, where, {"refresh_token": None}, users_table.c.id)
+    if updated is not None:
+        await _after_write(email)
+    return updated is not None
+
+async def update_password(email: str, password: str, db: Session, expected: str | None = None) -> bool:
+    """
+    Sets a new password hash; with ``expected``, only if the stored hash is still that value.
+    """
+    where = [users_table.c.email == email]
+    if expected is not None:
+        where.append(users_table.c.password == expected)
+    updated = await _update_returning(db, where, {"password": password}, users_table.c.id)
+    if updated is not None:
+        await _after_write(email)
+    return updated is not None
+
+async def update_avatar(email: str, url: str, db: Session) -> bool:
+    updated = await _update_returning(db, [users_table.c.email == email], {"avatar": url}, users_table.c.id)
+    if updated is not None:
+        await _after_write(email)
+    return updated is not None
 
 async def get_user_by_id(user_id: int, db: Session):
     result = await db.execute(select(User).filter(User.id == user_id))
     scalar_result = result.scalars()
     return scalar_result.first()
 
-async def update_totp_secret(user: User, totp_secret: str, db: Session):
-    user.totp_secret = totp_secret
-    await db.commit()
+async def update_totp_secret(user_id: int, totp_secret: str, db: Session) -> str | None:
+    """
+    Stores a TOTP secret for the user.
 
-async def confirmed_email(email: str, db: Session) -> None:
-    user = await get_user_by_email(email, db)
-    user.confirmed = True
-    db.add(user)
-    logging.info(f"Confirming email for user: {user.email}")
-    await db.commit()
+    Returns:
+        str | None: The user's email, or None if the user does not exist.
+    """
+    email = await _update_returning(db, [users_table.c.id == user_id], {"totp_secret": totp_secret},
+                                    users_table.c.email)
+    if email is not None:
+        await _after_write(email)
+    return email
+
+async def confirmed_email(email: str, db: Session) -> bool:
+    """
+    Confirms the email only if it is not confirmed yet.
+
+    Returns:
+        bool: True if this call confirmed the email, False if it was already confirmed or unknown.
+    """
+    where = [users_table.c.email == email, users_table.c.confirmed.isnot(True)]
+    updated = await _update_returning(db, where, {"confirmed": True}, users_table.c.id)
+    if updated is not None:
+        logging.info(f"Confirmed email for user: {email}")
+        await _after_write(email)
+    return updated is not None
 
 async def get_user_from_data(data: dict) -> User:
     return User(
@@ -1,19 +1,27 @@
-from fastapi import APIRouter, HTTPException, Depends, status, Security, BackgroundTasks, Request, Form, File, UploadFile
+import hmac
+import time
+from datetime import datetime
+
+from fastapi import APIRouter, HTTPException, Depends, status, Security, BackgroundTasks, Request, Form, File, UploadFile, Header
 from fastapi.security import OAuth2PasswordRequestForm, HTTPAuthorizationCredentials, HTTPBearer
+from jose import JWTError
 from sqlalchemy.orm import Session
 from database.db import get_db
-from database.schemas import UserModel, UserResponse, TokenModel, RequestEmail
-from repository import users as repository_users
+from database.schemas import UserModel, UserResponse, TokenModel, RequestEmail, IntrospectionRequest, IntrospectionResponse
+from repository import cached_users
 from services.auth import auth_service
-from services.email import send_email
+from services.token_store import token_store
+from services.write_behind import user_updates
+from services.revocation import revocation_list
+from services.avatars import avatar_service
+from services.email import require_mail_capacity, send_email, send_reset_email
+from services.rate_limit import form_field, json_field, query_param, rate_limit
 import logging
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, Response
 from fastapi.templating import Jinja2Templates
 from pathlib import Path
-from services.redis_cache import get_redis, redis_client
-import json
 from database.models import User
-import cloudinary.uploader
+from settings import settings
 
 
 router = APIRouter(prefix='/auth', tags=["auth"])
@@ -24,30 +32,42 @@ logger = logging.getLogger(__name__)
 
 templates = Jinja2Templates(directory="services/templates")
 
+# Login and 2FA login share one budget: both cost an argon2 verify.
+login_limit = rate_limit("login", settings.RATE_LIMIT_LOGIN_PER_IP, settings.RATE_LIMIT_LOGIN_PER_ACCOUNT,
+                         account=form_field("username"))
+login_2fa_limit = rate_limit("login", settings.RATE_LIMIT_LOGIN_PER_IP, settings.RATE_LIMIT_LOGIN_PER_ACCOUNT,
+                             account=query_param("email"))
+request_email_limit = rate_limit("email", settings.RATE_LIMIT_EMAIL_PER_IP, settings.RATE_LIMIT_EMAIL_PER_ACCOUNT,
+                                 account=json_field("email"))
+password_reset_limit = rate_limit("email", settings.RATE_LIMIT_EMAIL_PER_IP,
+                                  settings.RATE_LIMIT_EMAIL_PER_ACCOUNT, account=form_field("email"))
+# Per client IP only: the tokens in one call may belong to any number of accounts.
+introspect_limit = rate_limit("introspect", settings.RATE_LIMIT_INTROSPECT_PER_IP,
+                              settings.RATE_LIMIT_INTROSPECT_PER_IP)
 
 
-async def get_user_from_cache(user_id: int, db: Session):
-    cached_user = redis_client.get(f"user:{user_id}")
+async def require_introspection_client(x_introspection_secret: str | None = Header(None)):
+    secret = settings.INTROSPECTION_CLIENT_SECRET
+    if not secret or not x_introspection_secret or \
+            not hmac.compare_digest(secret.encode(), x_introspection_secret.encode()):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
+                            detail="Valid X-Introspection-Secret required")
 
-    if cached_user:
-        print("User is not in cash!")
-        return json.loads(cached_user)
 
-    user = db.query(User).filter(User.id == user_id).first()
-    if user:
-        redis_client.setex(f"user:{user.id}", 3600, json.dumps(user.__dict__))
-        return user
-    return None
 
 @router.post("/signup", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-async def signup(body: UserModel, background_tasks: BackgroundTasks, request: Request, db: Session = Depends(get_db)):
-    exist_user = await repository_users.get_user_by_email(body.email, db)
-    if exist_user:
-        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Account already exists")
-
-    body.password = auth_service.get_password_hash(body.password)
-    new_user = await repository_users.create_user(body, db)
-    background_tasks.add_task(send_email, new_user.email, new_user.username, str(request.base_url))
+async def signup(body: UserModel, request: Request, db: Session = Depends(get_db)):
+    account_exists = HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Account already exists")
+
+    # A cache hit is a cheap early 409; a miss is resolved by the INSERT itself.
+    if await cached_users.peek(body.email) is not None:
+        raise account_exists
+
+    body.password = await auth_service.get_password_hash(body.password)
+    new_user = await cached_users.create_user(body, db)
+    if new_user is None:
+        raise account_exists
+    await send_email(new_user.email, new_user.username, str(request.base_url))
     return {"message": "User created", "user": new_user}
 
 @router.get("/login")
@@ -55,15 +75,16 @@ async def login(request: Request):
     return templates.TemplateResponse("users/login.html", {"request": request, "form": {}})
 
 
-@router.post("/login", response_model=TokenModel)
-async def login(body: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db), redis=Depends(get_redis)):
+@router.post("/login", response_model=TokenModel, dependencies=[Depends(login_limit)])
+async def login(background_tasks: BackgroundTasks, body: OAuth2PasswordRequestForm = Depends(),
+                db: Session = Depends(get_db)):
     """
     Handles user login.
 
     Parameters:
+        background_tasks (BackgroundTasks): Used to rehash outdated password hashes after the response.
         body (OAuth2PasswordRequestForm): The login credentials provided by the user.
         db (Session): The database session.
-        redis: The Redis client for caching.
 
     Returns:
         RedirectResponse: Redirects the user to the /dashboard page upon successful login.
@@ -71,75 +92,99 @@ async def login(body: OAuth2PasswordRequestForm = Depends(), db: Session = Depen
     Raises:
         HTTPException: If the email or password is invalid, or if the email is not confirmed.
     """
-    cached_user = await redis.get(body.username)
-
-    if cached_user:
-        print("User found in cache")
-        user_data = json.loads(cached_user)
-        user = User(**user_data)
-    else:
-        user = await repository_users.get_user_by_email(body.username, db)
-        if user:
-            await redis.set(body.username, json.dumps(user.as_dict()), ex=3600)
-            print("User added to cache")
-
-    #user = await repository_users.get_user_by_email(body.username, db)
+    user = await cached_users.get_user_by_email(body.username, db)
 
     if user is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid email")
 
-    if not auth_service.verify_password(body.password, user.password):
+    if not await auth_service.verify_password(body.password, user.password):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid password")
 
+    if auth_service.needs_rehash(user.password):
+        background_tasks.add_task(auth_service.rehash_password, user.email, body.password, user.password)
+
     if not user.confirmed:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Email not confirmed")
 
-    access_token = await auth_service.create_access_token(data={"sub": user.email})
-    refresh_token = await auth_service.create_refresh_token(data={"sub": user.email})
-    await repository_users.update_token(user, refresh_token, db)
+    access_token, refresh_token = await auth_service.issue_tokens(user.email)
+    user_updates.record(user.email, last_login_at=datetime.utcnow())
 
     return RedirectResponse(url="/auth/dashboard", status_code=status.HTTP_302_FOUND)
 
 
 @router.get('/refresh_token', response_model=TokenModel)
 async def refresh_token(credentials: HTTPAuthorizationCredentials = Security(security), db: Session = Depends(get_db)):
-    token = credentials.credentials
-    email = await auth_service.decode_refresh_token(token)
-    user = await repository_users.get_user_by_email(email, db)
-    if user.refresh_token != token:
-        await repository_users.update_token(user, None, db)
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
-
-    new_access_token = await auth_service.create_access_token(data={"sub": email})
-    new_refresh_token = await auth_service.create_refresh_token(data={"sub": email})
-    await repository_users.update_token(user, new_refresh_token, db)
+    new_access_token, new_refresh_token = await auth_service.rotate_refresh_token(credentials.credentials, db)
     return {"access_token": new_access_token, "refresh_token": new_refresh_token, "token_type": "bearer"}
 
 
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(everywhere: bool = False, credentials: HTTPAuthorizationCredentials = Security(security)):
+    """
+    Ends the current session, or every session of the user with ``everywhere=true``.
+
+    The access token stops working immediately on all workers; the refresh token
+    family it was issued with is deleted.
+    """
+    payload = auth_service.decode_access_payload(credentials.credentials)
+    if everywhere:
+        await auth_service.revoke_sessions(payload["sub"])
+        return
+    if payload.get("jti"):
+        await revocation_list.revoke_token(payload["jti"], payload["exp"])
+    else:
+        # Tokens issued before access tokens carried a jti can only be revoked per user.
+        await revocation_list.revoke_user(payload["sub"], at=payload.get("iat"))
+    if payload.get("fid"):
+        await token_store.revoke_family(payload["sub"], payload["fid"])
+
+
+@router.post("/introspect", response_model=IntrospectionResponse,
+             dependencies=[Depends(introspect_limit), Depends(require_introspection_client)])
+async def introspect(body: IntrospectionRequest, response: Response, db: Session = Depends(get_db)):
+    """
+    Validates up to 100 access tokens in one call, for gateways and sibling services.
+
+    Callers authenticate with the shared ``INTROSPECTION_CLIENT_SECRET`` in the
+    ``X-Introspection-Secret`` header and are rate-limited per IP.
+
+    The result may be cached briefly by the caller: never past the earliest expiry
+    in the batch and never longer than ``INTROSPECTION_MAX_AGE`` seconds, which also
+    bounds how late a revocation is noticed.
+    """
+    results = await auth_service.introspect(body.tokens, db)
+    expiries = [result["exp"] for result in results if result["active"] and result.get("exp")]
+    max_age = settings.INTROSPECTION_MAX_AGE
+    if expiries:
+        max_age = max(0, min(max_age, int(min(expiries) - time.time())))
+    response.headers["Cache-Control"] = f"private, max-age={max_age}"
+    return {"results": results}
+
+
 @router.post("/enable_2fa")
 async def enable_2fa(user_id: int, db: Session = Depends(get_db)):
-    user = await repository_users.get_user_by_id(user_id, db)
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-
     totp_secret = auth_service.generate_totp_secret()
-    await repository_users.update_totp_secret(user, totp_secret, db)
+    if await cached_users.update_totp_secret(user_id, totp_secret, db) is None:
+        raise HTTPException(status_code=404, detail="User not found")
 
     return {"totp_secret": totp_secret}
 
 
-@router.post("/login_2fa")
-async def login_2fa(email: str, password: str, token: str, db: Session = Depends(get_db)):
-    user = await repository_users.get_user_by_email(email, db)
-    if not user or not auth_service.verify_password(password, user.password):
+@router.post("/login_2fa", dependencies=[Depends(login_2fa_limit)])
+async def login_2fa(email: str, password: str, token: str, background_tasks: BackgroundTasks,
+                    db: Session = Depends(get_db)):
+    user = await cached_users.get_user_by_email(email, db)
+    if not user or not await auth_service.verify_password(password, user.password):
         raise HTTPException(status_code=401, detail="Invalid email or password")
 
+    if auth_service.needs_rehash(user.password):
+        background_tasks.add_task(auth_service.rehash_password, user.email, password, user.password)
+
     if not auth_service.verify_totp_token(user.totp_secret, token):
         raise HTTPException(status_code=401, detail="Invalid 2FA token")
 
-    access_token = await auth_service.create_access_token(data={"sub": user.email})
-    refresh_token = await auth_service.create_refresh_token(data={"sub": user.email})
-    await repository_users.update_token(user, refresh_token, db)
+    access_token, refresh_token = await auth_service.issue_tokens(user.email)
+    user_updates.record(user.email, last_login_at=datetime.utcnow())
 
     return {
         "access_token": access_token,
@@ -150,20 +195,24 @@ async def login_2fa(email: str, password: str, token: str, db: Session = Depends
 @router.get('/auth/confirmed_email/{token}')
 async def confirmed_email(token: str, db: Session = Depends(get_db)):
     email = await auth_service.get_email_from_token(token)
-    user = await repository_users.get_user_by_email(email, db)
+    if await cached_users.confirmed_email(email, db):
+        return {"message": "Email confirmed"}
+    # Nothing was updated: either already confirmed or an unknown email.
+    user = await cached_users.get_user_by_email(email, db)
     if user is None:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Verification error")
-    if user.confirmed:
-        return {"message": "Your email is already confirmed"}
-    await repository_users.confirmed_email(email, db)
-    return {"message": "Email confirmed"}
+    return {"message": "Your email is already confirmed"}
 
-@router.post('/request_email')
-async def request_email(body: RequestEmail, background_tasks: BackgroundTasks, request: Request, db: Session = Depends(get_db)):
-    user = await repository_users.get_user_by_email(body.email, db)
+@router.post('/request_email', dependencies=[Depends(request_email_limit)])
+async def request_email(body: RequestEmail, request: Request, db: Session = Depends(get_db)):
+    require_mail_capacity()
+    user = await cached_users.get_user_by_email(body.email, db)
+    if user is None:
+        # Same answer as for a real account, so the endpoint does not reveal registered emails.
+        return {"message": "Check your email for confirmation."}
     if user.confirmed:
         return {"message": "Your email is already confirmed"}
-    background_tasks.add_task(send_email, user.email, user.username, str(request.base_url))
+    await send_email(user.email, user.username, str(request.base_url))
     return {"message": "Check your email for confirmation."}
 
 @router.get("/dashboard")
@@ -180,12 +229,14 @@ async def dashboard():
 async def password_reset(request: Request):
     return templates.TemplateResponse("users/password_reset.html", {"request": request})
 
-@router.post("/password_reset")
-async def handle_password_reset(background_tasks: BackgroundTasks, request: Request, email: str = Form(...), db: Session = Depends(get_db)):
-    user = await repository_users.get_user_by_email(email, db)
+@router.post("/password_reset", dependencies=[Depends(password_reset_limit)])
+async def handle_password_reset(request: Request, email: str = Form(...), db: Session = Depends(get_db)):
+    # Checked before the lookup so that a busy mail queue answers the same for every email.
+    require_mail_capacity()
+    user = await cached_users.get_user_by_email(email, db)
     if user:
         token = auth_service.create_email_token({"sub": user.email})
-        background_tasks.add_task(send_reset_email, user.email, token, str(request.base_url))
+        await send_reset_email(user.email, token, str(request.base_url))
     return RedirectResponse(url="/password_reset_done", status_code=status.HTTP_303_SEE_OTHER)
 
 @router.get("/password_reset_done")
@@ -196,7 +247,7 @@ async def password_reset_done(request: Request):
 async def password_reset_confirm(request: Request, token: str, db: Session = Depends(get_db)):
     try:
         email = await auth_service.get_email_from_token(token)
-        user = await repository_users.get_user_by_email(email, db)
+        user = await cached_users.get_user_by_email(email, db)
 
         if not user:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid token or user does not exist")
@@ -218,15 +269,10 @@ async def password_reset_confirm_post(request: Request, token: str, password: st
             })
 
         email = await auth_service.get_email_from_token(token)
-        user = await repository_users.get_user_by_email(email, db)
-
-        if not user:
+        hashed_password = await auth_service.get_password_hash(password)
+        if not await cached_users.update_password(email, hashed_password, db):
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid token or user does not exist")
-
-        hashed_password = auth_service.get_password_hash(password)
-
-        user.password = hashed_password
-        db.commit()
+        await auth_service.revoke_sessions(email)
 
         return RedirectResponse(url="/password_reset_complete", status_code=status.HTTP_303_SEE_OTHER)
 
@@ -242,11 +288,8 @@ async def upload_avatar(file: UploadFile = File(...),
                         db: Session = Depends(get_db),
                         current_user: User = Depends(auth_service.get_current_user)):
 
-    upload_result = await upload_image_to_cloudinary(file)
-
-    if upload_result:
-        current_user.avatar = upload_result['secure_url']
-        db.commit()
-        return {"msg": "Avatar updated successfully", "avatar_url": current_user.avatar}
-    else:
-        return {"msg": "Avatar upload failed"}, 400
+    urls = await avatar_service.process(file)
+    avatar_url = urls[max(urls)]
+    if not await cached_users.update_avatar(current_user.email, avatar_url, db):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+    return {"msg": "Avatar updated successfully", "avatar_url": avatar_url, "avatar_sizes": urls}
@@ -0,0 +1,25 @@
+from fastapi import APIRouter, Request, Response, status
+
+from services.auth import auth_service
+from settings import settings
+
+router = APIRouter(tags=["jwks"])
+
+
+@router.get("/.well-known/jwks.json")
+async def jwks(request: Request):
+    """
+    Publishes the public keys that verify this app's tokens.
+
+    The document only changes when the key files change (on restart), so it is
+    served with a strong ETag and answered with 304 when the client already has it.
+    """
+    key_set = auth_service.key_set
+    headers = {
+        "ETag": key_set.etag,
+        "Cache-Control": f"public, max-age={settings.JWKS_MAX_AGE}, stale-while-revalidate={settings.JWKS_MAX_AGE}",
+    }
+    if_none_match = request.headers.get("if-none-match", "")
+    if key_set.etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=key_set.document, media_type="application/jwk-set+json", headers=headers)
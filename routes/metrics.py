@@ -0,0 +1,13 @@
+from fastapi import APIRouter, Response
+from starlette.concurrency import run_in_threadpool
+
+from services import metrics
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    # Aggregating the per-worker files in multiprocess mode reads from disk.
+    body, content_type = await run_in_threadpool(metrics.render)
+    return Response(content=body, media_type=content_type)
@@ -0,0 +1,38 @@
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from fastapi.responses import FileResponse
+
+from services.profiling import profile_store, verify_token
+from settings import settings
+
+router = APIRouter(prefix="/admin/profiles", tags=["profiling"])
+
+
+async def require_profiling_token(x_profile_token: str | None = Header(None)):
+    if not verify_token(settings.PROFILING_SECRET, x_profile_token):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Valid X-Profile-Token required")
+
+
+@router.get("", dependencies=[Depends(require_profiling_token)])
+async def list_profiles(route: str | None = None, limit: int = 50):
+    """
+    Lists recent request profiles, newest first.
+
+    Parameters:
+        route (str): Only profiles of this route template, e.g. ``/auth/login``.
+        limit (int): Maximum number of profiles.
+
+    Returns:
+        list: Profile metadata (id, route, status, duration, sample count).
+    """
+    return profile_store.list(route=route, limit=min(max(limit, 1), 500))
+
+
+@router.get("/{profile_id}", dependencies=[Depends(require_profiling_token)])
+async def download_profile(profile_id: str):
+    """
+    Downloads one profile as collapsed stacks (open it in speedscope or feed it to flamegraph.pl).
+    """
+    path = profile_store.path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found")
+    return FileResponse(path, media_type="text/plain", filename=f"{profile_id}.collapsed")
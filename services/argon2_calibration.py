@@ -0,0 +1,102 @@
+"""
+Benchmarks argon2 cost parameters on this host and proposes settings.
+
+Usage:
+    python -m services.argon2_calibration --target-p50 0.25 --target-p99 0.5 --max-memory-mb 128
+
+The proposed values are printed as ARGON2_* environment variables. Existing
+hashes are migrated gradually: after a successful login the password is
+rehashed in the background if ``needs_update`` reports outdated parameters.
+"""
+import argparse
+import itertools
+import os
+import statistics
+import time
+
+from passlib.context import CryptContext
+
+TIME_COSTS = (1, 2, 3, 4, 6, 8)
+MEMORY_COSTS_MB = (16, 32, 64, 100, 128, 256)
+PARALLELISMS = (1, 2, 4, 8)
+
+
+def percentile(samples: list, pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def benchmark(time_cost: int, memory_cost: int, parallelism: int, rounds: int) -> dict:
+    context = CryptContext(
+        schemes=["argon2"],
+        argon2__time_cost=time_cost,
+        argon2__memory_cost=memory_cost,
+        argon2__parallelism=parallelism,
+    )
+    hashed = context.hash("calibration-password")
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        context.verify("calibration-password", hashed)
+        samples.append(time.perf_counter() - start)
+    return {
+        "time_cost": time_cost,
+        "memory_cost": memory_cost,
+        "parallelism": parallelism,
+        "p50": statistics.median(samples),
+        "p99": percentile(samples, 99),
+    }
+
+
+def calibrate(target_p50: float, target_p99: float, max_memory_mb: int, rounds: int = 10,
+              max_parallelism: int | None = None) -> tuple[dict | None, list]:
+    """
+    Benchmarks every candidate within the memory ceiling and picks the strongest one
+    that meets both latency targets. Strength is measured as time_cost * memory_cost.
+
+    Returns:
+        tuple: The proposed candidate (or None) and all benchmark results.
+    """
+    max_parallelism = max_parallelism or os.cpu_count() or 1
+    results = []
+    for memory_mb, parallelism in itertools.product(MEMORY_COSTS_MB, PARALLELISMS):
+        if memory_mb > max_memory_mb or parallelism > max_parallelism:
+            continue
+        for time_cost in TIME_COSTS:
+            result = benchmark(time_cost, memory_mb * 1024, parallelism, rounds)
+            results.append(result)
+            print(f"t={time_cost} m={memory_mb}MB p={parallelism}: "
+                  f"p50={result['p50'] * 1000:.1f}ms p99={result['p99'] * 1000:.1f}ms")
+            if result["p50"] > target_p50:
+                # Higher time costs at this memory/parallelism only get slower.
+                break
+
+    passing = [r for r in results if r["p50"] <= target_p50 and r["p99"] <= target_p99]
+    if not passing:
+        return None, results
+    best = max(passing, key=lambda r: (r["time_cost"] * r["memory_cost"], -r["p50"]))
+    return best, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate argon2 parameters for this host")
+    parser.add_argument("--target-p50", type=float, default=0.25, help="target median verify latency, seconds")
+    parser.add_argument("--target-p99", type=float, default=0.5, help="target p99 verify latency, seconds")
+    parser.add_argument("--max-memory-mb", type=int, default=128, help="memory ceiling per hash, MB")
+    parser.add_argument("--rounds", type=int, default=10, help="verify calls per candidate")
+    parser.add_argument("--max-parallelism", type=int, default=None)
+    args = parser.parse_args()
+
+    best, _ = calibrate(args.target_p50, args.target_p99, args.max_memory_mb, args.rounds, args.max_parallelism)
+    if best is None:
+        print("No candidate meets the targets; relax the latency targets or the memory ceiling.")
+        return
+    print("\nProposed settings:")
+    print(f"ARGON2_TIME_COST={best['time_cost']}")
+    print(f"ARGON2_MEMORY_COST={best['memory_cost']}")
+    print(f"ARGON2_PARALLELISM={best['parallelism']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,44 +1,85 @@
 from typing import Optional
 
-from jose import JWTError, jwt
+from jose import JWTError
 from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
-from passlib.context import CryptContext
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
 
-from database.db import get_db
-from repository import users as repository_users
+from database.db import get_db, SessionLocal
+from repository import cached_users
+from services.hashing import password_hasher
+from services.jwt_keys import KeySet, create_token_codec
+from services.principal_cache import principal_cache
+from services.revocation import revocation_list
+from services.token_store import token_store, Rotation
+from settings import settings
+import logging
 import os
+import time
+import uuid
 from dotenv import load_dotenv
-import pyotp
+from functools import cached_property
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 class Auth:
-    pwd_context = CryptContext(
-        schemes=["argon2"],
-        argon2__time_cost=6,
-        argon2__memory_cost=102400,
-        argon2__parallelism=8
-    )
+    @cached_property
+    def pwd_context(self):
+        # Hashing itself runs in the hashing pool; this context only answers needs_update.
+        from passlib.context import CryptContext
+
+        return CryptContext(
+            schemes=["argon2"],
+            argon2__time_cost=settings.ARGON2_TIME_COST,
+            argon2__memory_cost=settings.ARGON2_MEMORY_COST,
+            argon2__parallelism=settings.ARGON2_PARALLELISM
+        )
 
     SECRET_KEY = os.getenv("SECRET_KEY")
     ALGORITHM = "HS256"
-    ACCESS_TOKEN_EXPIRE_MINUTES = 15
-    REFRESH_TOKEN_EXPIRE_DAYS = 7
+    ACCESS_TOKEN_EXPIRE_MINUTES = settings.ACCESS_TOKEN_EXPIRE_MINUTES
+    REFRESH_TOKEN_EXPIRE_DAYS = settings.REFRESH_TOKEN_EXPIRE_DAYS
+    key_set = KeySet.from_files(settings.JWT_PRIVATE_KEY_FILES, settings.JWT_PUBLIC_KEY_FILES)
+    codec = create_token_codec(settings.JWT_BACKEND, SECRET_KEY, ALGORITHM, key_set,
+                               cache_size=settings.JWT_CACHE_SIZE, accept_hmac=settings.JWT_ACCEPT_HS256)
     oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
-    def verify_password(self, plain_password, hashed_password):
-        return self.pwd_context.verify(plain_password, hashed_password)
+    async def verify_password(self, plain_password, hashed_password):
+        return await password_hasher.verify(plain_password, hashed_password)
+
+    async def get_password_hash(self, password: str):
+        return await password_hasher.hash(password)
+
+    def needs_rehash(self, hashed_password: str) -> bool:
+        return self.pwd_context.needs_update(hashed_password)
 
-    def get_password_hash(self, password: str):
-        return self.pwd_context.hash(password)
+    async def rehash_password(self, email: str, plain_password: str, old_hash: str):
+        """
+        Re-hashes a password with the current argon2 parameters.
+
+        Runs as a background task after a successful login, so it opens its own
+        database session instead of reusing the request one. The update only applies
+        if the stored hash is still ``old_hash``, so a concurrent password change wins.
+        """
+        try:
+            hashed_password = await self.get_password_hash(plain_password)
+            async with SessionLocal() as db:
+                if await cached_users.update_password(email, hashed_password, db, expected=old_hash):
+                    logger.info(f"Rehashed password for user: {email}")
+        except Exception as e:
+            logger.warning(f"Password rehash failed for {email}: {e}")
 
     def generate_totp_secret(self):
+        import pyotp
+
         return pyotp.random_base32()
 
     def verify_totp_token(self, secret_key: str, token: str) -> bool:
+        import pyotp
+
         totp = pyotp.TOTP(secret_key)
         return totp.verify(token)
 
@@ -46,29 +87,105 @@ class Auth:
     async def create_access_token(self, data: dict, expires_delta: Optional[float] = None):
         to_encode = data.copy()
         expire = datetime.utcnow() + (expires_delta or timedelta(minutes=self.ACCESS_TOKEN_EXPIRE_MINUTES))
-        to_encode.update({"iat": datetime.utcnow(), "exp": expire, "scope": "access_token"})
-        encoded_refresh_token = jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
-        return encoded_refresh_token
+        # Sub-second iat (as for every token type), so a token issued right after a
+        # revocation watermark is not caught by it.
+        to_encode.update({"iat": time.time(), "exp": expire, "scope": "access_token"})
+        to_encode.setdefault("jti", uuid.uuid4().hex)
+        encoded_access_token = self.codec.encode(to_encode)
+        return encoded_access_token
 
     # define a function to generate a new refresh token
     async def create_refresh_token(self, data: dict, expires_delta: Optional[float] = None):
         to_encode = data.copy()
         expire = datetime.utcnow() + (expires_delta or timedelta(days=self.REFRESH_TOKEN_EXPIRE_DAYS))
-        to_encode.update({"iat": datetime.utcnow(), "exp": expire, "scope": "refresh_token"})
-        encoded_refresh_token = jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
+        to_encode.update({"iat": time.time(), "exp": expire, "scope": "refresh_token"})
+        encoded_refresh_token = self.codec.encode(to_encode)
         return encoded_refresh_token
 
     async def decode_refresh_token(self, refresh_token: str):
+        payload = await self.decode_refresh_payload(refresh_token)
+        return payload.get("sub")
+
+    async def decode_refresh_payload(self, refresh_token: str) -> dict:
         try:
-            payload = jwt.decode(refresh_token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+            # Refresh tokens are single use, so caching their claims would never hit.
+            payload = self.codec.decode(refresh_token, use_cache=False)
             if payload.get("scope") == "refresh_token":
-                return payload.get("sub")
+                return payload
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token scope")
         except JWTError:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials")
 
+    async def issue_refresh_token(self, email: str, family_id: str | None = None) -> str:
+        """
+        Creates a refresh token for a new session (token family) and registers it in the token store.
+        """
+        family_id = family_id or uuid.uuid4().hex
+        jti = uuid.uuid4().hex
+        await token_store.create_family(email, family_id, jti)
+        return await self.create_refresh_token(data={"sub": email, "fid": family_id, "jti": jti})
 
-    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    async def rotate_refresh_token(self, refresh_token: str, db: Session) -> tuple[str, str]:
+        """
+        Exchanges a refresh token for a new access/refresh token pair.
+
+        Returns:
+            tuple: The new access token and refresh token.
+
+        Raises:
+            HTTPException: If the token is invalid, unknown or has already been used.
+        """
+        invalid_token = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+        payload = await self.decode_refresh_payload(refresh_token)
+        email = payload.get("sub")
+        family_id = payload.get("fid")
+
+        if family_id is None:
+            # Legacy token from before token families: check it against users.refresh_token
+            # once and move the session into the token store.
+            if not await cached_users.update_token(email, None, db, expected=refresh_token):
+                await cached_users.update_token(email, None, db)
+                raise invalid_token
+            family_id = uuid.uuid4().hex
+            new_refresh_token = await self.issue_refresh_token(email, family_id)
+        else:
+            new_jti = uuid.uuid4().hex
+            rotation = await token_store.rotate(email, family_id, payload.get("jti"), new_jti)
+            if rotation == Rotation.REUSED:
+                logger.warning(f"Refresh token reuse detected for {email}, family {family_id} revoked")
+            if rotation != Rotation.ROTATED:
+                raise invalid_token
+            new_refresh_token = await self.create_refresh_token(data={"sub": email, "fid": family_id, "jti": new_jti})
+
+        new_access_token = await self.create_access_token(data={"sub": email, "fid": family_id})
+        return new_access_token, new_refresh_token
+
+    async def issue_tokens(self, email: str) -> tuple[str, str]:
+        """
+        Starts a new session: an access token and a refresh token sharing one family id,
+        so that logging out with the access token can also end the refresh family.
+        """
+        family_id = uuid.uuid4().hex
+        refresh_token = await self.issue_refresh_token(email, family_id)
+        access_token = await self.create_access_token(data={"sub": email, "fid": family_id})
+        return access_token, refresh_token
+
+    async def revoke_sessions(self, email: str) -> None:
+        """
+        Ends every session of a user: access tokens issued until now stop working on
+        all workers and all refresh token families are deleted.
+        """
+        await revocation_list.revoke_user(email)
+        await token_store.revoke_user(email)
+
+
+    def decode_access_payload(self, token: str) -> dict:
+        """
+        Verifies an access token and checks it against the revocation list.
+
+        Raises:
+            HTTPException: If the token is invalid, not an access token or revoked.
+        """
         credentials_exception = HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
@@ -76,36 +193,103 @@ class Auth:
         )
 
         try:
-            # Decode JWT
-            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
-            if payload['scope'] == 'access_token':
-                email = payload["sub"]
-                if email is None:
-                    raise credentials_exception
-            else:
-                raise credentials_exception
-        except JWTError as e:
+            # Decode JWT; repeated requests with the same token skip signature verification.
+            payload = self.codec.decode(token)
+        except JWTError:
+            raise credentials_exception
+        if payload.get("scope") != "access_token" or payload.get("sub") is None:
+            raise credentials_exception
+        if revocation_list.is_revoked(payload):
             raise credentials_exception
+        return payload
 
-        user = await repository_users.get_user_by_email(email, db)
+    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+        credentials_exception = HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+        payload = self.decode_access_payload(token)
+        email = payload["sub"]
+
+        user = principal_cache.get(email)
+        if user is not None:
+            return user
+
+        user = await cached_users.get_user_by_email(email, db)
         if user is None:
             raise credentials_exception
+        principal_cache.put(user)
         return user
 
+    async def introspect(self, tokens: list[str], db: Session) -> list[dict]:
+        """
+        Checks a batch of access tokens.
+
+        Tokens are verified locally (signature cache and revocation mirror included);
+        the users they reference are resolved from the principal cache and then with
+        a single cache MGET / ``IN`` query for the rest.
+
+        Returns:
+            list[dict]: One result per token, in request order, with ``active`` and,
+            for active tokens, the claims and user fields.
+        """
+        payloads = []
+        for token in tokens:
+            try:
+                payloads.append(self.decode_access_payload(token))
+            except HTTPException:
+                payloads.append(None)
+
+        users = {}
+        missing = []
+        for payload in payloads:
+            if payload is None or payload["sub"] in users:
+                continue
+            user = principal_cache.get(payload["sub"])
+            users[payload["sub"]] = user
+            if user is None:
+                missing.append(payload["sub"])
+        if missing:
+            loaded = await cached_users.get_users_by_emails(missing, db)
+            for email, user in loaded.items():
+                users[email] = user
+                principal_cache.put(user)
+
+        results = []
+        for payload in payloads:
+            user = users.get(payload["sub"]) if payload is not None else None
+            if user is None:
+                results.append({"active": False})
+                continue
+            results.append({
+                "active": True,
+                "sub": payload["sub"],
+                "user_id": user.id,
+                "username": user.username,
+                "confirmed": user.confirmed,
+                "scope": payload["scope"],
+                "jti": payload.get("jti"),
+                "iat": int(payload["iat"]) if payload.get("iat") is not None else None,
+                "exp": payload.get("exp"),
+            })
+        return results
+
     def create_email_token(self, data: dict):
         to_encode = data.copy()
         expire = datetime.utcnow() + timedelta(days=7)
-        to_encode.update({"iat": datetime.utcnow(), "exp": expire})
-        token = jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
+        to_encode.update({"iat": time.time(), "exp": expire})
+        token = self.codec.encode(to_encode)
         return token
 
     async def get_email_from_token(self, token: str):
       try:
-          payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+          payload = self.codec.decode(token, use_cache=False)
           email = payload["sub"]
           return email
       except JWTError as e:
-          print(e)
+          logger.warning(f"Invalid email verification token: {e}")
           raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
                               detail="Invalid token for email verification")
 
@@ -0,0 +1,140 @@
+"""
+Avatar upload pipeline.
+
+The upload is streamed in chunks into a spooled temporary file while its
+sha256 is computed, so the event loop never blocks on a large body and the
+size limit is enforced before the whole file is read. The digest is the
+storage key: an image that was already processed is not decoded or uploaded
+again. New images are decoded and resized with Pillow in a thread pool into
+``AVATAR_SIZES`` square WebP renditions, which are then saved concurrently.
+"""
+import asyncio
+import hashlib
+import io
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException, UploadFile, status
+
+from services.storage import AvatarStorage, create_avatar_storage
+from settings import settings
+
+AVATAR_SIZES = (64, 128, 256)
+CHUNK_SIZE = 64 * 1024
+SPOOL_MAX_MEMORY = 1024 * 1024
+MAX_IMAGE_PIXELS = 40_000_000
+
+
+def avatar_key(digest: str, size: int) -> str:
+    return f"avatars/{digest}/{size}.webp"
+
+
+async def spool_upload(file: UploadFile, max_bytes: int):
+    """
+    Copies the upload into a spooled temporary file, hashing it on the way.
+
+    Returns:
+        tuple: The spool file rewound to the start, and the hex sha256 digest.
+
+    Raises:
+        HTTPException: 413 if the upload is larger than ``max_bytes``.
+    """
+    digest = hashlib.sha256()
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+    size = 0
+    try:
+        while chunk := await file.read(CHUNK_SIZE):
+            size += len(chunk)
+            if size > max_bytes:
+                raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                                    detail="Avatar image is too large")
+            digest.update(chunk)
+            spool.write(chunk)
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool, digest.hexdigest()
+
+
+def render_avatar(source, sizes=AVATAR_SIZES) -> dict[int, bytes]:
+    """
+    Decodes an image and renders a square, center-cropped WebP for every size.
+    Runs in a worker thread; Pillow releases the GIL while decoding and resampling.
+
+    Raises:
+        ValueError: If the file is not a decodable image or is too large to decode safely.
+    """
+    from PIL import Image, ImageOps
+
+    try:
+        with Image.open(source) as image:
+            if image.width * image.height > MAX_IMAGE_PIXELS:
+                raise ValueError("Image dimensions are too large")
+            image = ImageOps.exif_transpose(image)
+            image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+            largest = max(sizes)
+            square = ImageOps.fit(image, (largest, largest), Image.Resampling.LANCZOS)
+    except (OSError, Image.DecompressionBombError) as e:
+        raise ValueError(f"Invalid image: {e}")
+
+    renditions = {}
+    for size in sorted(sizes, reverse=True):
+        resized = square if size == largest else square.resize((size, size), Image.Resampling.LANCZOS)
+        buffer = io.BytesIO()
+        resized.save(buffer, format="WEBP", quality=85, method=4)
+        renditions[size] = buffer.getvalue()
+    return renditions
+
+
+class AvatarService:
+    def __init__(self, storage: AvatarStorage, max_bytes: int, workers: int, sizes=AVATAR_SIZES):
+        self.storage = storage
+        self.max_bytes = max_bytes
+        self.sizes = tuple(sizes)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="avatar")
+        self.processed = 0
+        self.deduplicated = 0
+
+    async def process(self, file: UploadFile) -> dict[int, str]:
+        """
+        Stores the avatar renditions for an upload.
+
+        Returns:
+            dict[int, str]: The URL of every rendition, keyed by size.
+
+        Raises:
+            HTTPException: 413 for oversized uploads, 400 for files that are not images.
+        """
+        spool, digest = await spool_upload(file, self.max_bytes)
+        with spool:
+            keys = {size: avatar_key(digest, size) for size in self.sizes}
+            if await self.storage.exists(keys[max(self.sizes)]):
+                self.deduplicated += 1
+                return {size: self.storage.url_for(key) for size, key in keys.items()}
+
+            loop = asyncio.get_running_loop()
+            try:
+                renditions = await loop.run_in_executor(self._executor, render_avatar, spool, self.sizes)
+            except ValueError as e:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+        # The largest rendition is the dedup marker, so it is written last.
+        smaller = [size for size in self.sizes if size != max(self.sizes)]
+        urls = await asyncio.gather(*(self.storage.save(keys[size], renditions[size], "image/webp")
+                                      for size in smaller))
+        result = dict(zip(smaller, urls))
+        largest = max(self.sizes)
+        result[largest] = await self.storage.save(keys[largest], renditions[largest], "image/webp")
+        self.processed += 1
+        return result
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+avatar_service = AvatarService(
+    create_avatar_storage(settings.AVATAR_STORAGE, settings.AVATAR_LOCAL_DIR, settings.AVATAR_BASE_URL),
+    max_bytes=settings.AVATAR_MAX_BYTES,
+    workers=settings.AVATAR_WORKERS,
+)
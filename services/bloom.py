@@ -0,0 +1,59 @@
+import hashlib
+import math
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over strings.
+
+    Sized from the expected number of items and the target false-positive rate.
+    The ``hash_count`` bit positions come from one blake2b digest split into two
+    64-bit halves (Kirsch-Mitzenmacher double hashing), so a lookup costs a
+    single hash. ``to_bytes``/``from_bytes`` let a filter be built once and
+    shared, e.g. through Redis.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        capacity = max(capacity, 1)
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return [(first + i * second) % self.size for i in range(self.hash_count)]
+
+    def add(self, item: str) -> None:
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def update(self, items) -> None:
+        for item in items:
+            self.add(item)
+
+    def __contains__(self, item: str) -> bool:
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    def __len__(self) -> int:
+        return self.count
+
+    def to_bytes(self) -> bytes:
+        header = f"{self.capacity}:{self.error_rate}:{self.count}:".encode()
+        return header + bytes(self.bits)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "BloomFilter":
+        capacity, error_rate, count, bits = data.split(b":", 3)
+        bloom = cls(int(capacity), float(error_rate))
+        if len(bits) != len(bloom.bits):
+            raise ValueError("Bloom filter data does not match its parameters")
+        bloom.bits = bytearray(bits)
+        bloom.count = int(count)
+        return bloom
@@ -0,0 +1,25 @@
+"""
+Cache maintenance commands.
+
+Usage:
+    python -m services.cache_admin bump        # start a fresh user cache generation
+    python -m services.cache_admin generation  # print the current generation
+"""
+import asyncio
+import sys
+
+from repository import cached_users
+
+
+async def run(command: str):
+    if command == "bump":
+        generation = await cached_users.bump_generation()
+        print(f"User cache generation bumped to {generation}")
+    elif command == "generation":
+        print(await cached_users.refresh_generation(force=True))
+    else:
+        raise SystemExit(__doc__)
+
+
+if __name__ == "__main__":
+    asyncio.run(run(sys.argv[1] if len(sys.argv) > 1 else ""))
@@ -1,53 +1,112 @@
 from pathlib import Path
 
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
-from fastapi_mail.errors import ConnectionErrors
+from fastapi import HTTPException, status
 from pydantic import EmailStr
 
+from services import outbox
 from services.auth import auth_service
-import os
-
-print(os.getenv("MAIL_USERNAME"), os.getenv("MAIL_PASSWORD"))
-
-conf = ConnectionConfig(
-    MAIL_USERNAME="2fcde6d3b52f1a",  # Логин из Mailtrap
-    MAIL_PASSWORD="a07f7463f1dffc",  # Пароль из Mailtrap
-    MAIL_FROM="noreply@example.com",
-    MAIL_PORT=2525,  # Порт для TLS
-    MAIL_SERVER="sandbox.smtp.mailtrap.io",
-    MAIL_FROM_NAME="Test App",
-    MAIL_STARTTLS=True,
-    MAIL_SSL_TLS=False,  # Отключите SSL, если используете TLS
-    USE_CREDENTIALS=True,
-    VALIDATE_CERTS=True,
-    TEMPLATE_FOLDER=Path(__file__).parent / 'templates',
+from services.mail_queue import MailDispatcher, MailMessage, MailQueueFull
+from services.redis_cache import get_redis
+from services.resources import resources
+from settings import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _mail_config():
+    # fastapi_mail (and the pydantic models it builds) is only imported once an email is sent.
+    from fastapi_mail import ConnectionConfig
+
+    return ConnectionConfig(
+        MAIL_USERNAME=settings.MAIL_USERNAME,
+        MAIL_PASSWORD=settings.MAIL_PASSWORD,
+        MAIL_FROM=settings.MAIL_FROM,
+        MAIL_PORT=settings.MAIL_PORT,
+        MAIL_SERVER=settings.MAIL_SERVER,
+        MAIL_FROM_NAME=settings.MAIL_FROM_NAME,
+        MAIL_STARTTLS=settings.MAIL_STARTTLS,
+        MAIL_SSL_TLS=settings.MAIL_SSL_TLS,
+        USE_CREDENTIALS=bool(settings.MAIL_USERNAME),
+        VALIDATE_CERTS=settings.MAIL_VALIDATE_CERTS,
+        TEMPLATE_FOLDER=Path(__file__).parent / 'templates',
+    )
+
+
+mail_config = resources.lazy("mail_config", _mail_config)
+
+mail_dispatcher = MailDispatcher(
+    mail_config.get,
+    pool_size=settings.MAIL_POOL_SIZE,
+    queue_size=settings.MAIL_QUEUE_SIZE,
+    batch_size=settings.MAIL_BATCH_SIZE,
+    max_retries=settings.MAIL_MAX_RETRIES,
 )
 
-async def send_email(email: EmailStr, username: str, host: str):
-    try:
-        token_verification = auth_service.create_email_token({"sub": email})
-        message = MessageSchema(
-            subject="Confirm your email ",
-            recipients=[email],
-            template_body={"host": host, "username": username, "token": token_verification},
-            subtype=MessageType.html
+RETRY_AFTER_SECONDS = 5
+
+
+class MailUnavailable(HTTPException):
+    def __init__(self, retry_after: int = RETRY_AFTER_SECONDS):
+        super().__init__(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Email delivery is busy, request the email again later",
+            headers={"Retry-After": str(retry_after)},
         )
 
-        fm = FastMail(conf)
-        await fm.send_message(message, template_name="email_template.html")
-    except ConnectionErrors as err:
-        print(err)
 
-async def send_reset_email(email: EmailStr, token: str, host: str):
+def require_mail_capacity() -> None:
+    """
+    Fails fast while the in-process mail queue is full.
+
+    Call it before looking the account up where the response must not reveal
+    whether the account exists.
+
+    Raises:
+        MailUnavailable: If no email could be queued right now.
+    """
+    if settings.MAIL_OUTBOX != "redis" and mail_dispatcher.full:
+        raise MailUnavailable()
+
+
+async def _dispatch(message: MailMessage):
+    if settings.MAIL_OUTBOX == "redis":
+        try:
+            await outbox.publish(await get_redis(), message, maxlen=settings.MAIL_OUTBOX_MAXLEN)
+            return
+        except Exception as err:
+            logger.warning(f"Mail outbox unavailable, sending in-process: {err}")
     try:
-        message = MessageSchema(
-            subject="Password Reset Request",
-            recipients=[email],
-            template_body={"host": host, "token": token, "username": email.split("@")[0]},
-            subtype=MessageType.html
-        )
+        mail_dispatcher.enqueue_nowait(message)
+    except MailQueueFull as err:
+        logger.warning(f"Could not queue email to {message.recipient}: {err}")
+        raise MailUnavailable()
+
+async def send_email(email: EmailStr, username: str, host: str):
+    """
+    Queues the email confirmation message.
+
+    Raises:
+        MailUnavailable: If the mail queue is full.
+    """
+    token_verification = auth_service.create_email_token({"sub": email})
+    await _dispatch(MailMessage(
+        recipient=email,
+        subject="Confirm your email ",
+        template_name="email_template.html",
+        template_body={"host": host, "username": username, "token": token_verification},
+    ))
+
+async def send_reset_email(email: EmailStr, token: str, host: str):
+    """
+    Queues the password reset message.
 
-        fm = FastMail(conf)
-        await fm.send_message(message, template_name="password_reset_email.html")
-    except ConnectionErrors as err:
-        print(err)
+    Raises:
+        MailUnavailable: If the mail queue is full.
+    """
+    await _dispatch(MailMessage(
+        recipient=email,
+        subject="Password Reset Request",
+        template_name="password_reset_email.html",
+        template_body={"host": host, "token": token, "username": email.split("@")[0]},
+    ))
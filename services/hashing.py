@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+
+from fastapi import HTTPException, status
+
+from services.metrics import PASSWORD_HASH_DURATION, PASSWORD_HASH_QUEUE_WAIT, PASSWORD_HASH_REJECTED
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+_worker_contexts = {}
+
+
+def _get_context(params: tuple):
+    # Runs inside the pool worker: build the CryptContext once per parameter set.
+    context = _worker_contexts.get(params)
+    if context is None:
+        from passlib.context import CryptContext
+
+        time_cost, memory_cost, parallelism = params
+        context = CryptContext(
+            schemes=["argon2"],
+            argon2__time_cost=time_cost,
+            argon2__memory_cost=memory_cost,
+            argon2__parallelism=parallelism,
+        )
+        _worker_contexts[params] = context
+    return context
+
+
+def _hash(params: tuple, password: str) -> str:
+    return _get_context(params).hash(password)
+
+
+def _verify(params: tuple, password: str, hashed_password: str) -> bool:
+    return _get_context(params).verify(password, hashed_password)
+
+
+class HashingOverloaded(HTTPException):
+    def __init__(self, retry_after: int):
+        super().__init__(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Password hashing is overloaded, try again later",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+
+class PasswordHasher:
+    """
+    Runs argon2 hashing and verification in a process pool.
+
+    The number of concurrent hashes is capped by the memory budget (each argon2
+    call allocates ``memory_cost`` KiB) and by the pool size. Callers that cannot
+    get a slot wait in a bounded queue; when the queue is full or the wait times
+    out, ``HashingOverloaded`` (503 with Retry-After) is raised.
+    """
+
+    def __init__(self, time_cost: int, memory_cost: int, parallelism: int,
+                 pool_size: int, memory_budget_mb: int, queue_size: int,
+                 queue_timeout: float, executor: Executor | None = None):
+        self.params = (time_cost, memory_cost, parallelism)
+        self.pool_size = pool_size
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        per_hash_mb = max(memory_cost // 1024, 1)
+        self.max_concurrency = max(min(pool_size, memory_budget_mb // per_hash_mb), 1)
+        self._executor = executor
+        self._semaphore = None
+        self._waiting = 0
+        self._in_flight = 0
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.pool_size)
+        return self._executor
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def waiting(self) -> int:
+        return self._waiting
+
+    def _retry_after(self) -> int:
+        return max(int(self.queue_timeout), 1)
+
+    async def _run(self, operation: str, fn, *args):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        queued_at = time.perf_counter()
+        if self._semaphore.locked():
+            if self._waiting >= self.queue_size:
+                logger.warning("Hashing queue is full (%s waiting)", self._waiting)
+                PASSWORD_HASH_REJECTED.labels(operation).inc()
+                raise HashingOverloaded(self._retry_after())
+            self._waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Timed out waiting for a hashing slot")
+                PASSWORD_HASH_REJECTED.labels(operation).inc()
+                raise HashingOverloaded(self._retry_after())
+            finally:
+                self._waiting -= 1
+        else:
+            await self._semaphore.acquire()
+
+        started_at = time.perf_counter()
+        PASSWORD_HASH_QUEUE_WAIT.labels(operation).observe(started_at - queued_at)
+        self._in_flight += 1
+        loop = asyncio.get_running_loop()
+        try:
+            job = self.executor.submit(fn, self.params, *args)
+        except BaseException:
+            self._release(operation, started_at)
+            raise
+        # Cancelling the caller does not stop a running argon2 job, so the slot
+        # is held until the job itself finishes, not until the caller gives up.
+        job.add_done_callback(
+            lambda _: loop.call_soon_threadsafe(self._release, operation, started_at))
+        return await asyncio.wrap_future(job, loop=loop)
+
+    def _release(self, operation: str, started_at: float) -> None:
+        PASSWORD_HASH_DURATION.labels(operation).observe(time.perf_counter() - started_at)
+        self._in_flight -= 1
+        self._semaphore.release()
+
+    def stats(self) -> dict:
+        return {"in_flight": self._in_flight, "waiting": self._waiting, "max_concurrency": self.max_concurrency}
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", _hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._run("verify", _verify, password, hashed_password)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher(
+    time_cost=settings.ARGON2_TIME_COST,
+    memory_cost=settings.ARGON2_MEMORY_COST,
+    parallelism=settings.ARGON2_PARALLELISM,
+    pool_size=settings.HASH_POOL_SIZE,
+    memory_budget_mb=settings.HASH_MEMORY_BUDGET_MB,
+    queue_size=settings.HASH_QUEUE_SIZE,
+    queue_timeout=settings.HASH_QUEUE_TIMEOUT,
+)
@@ -0,0 +1,272 @@
+"""
+JWT encoding and verification behind a small backend interface.
+
+``JoseBackend`` (python-jose) is the default, ``PyJWTBackend`` is used when
+PyJWT is installed and selected, and ``HmacBackend`` is a minimal HS256/384/512
+implementation on the standard library for the hot path. Every backend raises
+``InvalidToken``, a ``jose.JWTError`` subclass, so existing ``except JWTError``
+handlers keep working whichever backend is configured.
+
+``TokenCodec`` adds ``VerifiedTokenCache``: an LRU of claims that already passed
+signature and expiry checks, keyed by the token's digest. A cached entry is only
+returned until the token's own ``exp``, so caching never extends a token's life.
+"""
+import base64
+import calendar
+import hashlib
+import hmac
+import json
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime
+from functools import cached_property
+
+from jose import JWTError
+
+HMAC_ALGORITHMS = {"HS256": hashlib.sha256, "HS384": hashlib.sha384, "HS512": hashlib.sha512}
+
+
+class InvalidToken(JWTError):
+    pass
+
+
+def _timestamp(value):
+    if isinstance(value, datetime):
+        return calendar.timegm(value.utctimetuple())
+    return value
+
+
+def _normalize(claims: dict) -> dict:
+    return {name: _timestamp(value) for name, value in claims.items()}
+
+
+def _b64encode(data: bytes) -> bytes:
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+
+def _b64decode(data: bytes) -> bytes:
+    return base64.urlsafe_b64decode(data + b"=" * (-len(data) % 4))
+
+
+class JWTBackend(ABC):
+    name = None
+
+    @abstractmethod
+    def encode(self, claims: dict, key, algorithm: str, headers: dict | None = None) -> str:
+        ...
+
+    @abstractmethod
+    def decode(self, token: str, key, algorithms: list[str]) -> dict:
+        ...
+
+
+class JoseBackend(JWTBackend):
+    name = "jose"
+
+    @cached_property
+    def _jwt(self):
+        # jose.jwt loads its cryptography backend; defer that to the first token.
+        from jose import jwt
+
+        return jwt
+
+    def encode(self, claims: dict, key, algorithm: str, headers: dict | None = None) -> str:
+        return self._jwt.encode(claims, key, algorithm=algorithm, headers=headers)
+
+    def decode(self, token: str, key, algorithms: list[str]) -> dict:
+        try:
+            return self._jwt.decode(token, key, algorithms=algorithms)
+        except JWTError as e:
+            raise InvalidToken(str(e))
+
+
+class PyJWTBackend(JWTBackend):
+    name = "pyjwt"
+
+    def __init__(self):
+        try:
+            import jwt
+        except ImportError:
+            raise RuntimeError("The pyjwt JWT backend requires the PyJWT package")
+        self._jwt = jwt
+
+    def encode(self, claims: dict, key, algorithm: str, headers: dict | None = None) -> str:
+        return self._jwt.encode(claims, key, algorithm=algorithm, headers=headers)
+
+    def decode(self, token: str, key, algorithms: list[str]) -> dict:
+        try:
+            return self._jwt.decode(token, key, algorithms=algorithms, options={"verify_aud": False})
+        except self._jwt.PyJWTError as e:
+            raise InvalidToken(str(e))
+
+
+class HmacBackend(JWTBackend):
+    """
+    Compact-serialization JWS with HMAC only. Checks the signature, ``exp`` and
+    ``nbf``; that is all the tokens issued by this app rely on.
+    """
+    name = "hmac"
+
+    def __init__(self):
+        self._headers = {}
+
+    def _header(self, algorithm: str, headers: dict | None) -> bytes:
+        if headers:
+            return _b64encode(json.dumps({"alg": algorithm, "typ": "JWT", **headers},
+                                         separators=(",", ":")).encode())
+        segment = self._headers.get(algorithm)
+        if segment is None:
+            segment = _b64encode(json.dumps({"alg": algorithm, "typ": "JWT"}, separators=(",", ":")).encode())
+            self._headers[algorithm] = segment
+        return segment
+
+    @staticmethod
+    def _key(key) -> bytes:
+        return key.encode() if isinstance(key, str) else key
+
+    def encode(self, claims: dict, key, algorithm: str, headers: dict | None = None) -> str:
+        digestmod = HMAC_ALGORITHMS.get(algorithm)
+        if digestmod is None:
+            raise InvalidToken(f"Algorithm {algorithm} is not supported by the hmac backend")
+        payload = _b64encode(json.dumps(_normalize(claims), separators=(",", ":")).encode())
+        signing_input = self._header(algorithm, headers) + b"." + payload
+        signature = _b64encode(hmac.new(self._key(key), signing_input, digestmod).digest())
+        return (signing_input + b"." + signature).decode()
+
+    def decode(self, token: str, key, algorithms: list[str]) -> dict:
+        try:
+            raw = token.encode()
+            signing_input, _, signature = raw.rpartition(b".")
+            header_segment, _, payload_segment = signing_input.partition(b".")
+            header = json.loads(_b64decode(header_segment))
+            algorithm = header.get("alg")
+            if algorithm not in algorithms or algorithm not in HMAC_ALGORITHMS:
+                raise InvalidToken("The specified alg value is not allowed")
+            expected = hmac.new(self._key(key), signing_input, HMAC_ALGORITHMS[algorithm]).digest()
+            if not hmac.compare_digest(_b64encode(expected), signature):
+                raise InvalidToken("Signature verification failed")
+            claims = json.loads(_b64decode(payload_segment))
+        except InvalidToken:
+            raise
+        except (ValueError, TypeError, AttributeError, UnicodeError) as e:
+            raise InvalidToken(f"Malformed token: {e}")
+        if not isinstance(claims, dict):
+            raise InvalidToken("Invalid payload")
+        now = time.time()
+        if "exp" in claims and not (isinstance(claims["exp"], (int, float)) and claims["exp"] > now):
+            raise InvalidToken("Signature has expired")
+        if "nbf" in claims and not (isinstance(claims["nbf"], (int, float)) and claims["nbf"] <= now):
+            raise InvalidToken("The token is not yet valid (nbf)")
+        return claims
+
+
+BACKENDS = {"jose": JoseBackend, "pyjwt": PyJWTBackend, "hmac": HmacBackend}
+
+
+def create_backend(name: str) -> JWTBackend:
+    backend = BACKENDS.get(name)
+    if backend is None:
+        raise ValueError(f"Unknown JWT backend: {name}")
+    return backend()
+
+
+class VerifiedTokenCache:
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+    def get(self, token: str) -> dict | None:
+        key = self._key(token)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, claims = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return dict(claims)
+
+    def put(self, token: str, claims: dict) -> None:
+        expires_at = claims.get("exp")
+        if not self.maxsize or not isinstance(expires_at, (int, float)):
+            return
+        key = self._key(token)
+        self._entries[key] = (expires_at, dict(claims))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+def unverified_header(token: str) -> dict:
+    """
+    Reads the JOSE header without checking the signature, to pick the verification key.
+    """
+    try:
+        header = json.loads(_b64decode(token.encode().partition(b".")[0]))
+    except (ValueError, TypeError, AttributeError, UnicodeError) as e:
+        raise InvalidToken(f"Malformed token header: {e}")
+    if not isinstance(header, dict):
+        raise InvalidToken("Malformed token header")
+    return header
+
+
+class TokenCodec:
+    """
+    Signs with one key and verifies with any key in ``verification_keys``, a
+    mapping of ``kid`` to ``(key, algorithm)``. Tokens without a ``kid`` header
+    map to the ``None`` entry. By default the signing key is the only one.
+    """
+
+    def __init__(self, backend: JWTBackend, key, algorithm: str, cache_size: int = 10000,
+                 kid: str | None = None, verification_keys: dict | None = None):
+        self.backend = backend
+        self.key = key
+        self.algorithm = algorithm
+        self.kid = kid
+        self.verification_keys = verification_keys or {kid: (key, algorithm)}
+        self._single_key = verification_keys is None and kid is None
+        self._headers = {"kid": kid} if kid else None
+        self.cache = VerifiedTokenCache(cache_size)
+
+    def encode(self, claims: dict) -> str:
+        return self.backend.encode(claims, self.key, self.algorithm, headers=self._headers)
+
+    def decode(self, token: str, use_cache: bool = True) -> dict:
+        """
+        Verifies a token and returns its claims.
+
+        Raises:
+            InvalidToken: If the key id is unknown or the signature, algorithm or expiry check fails.
+        """
+        if use_cache:
+            claims = self.cache.get(token)
+            if claims is not None:
+                return claims
+        if self._single_key:
+            key, algorithm = self.key, self.algorithm
+        else:
+            entry = self.verification_keys.get(unverified_header(token).get("kid"))
+            if entry is None:
+                raise InvalidToken("Unknown signing key")
+            key, algorithm = entry
+        claims = self.backend.decode(token, key, [algorithm])
+        if use_cache:
+            self.cache.put(token, claims)
+        return claims
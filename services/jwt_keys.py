@@ -0,0 +1,165 @@
+"""
+Asymmetric signing keys for JWTs and the JWKS document that publishes them.
+
+Keys are PEM files listed in ``JWT_PRIVATE_KEY_FILES``: the first one signs new
+tokens, the others still verify tokens they signed earlier. A key whose private
+part has been destroyed can stay verifiable through ``JWT_PUBLIC_KEY_FILES``.
+Each key is identified by its RFC 7638 JWK thumbprint, sent as the ``kid``
+header, so rotating is: put a new file first, keep the old one until the
+longest-lived token it signed (the refresh token) has expired, then drop it.
+
+Ed25519 keys sign with EdDSA and P-256 keys with ES256. With no key files the
+app keeps signing HS256 with ``SECRET_KEY`` and the JWKS document is empty.
+
+Generate a key with:
+    python -m services.jwt_keys generate --algorithm EdDSA keys/jwt-2024-10.pem
+"""
+import argparse
+import base64
+import hashlib
+import json
+from dataclasses import dataclass
+from pathlib import Path
+
+from services.jwt_codec import TokenCodec, create_backend
+
+ASYMMETRIC_ALGORITHMS = ("EdDSA", "ES256")
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def algorithm_for(key) -> str:
+    from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+
+    if isinstance(key, (ed25519.Ed25519PrivateKey, ed25519.Ed25519PublicKey)):
+        return "EdDSA"
+    if isinstance(key, (ec.EllipticCurvePrivateKey, ec.EllipticCurvePublicKey)) and key.curve.name == "secp256r1":
+        return "ES256"
+    raise ValueError(f"Unsupported JWT signing key type: {type(key).__name__}")
+
+
+def public_jwk(public_key) -> dict:
+    """
+    Builds the JWK of a public key with its thumbprint as ``kid``.
+    """
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import ed25519
+
+    if isinstance(public_key, ed25519.Ed25519PublicKey):
+        raw = public_key.public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+        members = {"crv": "Ed25519", "kty": "OKP", "x": _b64(raw)}
+    else:
+        numbers = public_key.public_numbers()
+        members = {"crv": "P-256", "kty": "EC", "x": _b64(numbers.x.to_bytes(32, "big")),
+                   "y": _b64(numbers.y.to_bytes(32, "big"))}
+    # RFC 7638: SHA-256 over the required members, sorted, without whitespace.
+    thumbprint = _b64(hashlib.sha256(json.dumps(members, sort_keys=True, separators=(",", ":")).encode()).digest())
+    return {**members, "kid": thumbprint, "use": "sig", "alg": algorithm_for(public_key)}
+
+
+@dataclass
+class VerificationKey:
+    kid: str
+    algorithm: str
+    public_key: object
+    jwk: dict
+
+
+class KeySet:
+    def __init__(self, signing_key=None, public_keys: list | None = None):
+        self.signing_key = signing_key
+        self.keys = {}
+        if signing_key is not None:
+            self._add(signing_key.public_key())
+        for public_key in public_keys or []:
+            self._add(public_key)
+        self.signing_kid = self._kid(signing_key.public_key()) if signing_key is not None else None
+        self.document = json.dumps({"keys": [key.jwk for key in self.keys.values()]},
+                                   separators=(",", ":")).encode()
+        self.etag = '"' + hashlib.sha256(self.document).hexdigest()[:32] + '"'
+
+    @staticmethod
+    def _kid(public_key) -> str:
+        return public_jwk(public_key)["kid"]
+
+    def _add(self, public_key) -> None:
+        jwk = public_jwk(public_key)
+        self.keys[jwk["kid"]] = VerificationKey(jwk["kid"], jwk["alg"], public_key, jwk)
+
+    @property
+    def signing_algorithm(self) -> str | None:
+        return algorithm_for(self.signing_key) if self.signing_key is not None else None
+
+    @classmethod
+    def from_files(cls, private_key_files: list[str], public_key_files: list[str] | None = None) -> "KeySet":
+        if not private_key_files and not public_key_files:
+            return cls()
+        # Only loaded when keys are configured: HS256-only apps never need cryptography.
+        from cryptography.hazmat.primitives import serialization
+
+        private_keys = [serialization.load_pem_private_key(Path(path).read_bytes(), password=None)
+                        for path in private_key_files]
+        public_keys = [key.public_key() for key in private_keys[1:]]
+        public_keys += [serialization.load_pem_public_key(Path(path).read_bytes())
+                        for path in public_key_files or []]
+        for key in private_keys + public_keys:
+            algorithm_for(key)
+        return cls(private_keys[0] if private_keys else None, public_keys)
+
+
+def create_token_codec(backend_name: str, secret_key: str, algorithm: str, key_set: KeySet,
+                       cache_size: int, accept_hmac: bool) -> TokenCodec:
+    """
+    Builds the app's codec: HMAC with ``secret_key`` when ``key_set`` is empty,
+    otherwise the key set's signing key, with every published key accepted for
+    verification. ``accept_hmac`` keeps tokens issued before the switch (no
+    ``kid``) valid until they expire.
+
+    Raises:
+        ValueError: If asymmetric keys are configured with a backend that cannot use them.
+    """
+    backend = create_backend(backend_name)
+    if key_set.signing_key is None:
+        return TokenCodec(backend, secret_key, algorithm, cache_size=cache_size)
+    if backend.name != "pyjwt":
+        raise ValueError(f"{'/'.join(ASYMMETRIC_ALGORITHMS)} signing requires JWT_BACKEND=pyjwt")
+    verification_keys = {kid: (key.public_key, key.algorithm) for kid, key in key_set.keys.items()}
+    if accept_hmac and secret_key:
+        verification_keys[None] = (secret_key, algorithm)
+    return TokenCodec(backend, key_set.signing_key, key_set.signing_algorithm, cache_size=cache_size,
+                      kid=key_set.signing_kid, verification_keys=verification_keys)
+
+
+def generate(algorithm: str):
+    from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+
+    if algorithm == "EdDSA":
+        return ed25519.Ed25519PrivateKey.generate()
+    if algorithm == "ES256":
+        return ec.generate_private_key(ec.SECP256R1())
+    raise ValueError(f"Unsupported algorithm: {algorithm}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage JWT signing keys")
+    commands = parser.add_subparsers(dest="command", required=True)
+    generate_parser = commands.add_parser("generate", help="Write a new private key in PEM format")
+    generate_parser.add_argument("path")
+    generate_parser.add_argument("--algorithm", choices=ASYMMETRIC_ALGORITHMS, default="EdDSA")
+    args = parser.parse_args(argv)
+
+    from cryptography.hazmat.primitives import serialization
+
+    key = generate(args.algorithm)
+    path = Path(args.path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                       serialization.NoEncryption()))
+    path.chmod(0o600)
+    print(f"{path}: kid {public_jwk(key.public_key())['kid']}")
+
+
+if __name__ == "__main__":
+    main()
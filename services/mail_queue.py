@@ -0,0 +1,235 @@
+import asyncio
+import logging
+import random
+import time
+from dataclasses import dataclass, field
+from email.message import EmailMessage
+from email.utils import formataddr
+from typing import TYPE_CHECKING, Callable
+
+import aiosmtplib
+
+from services.metrics import MAIL_MESSAGES, MAIL_SEND_DURATION
+
+if TYPE_CHECKING:
+    from fastapi_mail import ConnectionConfig
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class MailMessage:
+    recipient: str
+    subject: str
+    template_name: str
+    template_body: dict = field(default_factory=dict)
+    attempts: int = 0
+    result: asyncio.Future | None = None
+
+    def finish(self, sent: bool) -> None:
+        if self.result is not None and not self.result.done():
+            self.result.set_result(sent)
+
+
+class MailQueueFull(Exception):
+    pass
+
+
+class MailDispatcher:
+    """
+    Sends queued emails over a small pool of persistent SMTP connections.
+
+    Each worker owns one authenticated connection and drains up to ``batch_size``
+    messages per wake-up over it, reconnecting only when the server drops the
+    connection. ``enqueue`` applies backpressure: it waits up to
+    ``enqueue_timeout`` for room in the bounded queue and then raises
+    ``MailQueueFull``. Failed sends are retried with exponential backoff and jitter.
+
+    ``config`` may be a callable returning the ``ConnectionConfig``; it is then
+    only called when the first message is rendered.
+    """
+
+    def __init__(self, config: "ConnectionConfig | Callable[[], ConnectionConfig]", pool_size: int = 2,
+                 queue_size: int = 1000, batch_size: int = 20, max_retries: int = 3, retry_base_delay: float = 0.5,
+                 enqueue_timeout: float = 1.0):
+        self._config = config
+        self.pool_size = pool_size
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.enqueue_timeout = enqueue_timeout
+        self._queue = None
+        self._workers = []
+        self._templates = None
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.connections_opened = 0
+        self.send_seconds_total = 0.0
+
+    @property
+    def config(self) -> "ConnectionConfig":
+        if callable(self._config):
+            self._config = self._config()
+        return self._config
+
+    @config.setter
+    def config(self, config) -> None:
+        self._config = config
+        self._templates = None
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    @property
+    def full(self) -> bool:
+        return self._queue is not None and self._queue.full()
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.queue_depth,
+            "sent": self.sent,
+            "failed": self.failed,
+            "retries": self.retries,
+            "connections_opened": self.connections_opened,
+            "send_seconds_total": self.send_seconds_total,
+        }
+
+    def start(self) -> None:
+        if self._workers:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.pool_size)]
+
+    async def stop(self, drain_timeout: float = 10) -> None:
+        if not self._workers:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Mail queue not drained on shutdown, {self.queue_depth} messages dropped")
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def enqueue(self, message: MailMessage) -> None:
+        self.start()
+        try:
+            await asyncio.wait_for(self._queue.put(message), timeout=self.enqueue_timeout)
+        except asyncio.TimeoutError:
+            raise MailQueueFull(f"Mail queue is full ({self.queue_depth} messages)")
+
+    def enqueue_nowait(self, message: MailMessage) -> None:
+        """
+        Queues ``message`` without waiting; for request handlers that must not stall.
+
+        Raises:
+            MailQueueFull: If the queue has no room.
+        """
+        self.start()
+        try:
+            self._queue.put_nowait(message)
+        except asyncio.QueueFull:
+            raise MailQueueFull(f"Mail queue is full ({self.queue_depth} messages)")
+
+    def render(self, message: MailMessage) -> EmailMessage:
+        if self._templates is None:
+            self._templates = self.config.template_engine()
+        html = self._templates.get_template(message.template_name).render(**message.template_body)
+        email = EmailMessage()
+        email["From"] = formataddr((self.config.MAIL_FROM_NAME or "", self.config.MAIL_FROM))
+        email["To"] = message.recipient
+        email["Subject"] = message.subject
+        email.set_content(html, subtype="html")
+        return email
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        smtp = aiosmtplib.SMTP(
+            hostname=self.config.MAIL_SERVER,
+            port=self.config.MAIL_PORT,
+            use_tls=self.config.MAIL_SSL_TLS,
+            start_tls=self.config.MAIL_STARTTLS,
+            validate_certs=self.config.VALIDATE_CERTS,
+            timeout=self.config.TIMEOUT,
+        )
+        await smtp.connect()
+        if self.config.USE_CREDENTIALS:
+            await smtp.login(self.config.MAIL_USERNAME, self.config.MAIL_PASSWORD.get_secret_value())
+        self.connections_opened += 1
+        return smtp
+
+    async def _worker(self) -> None:
+        smtp = None
+        try:
+            while True:
+                batch = [await self._queue.get()]
+                while len(batch) < self.batch_size and not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                for message in batch:
+                    try:
+                        smtp = await self._deliver(smtp, message)
+                    except Exception as e:
+                        # A bug or an unexpected library error must not kill the worker.
+                        self.failed += 1
+                        MAIL_MESSAGES.labels("failed").inc()
+                        logger.exception(f"Unexpected error sending email to {message.recipient}: {e}")
+                        message.finish(False)
+                        if smtp is not None:
+                            smtp.close()
+                            smtp = None
+                    finally:
+                        self._queue.task_done()
+        finally:
+            if smtp is not None and smtp.is_connected:
+                try:
+                    await smtp.quit()
+                except Exception:
+                    smtp.close()
+
+    async def _deliver(self, smtp, message: MailMessage):
+        try:
+            email = self.render(message)
+        except Exception as e:
+            self.failed += 1
+            MAIL_MESSAGES.labels("failed").inc()
+            logger.error(f"Could not render email to {message.recipient}: {e}")
+            message.finish(False)
+            return smtp
+
+        while True:
+            message.attempts += 1
+            try:
+                if smtp is None or not smtp.is_connected:
+                    smtp = await self._connect()
+                start = time.perf_counter()
+                await smtp.send_message(email)
+                elapsed = time.perf_counter() - start
+                self.send_seconds_total += elapsed
+                MAIL_SEND_DURATION.observe(elapsed)
+                MAIL_MESSAGES.labels("sent").inc()
+                self.sent += 1
+                message.finish(True)
+                return smtp
+            except aiosmtplib.SMTPRecipientsRefused as e:
+                self.failed += 1
+                MAIL_MESSAGES.labels("failed").inc()
+                logger.error(f"Recipient refused for {message.recipient}: {e}")
+                message.finish(False)
+                return smtp
+            except (aiosmtplib.SMTPException, OSError, asyncio.TimeoutError) as e:
+                if smtp is not None:
+                    smtp.close()
+                    smtp = None
+                if message.attempts > self.max_retries:
+                    self.failed += 1
+                    MAIL_MESSAGES.labels("failed").inc()
+                    logger.error(f"Giving up on email to {message.recipient}: {e}")
+                    message.finish(False)
+                    return smtp
+                self.retries += 1
+                MAIL_MESSAGES.labels("retried").inc()
+                delay = self.retry_base_delay * 2 ** (message.attempts - 1)
+                await asyncio.sleep(delay + random.uniform(0, delay))
@@ -0,0 +1,194 @@
+"""
+Prometheus metrics.
+
+Metric objects are module globals so that instrumented code only does a
+label-child lookup and an ``observe``/``inc`` per event. When
+``PROMETHEUS_MULTIPROC_DIR`` is set (it must be set, and emptied, before the
+workers start) every uvicorn worker writes its samples to memory-mapped files
+in that directory and ``/metrics`` aggregates them, so any worker can answer
+a scrape. Workers call ``mark_process_dead`` on shutdown so their live gauges
+disappear.
+
+Components that already keep their own counters (DB pools, caches, mail queue)
+register a stats callable with ``register_stats``; ``refresh_stats`` copies them
+into the ``app_component_stat`` gauge every few seconds and on each scrape.
+"""
+import asyncio
+import logging
+import os
+import time
+
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest)
+
+logger = logging.getLogger(__name__)
+
+MULTIPROCESS = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+LATENCY_BUCKETS = (0.002, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+FAST_BUCKETS = (0.0002, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS)
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress", "Requests being handled, by route template",
+    ["method", "route"], multiprocess_mode="livesum")
+
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds", "SQL statement execution time",
+    ["engine", "operation"], buckets=FAST_BUCKETS)
+
+REDIS_COMMAND_DURATION = Histogram(
+    "redis_command_duration_seconds", "Redis round-trip time by command (PIPELINE for pipelines)",
+    ["command"], buckets=FAST_BUCKETS)
+REDIS_ERRORS = Counter("redis_command_errors_total", "Failed Redis round trips", ["command"])
+
+PASSWORD_HASH_DURATION = Histogram(
+    "password_hash_duration_seconds", "argon2 time in the hashing pool", ["operation"], buckets=LATENCY_BUCKETS)
+PASSWORD_HASH_QUEUE_WAIT = Histogram(
+    "password_hash_queue_wait_seconds", "Time waiting for a hashing slot", ["operation"], buckets=LATENCY_BUCKETS)
+PASSWORD_HASH_REJECTED = Counter("password_hash_rejected_total", "Hash requests refused with 503", ["operation"])
+
+MAIL_SEND_DURATION = Histogram(
+    "mail_send_duration_seconds", "SMTP send time per message", buckets=LATENCY_BUCKETS)
+MAIL_MESSAGES = Counter("mail_messages_total", "Emails by outcome", ["outcome"])
+
+COMPONENT_STAT = Gauge(
+    "app_component_stat", "Counters kept by app components (pools, caches, queues)",
+    ["component", "stat"], multiprocess_mode="livesum")
+
+_stats_sources = {}
+
+
+def register_stats(component: str, source) -> None:
+    """
+    Registers a callable returning a dict of numeric stats for ``component``.
+    """
+    _stats_sources[component] = source
+
+
+def refresh_stats() -> None:
+    for component, source in _stats_sources.items():
+        try:
+            stats = source()
+        except Exception as e:
+            logger.debug(f"Stats for {component} unavailable: {e}")
+            continue
+        for stat, value in stats.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                COMPONENT_STAT.labels(component, stat).set(value)
+
+
+async def refresh_loop(interval: float) -> None:
+    while True:
+        refresh_stats()
+        await asyncio.sleep(interval)
+
+
+def render() -> tuple[bytes, str]:
+    refresh_stats()
+    if MULTIPROCESS:
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead() -> None:
+    if MULTIPROCESS:
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(os.getpid())
+
+
+def _operation(statement: str) -> str:
+    verb = statement.lstrip()[:6].upper()
+    if verb in ("SELECT", "INSERT", "UPDATE", "DELETE"):
+        return verb.lower()
+    return "other"
+
+
+def instrument_engine(engine, name: str) -> None:
+    """
+    Times every statement of an (async) engine with cursor execute events.
+    """
+    from sqlalchemy import event
+
+    children = {}
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        operation = _operation(statement)
+        child = children.get(operation)
+        if child is None:
+            child = children[operation] = DB_QUERY_DURATION.labels(name, operation)
+        child.observe(elapsed)
+
+    def handle_error(exception_context):
+        starts = exception_context.connection.info.get("query_start") if exception_context.connection else None
+        if starts:
+            starts.pop()
+
+    event.listen(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", after_cursor_execute)
+    event.listen(engine.sync_engine, "handle_error", handle_error)
+
+
+class _InstrumentedRoute:
+    """
+    Wraps a matched route's ASGI app: label children are bound once per route,
+    so a request costs two gauge updates and one histogram observation.
+    """
+
+    def __init__(self, app, path: str, methods):
+        self.app = app
+        self.path = path
+        self._in_progress = {method: HTTP_REQUESTS_IN_PROGRESS.labels(method, path) for method in methods}
+        self._durations = {}
+
+    def _duration(self, method: str, status: int):
+        key = (method, status)
+        child = self._durations.get(key)
+        if child is None:
+            child = self._durations[key] = HTTP_REQUEST_DURATION.labels(method, self.path, str(status))
+        return child
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        method = scope["method"]
+        in_progress = self._in_progress.get(method) or HTTP_REQUESTS_IN_PROGRESS.labels(method, self.path)
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_progress.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self._duration(method, status_code).observe(time.perf_counter() - start)
+            in_progress.dec()
+
+
+def instrument_routes(app) -> None:
+    """
+    Instruments every route registered on ``app`` so far. Call it once all routers are included.
+    """
+    for route in app.router.routes:
+        if isinstance(getattr(route, "app", None), _InstrumentedRoute) or not hasattr(route, "path"):
+            continue
+        methods = getattr(route, "methods", None) or ("GET",)
+        if hasattr(route, "app"):
+            route.app = _InstrumentedRoute(route.app, route.path, methods)
@@ -0,0 +1,163 @@
+"""
+Durable mail outbox on a Redis stream.
+
+The API appends each email to ``mail:outbox`` with ``publish``; the separate
+``mail_worker.py`` process reads it through a consumer group, sends over the
+pooled ``MailDispatcher`` and acknowledges entries only after delivery
+(at-least-once). Every entry carries a dedup key that is recorded after a
+successful send, so a redelivered entry is acknowledged without sending twice.
+Entries left pending by a crashed worker are reclaimed with XAUTOCLAIM, and
+permanently failed ones go to a dead-letter stream.
+"""
+import asyncio
+import json
+import logging
+import time
+import uuid
+
+from services.mail_queue import MailDispatcher, MailMessage, MailQueueFull
+
+logger = logging.getLogger(__name__)
+
+STREAM = "mail:outbox"
+DEAD_LETTER_STREAM = "mail:outbox:dead"
+GROUP = "mail-workers"
+SENT_KEY_PREFIX = "mail:outbox:sent:"
+SENT_KEY_TTL = 7 * 24 * 3600
+
+
+async def publish(redis, message: MailMessage, maxlen: int = 100000) -> str:
+    """
+    Appends an email to the outbox stream.
+
+    Returns:
+        str: The dedup key of the entry.
+    """
+    dedup_key = uuid.uuid4().hex
+    fields = {
+        "dedup": dedup_key,
+        "recipient": message.recipient,
+        "subject": message.subject,
+        "template_name": message.template_name,
+        "template_body": json.dumps(message.template_body),
+    }
+    await redis.xadd(STREAM, fields, maxlen=maxlen, approximate=True)
+    return dedup_key
+
+
+def _decode(fields: dict) -> dict:
+    return {(k.decode() if isinstance(k, bytes) else k): (v.decode() if isinstance(v, bytes) else v)
+            for k, v in fields.items()}
+
+
+class OutboxConsumer:
+    def __init__(self, redis, dispatcher: MailDispatcher, consumer_name: str, batch_size: int = 50,
+                 block_ms: int = 5000, claim_idle_ms: int = 60000, dead_letter_maxlen: int = 10000):
+        self.redis = redis
+        self.dispatcher = dispatcher
+        self.consumer_name = consumer_name
+        self.batch_size = batch_size
+        self.block_ms = block_ms
+        self.claim_idle_ms = claim_idle_ms
+        self.dead_letter_maxlen = dead_letter_maxlen
+        self._claim_cursor = "0-0"
+        self._last_claim = 0.0
+        self._running = False
+        self.processed = 0
+        self.duplicates = 0
+        self.dead_lettered = 0
+        self.deferred = 0
+
+    async def ensure_group(self) -> None:
+        try:
+            await self.redis.xgroup_create(STREAM, GROUP, id="0", mkstream=True)
+        except Exception as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def run(self) -> None:
+        await self.ensure_group()
+        self._running = True
+        while self._running:
+            await self.run_once()
+
+    def stop(self) -> None:
+        self._running = False
+
+    async def run_once(self) -> int:
+        entries = await self._claim_stale()
+        if not entries:
+            response = await self.redis.xreadgroup(GROUP, self.consumer_name, {STREAM: ">"},
+                                                   count=self.batch_size, block=self.block_ms)
+            entries = response[0][1] if response else []
+        if entries:
+            await self.process(entries)
+        return len(entries)
+
+    async def _claim_stale(self) -> list:
+        # Scan for abandoned entries every half idle period, or keep paging a started scan.
+        now = time.monotonic()
+        if self._claim_cursor in ("0-0", b"0-0") and now - self._last_claim < self.claim_idle_ms / 2000:
+            return []
+        self._last_claim = now
+        result = await self.redis.xautoclaim(STREAM, GROUP, self.consumer_name, self.claim_idle_ms,
+                                             start_id=self._claim_cursor, count=self.batch_size)
+        self._claim_cursor, entries = result[0], result[1]
+        return [entry for entry in entries if entry[1]]
+
+    async def process(self, entries: list) -> None:
+        """
+        Sends one batch: skips already-sent dedup keys, enqueues the rest on the
+        dispatcher and acknowledges each entry once its delivery is settled.
+        Entries the dispatcher has no room for stay pending and are reclaimed
+        with XAUTOCLAIM later.
+        """
+        loop = asyncio.get_running_loop()
+        decoded = [(entry_id, _decode(fields)) for entry_id, fields in entries]
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for _, fields in decoded:
+                pipe.exists(SENT_KEY_PREFIX + fields["dedup"])
+            already_sent = await pipe.execute()
+
+        pending = []
+        queue_full = False
+        for (entry_id, fields), sent in zip(decoded, already_sent):
+            if sent:
+                self.duplicates += 1
+                await self.redis.xack(STREAM, GROUP, entry_id)
+                continue
+            if queue_full:
+                self.deferred += 1
+                continue
+            message = MailMessage(
+                recipient=fields["recipient"],
+                subject=fields["subject"],
+                template_name=fields["template_name"],
+                template_body=json.loads(fields["template_body"]),
+                result=loop.create_future(),
+            )
+            try:
+                await self.dispatcher.enqueue(message)
+            except MailQueueFull as e:
+                # Unacknowledged, so XAUTOCLAIM retries it. The rest of the batch
+                # would only wait out the same timeout, so it is left pending too.
+                logger.warning(f"Outbox entry {entry_id} left pending: {e}")
+                self.deferred += 1
+                queue_full = True
+                continue
+            pending.append((entry_id, fields, message))
+
+        for entry_id, fields, message in pending:
+            delivered = await message.result
+            async with self.redis.pipeline(transaction=True) as pipe:
+                if delivered:
+                    pipe.set(SENT_KEY_PREFIX + fields["dedup"], 1, ex=SENT_KEY_TTL)
+                else:
+                    pipe.xadd(DEAD_LETTER_STREAM, fields, maxlen=self.dead_letter_maxlen, approximate=True)
+                pipe.xack(STREAM, GROUP, entry_id)
+                await pipe.execute()
+            if delivered:
+                self.processed += 1
+            else:
+                self.dead_lettered += 1
+                logger.error(f"Outbox entry {entry_id} moved to {DEAD_LETTER_STREAM}")
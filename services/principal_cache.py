@@ -0,0 +1,126 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+from database.models import User
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = "auth:principal:invalidate"
+
+
+class PrincipalCache:
+    """
+    Bounded LRU of authenticated users with a TTL, kept per worker process.
+
+    Entries are stored as plain column dicts and a fresh detached ``User`` is built
+    on every hit, so request handlers never share a mutable instance. Writes that
+    change a user call ``invalidate``, which evicts locally and broadcasts the email
+    over Redis pub/sub so the other workers evict it too.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._redis = None
+        self._listener = None
+        self._subscribers = []
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, email: str) -> User | None:
+        entry = self._entries.get(email)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, data = entry
+        if expires_at < time.monotonic():
+            del self._entries[email]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(email)
+        self.hits += 1
+        return User(**data)
+
+    def put(self, user: User) -> None:
+        self._entries[user.email] = (time.monotonic() + self.ttl, user.as_dict())
+        self._entries.move_to_end(user.email)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def evict(self, email: str) -> None:
+        if self._entries.pop(email, None) is not None:
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def subscribe(self, callback) -> None:
+        """
+        Registers a callback that receives the email of every user changed by another worker.
+        """
+        self._subscribers.append(callback)
+
+    async def invalidate(self, email: str) -> None:
+        self.evict(email)
+        if self._redis is None:
+            return
+        try:
+            await self._redis.publish(INVALIDATION_CHANNEL, email)
+        except Exception as e:
+            logger.warning(f"Failed to broadcast principal invalidation for {email}: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+    async def start(self, redis) -> None:
+        self._redis = redis
+        self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        self._redis = None
+
+    async def _listen(self) -> None:
+        while True:
+            pubsub = self._redis.pubsub()
+            try:
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    email = message["data"]
+                    email = email.decode() if isinstance(email, bytes) else email
+                    self.evict(email)
+                    for callback in self._subscribers:
+                        callback(email)
+            except asyncio.CancelledError:
+                await pubsub.aclose()
+                raise
+            except Exception as e:
+                # Invalidations may have been missed while disconnected.
+                logger.warning(f"Principal cache listener disconnected: {e}")
+                self.clear()
+                await pubsub.aclose()
+                await asyncio.sleep(1)
+
+
+principal_cache = PrincipalCache(maxsize=settings.PRINCIPAL_CACHE_SIZE, ttl=settings.PRINCIPAL_CACHE_TTL)
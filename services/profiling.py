@@ -0,0 +1,343 @@
+"""
+On-demand request profiling.
+
+A request is profiled when it carries a valid ``X-Profile-Token`` header (an
+expiring HMAC signed with ``PROFILING_SECRET``, see ``make_token``) or when it
+falls into the ``PROFILING_SAMPLE_RATE`` fraction of all requests. Requests that
+are not profiled only pay for a header lookup; the middleware is not installed
+at all when neither is configured.
+
+While at least one profiled request is in flight a background thread samples
+the event loop every ``PROFILING_INTERVAL_MS``. For each profiled request it
+records the stack of its task: the live Python stack when the task is the one
+running on the loop, otherwise the chain of awaits it is suspended in (ending in
+the future it waits for). Samples therefore add up to wall-clock time, and time
+spent waiting on argon2 in the hashing pool, on Postgres or on Redis shows up
+under the coroutine that awaited it.
+
+Each profile is written in collapsed-stack format (``frame;frame;frame count``,
+readable by speedscope, flamegraph.pl and inferno) next to a small JSON file
+with the route template, status and duration.
+
+Mint a token with::
+
+    python -m services.profiling token --ttl 600
+"""
+import asyncio
+import collections
+import hashlib
+import hmac
+import json
+import logging
+import os
+import random
+import re
+import secrets
+import sys
+import threading
+import time
+
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = b"x-profile-token"
+PROFILE_ID_PATTERN = re.compile(r"^[0-9]+-[0-9a-f]{8}$")
+
+# The asyncio C accelerator keeps the running task per loop in this private dict. Interpreters
+# without it get no sampler; profiling is then disabled with a warning.
+_current_tasks = getattr(asyncio.tasks, "_current_tasks", None)
+
+
+def make_token(secret: str, ttl: int = 600) -> str:
+    """
+    Creates a profiling token valid for ``ttl`` seconds.
+
+    Parameters:
+        secret (str): The ``PROFILING_SECRET`` of the app.
+        ttl (int): Lifetime in seconds.
+
+    Returns:
+        str: ``<expires>.<signature>``.
+    """
+    expires = str(int(time.time()) + ttl)
+    signature = hmac.new(secret.encode(), expires.encode(), hashlib.sha256).hexdigest()
+    return f"{expires}.{signature}"
+
+
+def verify_token(secret: str, token: str | None) -> bool:
+    if not secret or not token:
+        return False
+    expires, _, signature = token.partition(".")
+    if not expires.isdigit() or int(expires) < time.time():
+        return False
+    expected = hmac.new(secret.encode(), expires.encode(), hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+def _frame_name(code) -> str:
+    name = f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    return name.replace(";", ":")
+
+
+def _await_stack(task, root_code) -> list[str]:
+    names = []
+    awaitable = task.get_coro()
+    while awaitable is not None:
+        if isinstance(awaitable, asyncio.Task):
+            awaitable = awaitable.get_coro()
+            continue
+        frame = getattr(awaitable, "cr_frame", None) or getattr(awaitable, "gi_frame", None) \
+            or getattr(awaitable, "ag_frame", None)
+        if frame is None:
+            names.append(f"<await {type(awaitable).__name__}>")
+            break
+        if frame.f_code is root_code:
+            names = []
+        names.append(_frame_name(frame.f_code))
+        awaitable = getattr(awaitable, "cr_await", None) or getattr(awaitable, "gi_yieldfrom", None) \
+            or getattr(awaitable, "ag_await", None)
+    return names
+
+
+def _running_stack(frame, root_code) -> list[str]:
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame.f_code))
+        if frame.f_code is root_code:
+            break
+        frame = frame.f_back
+    else:
+        # The sample raced with the task giving up the loop.
+        return []
+    names.reverse()
+    return names
+
+
+class StackSampler:
+    """
+    Samples the stacks of registered tasks from a background thread.
+
+    The thread only runs while at least one task is registered.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.available = _current_tasks is not None
+        self._profiles = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._loop = None
+        self._loop_thread_id = None
+
+    def begin(self, root_code=None) -> collections.Counter:
+        """
+        Starts sampling the current task.
+
+        Parameters:
+            root_code: Code object of the outermost frame to keep, the task's coroutine by default.
+
+        Returns:
+            Counter: Collapsed stacks of the task, filled in until ``end`` is called.
+        """
+        task = asyncio.current_task()
+        stacks = collections.Counter()
+        with self._lock:
+            self._profiles[task] = (stacks, root_code or task.get_coro().cr_code)
+            self._loop = task.get_loop()
+            self._loop_thread_id = threading.get_ident()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+                self._thread.start()
+        return stacks
+
+    def end(self) -> collections.Counter:
+        with self._lock:
+            stacks, _ = self._profiles.pop(asyncio.current_task(), (collections.Counter(), None))
+        return stacks
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._profiles:
+                    self._thread = None
+                    return
+                profiles = list(self._profiles.items())
+                loop, thread_id = self._loop, self._loop_thread_id
+            running = _current_tasks.get(loop)
+            loop_frame = sys._current_frames().get(thread_id) if running is not None else None
+            for task, (stacks, root_code) in profiles:
+                try:
+                    if task is running:
+                        stack = _running_stack(loop_frame, root_code)
+                    else:
+                        stack = _await_stack(task, root_code)
+                except Exception:
+                    # Frames can finish while they are being walked.
+                    continue
+                if stack:
+                    stacks[";".join(stack)] += 1
+
+
+class ProfileStore:
+    """
+    Keeps the most recent ``keep`` profiles in ``directory``.
+    """
+
+    def __init__(self, directory: str, keep: int = 200):
+        self.directory = directory
+        self.keep = keep
+
+    def new_id(self) -> str:
+        return f"{int(time.time() * 1000)}-{secrets.token_hex(4)}"
+
+    def save(self, meta: dict, stacks: collections.Counter) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, meta["id"])
+        with open(base + ".collapsed", "w") as f:
+            f.writelines(f"{stack} {count}\n" for stack, count in stacks.most_common())
+        with open(base + ".json", "w") as f:
+            json.dump(meta, f)
+        self._prune()
+
+    def _prune(self) -> None:
+        ids = self._ids()
+        for profile_id in ids[:-self.keep] if len(ids) > self.keep else []:
+            for suffix in (".json", ".collapsed"):
+                try:
+                    os.remove(os.path.join(self.directory, profile_id + suffix))
+                except FileNotFoundError:
+                    pass
+
+    def _ids(self) -> list[str]:
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        ids = [name[:-5] for name in names if name.endswith(".json") and PROFILE_ID_PATTERN.match(name[:-5])]
+        return sorted(ids, key=lambda profile_id: int(profile_id.split("-")[0]))
+
+    def list(self, route: str | None = None, limit: int = 50) -> list[dict]:
+        """
+        Returns the metadata of the most recent profiles, newest first.
+        """
+        profiles = []
+        for profile_id in reversed(self._ids()):
+            try:
+                with open(os.path.join(self.directory, profile_id + ".json")) as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if route is None or meta.get("route") == route:
+                profiles.append(meta)
+                if len(profiles) >= limit:
+                    break
+        return profiles
+
+    def path(self, profile_id: str) -> str | None:
+        if not PROFILE_ID_PATTERN.match(profile_id):
+            return None
+        path = os.path.join(self.directory, profile_id + ".collapsed")
+        return path if os.path.exists(path) else None
+
+
+def _route_template(scope) -> str:
+    endpoint = scope.get("endpoint")
+    app = scope.get("app")
+    if endpoint is not None and app is not None:
+        for route in app.router.routes:
+            if getattr(route, "endpoint", None) is endpoint:
+                return route.path
+    return scope["path"]
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware that profiles tokened or sampled requests.
+    """
+
+    def __init__(self, app, sampler: StackSampler, store: ProfileStore, secret: str = "",
+                 sample_rate: float = 0.0, exclude_prefix: str = "/admin/profiles"):
+        self.app = app
+        self.sampler = sampler
+        self.store = store
+        self.secret = secret
+        self.sample_rate = sample_rate
+        self.exclude_prefix = exclude_prefix
+        if not sampler.available:
+            logger.warning("asyncio does not expose the running task on this interpreter, "
+                           "request profiling is disabled")
+
+    def _trigger(self, scope) -> str | None:
+        if not self.sampler.available:
+            return None
+        if scope["type"] != "http" or scope["path"].startswith(self.exclude_prefix):
+            return None
+        if self.secret:
+            for name, value in scope["headers"]:
+                if name == PROFILE_HEADER:
+                    return "token" if verify_token(self.secret, value.decode("latin-1")) else None
+        if self.sample_rate and random.random() < self.sample_rate:
+            return "sampled"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        trigger = self._trigger(scope)
+        if trigger is None:
+            return await self.app(scope, receive, send)
+
+        profile_id = self.store.new_id()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile_id.encode())]
+            await send(message)
+
+        self.sampler.begin(root_code=ProfilingMiddleware.__call__.__code__)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - start
+            stacks = self.sampler.end()
+            meta = {
+                "id": profile_id,
+                "method": scope["method"],
+                "route": _route_template(scope),
+                "path": scope["path"],
+                "status": status_code,
+                "duration_ms": round(duration * 1000, 3),
+                "samples": sum(stacks.values()),
+                "interval_ms": self.sampler.interval * 1000,
+                "trigger": trigger,
+                "created_at": time.time(),
+            }
+            try:
+                await asyncio.to_thread(self.store.save, meta, stacks)
+            except OSError as e:
+                logger.warning(f"Could not save profile {profile_id}: {e}")
+
+
+stack_sampler = StackSampler(settings.PROFILING_INTERVAL_MS / 1000)
+profile_store = ProfileStore(settings.PROFILING_DIR, settings.PROFILING_KEEP)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Request profiling helpers")
+    commands = parser.add_subparsers(dest="command", required=True)
+    token_parser = commands.add_parser("token", help="print an X-Profile-Token header value")
+    token_parser.add_argument("--ttl", type=int, default=600, help="lifetime in seconds")
+    args = parser.parse_args()
+    if not settings.PROFILING_SECRET:
+        raise SystemExit("PROFILING_SECRET is not set")
+    print(make_token(settings.PROFILING_SECRET, args.ttl))
@@ -0,0 +1,339 @@
+"""
+Rate limiting for the credential and email endpoints.
+
+Every protected request is checked against two sliding windows, one per
+client IP and one per account (the email it targets), before the endpoint does
+any database or hashing work. Both windows are checked and, if neither is full,
+counted in one atomic Lua script call. A window is a sliding-window counter:
+the count of the current fixed window plus the previous window's count
+weighted by how much of it still overlaps, so each key is one small hash
+whatever the limit.
+
+If Redis errors or does not answer within ``RATE_LIMIT_REDIS_TIMEOUT_MS`` the
+check falls back to in-process token buckets with the same rates and keeps
+using them for ``RATE_LIMIT_FALLBACK_SECONDS`` before trying Redis again. The
+fallback limits per worker, so it is looser than the shared limit, but
+argon2 stays protected while Redis is down.
+
+Allowed responses carry ``X-RateLimit-Limit``/``-Remaining``/``-Reset`` for
+the tightest window; rejections are 429 with ``Retry-After``.
+"""
+import asyncio
+import hashlib
+import logging
+import math
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from fastapi import HTTPException, Request, status
+
+from services.redis_cache import get_redis
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+# KEYS: one hash per window. ARGV: now_ms, then window_ms and limit per key.
+# Returns 1/0 for allowed, then current count, previous count and ms into the window per key.
+SLIDING_WINDOW_SCRIPT = """
+local now = tonumber(ARGV[1])
+local allowed = 1
+local state = {}
+for i, key in ipairs(KEYS) do
+    local window = tonumber(ARGV[2 * i])
+    local limit = tonumber(ARGV[2 * i + 1])
+    local start = now - (now % window)
+    local stored = redis.call('HMGET', key, 's', 'c', 'p')
+    local current, previous = tonumber(stored[2]) or 0, tonumber(stored[3]) or 0
+    local stored_start = tonumber(stored[1])
+    if stored_start ~= start then
+        if stored_start == start - window then
+            previous = current
+        else
+            previous = 0
+        end
+        current = 0
+    end
+    local elapsed = now - start
+    if previous * (window - elapsed) / window + current + 1 > limit then
+        allowed = 0
+    end
+    state[i] = {start, current, previous, elapsed, window}
+end
+local result = {allowed}
+for i, key in ipairs(KEYS) do
+    local window_state = state[i]
+    local current = window_state[2]
+    if allowed == 1 then
+        current = current + 1
+        redis.call('HSET', key, 's', window_state[1], 'c', current, 'p', window_state[3])
+        redis.call('PEXPIRE', key, 2 * window_state[5])
+    end
+    table.insert(result, current)
+    table.insert(result, window_state[3])
+    table.insert(result, window_state[4])
+end
+return result
+"""
+
+
+@dataclass(frozen=True)
+class Limit:
+    count: int
+    seconds: float
+
+    @classmethod
+    def parse(cls, value: str) -> "Limit":
+        """
+        Parses ``"<count>/<seconds>"``, e.g. ``"10/60"`` for ten requests a minute.
+        """
+        count, _, seconds = value.partition("/")
+        return cls(int(count), float(seconds or 60))
+
+
+@dataclass
+class Decision:
+    allowed: bool
+    limit: int
+    remaining: int
+    reset: float
+    retry_after: float = 0
+
+    def headers(self) -> dict:
+        headers = {
+            "X-RateLimit-Limit": str(self.limit),
+            "X-RateLimit-Remaining": str(self.remaining),
+            "X-RateLimit-Reset": str(math.ceil(self.reset)),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(max(1, math.ceil(self.retry_after)))
+        return headers
+
+
+def _window_decision(allowed: bool, limit: Limit, current: int, previous: int, elapsed: float) -> Decision:
+    window = limit.seconds
+    weight = (window - elapsed) / window
+    estimate = previous * weight + current
+    remaining = max(0, math.floor(limit.count - estimate))
+    retry_after = 0.0
+    if not allowed and estimate + 1 > limit.count:
+        # The previous window's share decays linearly; wait until one more request fits.
+        if current + 1 > limit.count:
+            retry_after = window - elapsed + max(0.0, window * (1 - (limit.count - 1) / current))
+        else:
+            retry_after = max(0.0, window * (1 - (limit.count - 1 - current) / previous) - elapsed)
+    return Decision(allowed, limit.count, remaining, window - elapsed, retry_after)
+
+
+def _tightest(decisions: list[Decision], allowed: bool) -> Decision:
+    if allowed:
+        return min(decisions, key=lambda decision: (decision.remaining, -decision.reset))
+    return max((decision for decision in decisions if decision.retry_after > 0),
+               key=lambda decision: decision.retry_after, default=decisions[0])
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, capacity: int, now: float):
+        self.tokens = float(capacity)
+        self.updated = now
+
+
+class LocalLimiter:
+    """
+    In-process token buckets (capacity ``count``, refilled at ``count/seconds``), bounded to ``max_keys``.
+    """
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+
+    def _bucket(self, key: str, limit: Limit, now: float) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(limit.count, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            rate = limit.count / limit.seconds
+            bucket.tokens = min(limit.count, bucket.tokens + (now - bucket.updated) * rate)
+            bucket.updated = now
+        return bucket
+
+    def check(self, windows: list[tuple[str, Limit]], now: float | None = None) -> Decision:
+        now = time.monotonic() if now is None else now
+        buckets = [(self._bucket(key, limit, now), limit) for key, limit in windows]
+        allowed = all(bucket.tokens >= 1 for bucket, _ in buckets)
+        decisions = []
+        for bucket, limit in buckets:
+            if allowed:
+                bucket.tokens -= 1
+            rate = limit.count / limit.seconds
+            decisions.append(Decision(
+                allowed, limit.count, math.floor(bucket.tokens),
+                reset=(limit.count - bucket.tokens) / rate,
+                retry_after=0 if bucket.tokens >= 1 else (1 - bucket.tokens) / rate,
+            ))
+        return _tightest(decisions, allowed)
+
+
+class RateLimiter:
+    def __init__(self, redis_timeout: float = 0.05, fallback_seconds: float = 5):
+        self.redis_timeout = redis_timeout
+        self.fallback_seconds = fallback_seconds
+        self.local = LocalLimiter()
+        self._script = None
+        self._fallback_until = 0.0
+        self.rejected = 0
+        self.fallbacks = 0
+
+    async def check(self, windows: list[tuple[str, Limit]]) -> Decision:
+        """
+        Counts one request against every window unless one of them is full.
+
+        Parameters:
+            windows (list): ``(key, Limit)`` pairs.
+
+        Returns:
+            Decision: Whether the request is allowed and the headers of the tightest window.
+        """
+        if time.monotonic() >= self._fallback_until:
+            try:
+                decision = await asyncio.wait_for(self._check_redis(windows), timeout=self.redis_timeout)
+            except Exception as e:
+                self.fallbacks += 1
+                self._fallback_until = time.monotonic() + self.fallback_seconds
+                logger.warning(f"Rate limiter falling back to local buckets for {self.fallback_seconds}s: "
+                               f"{e!r}")
+                decision = self.local.check(windows)
+        else:
+            decision = self.local.check(windows)
+        if not decision.allowed:
+            self.rejected += 1
+        return decision
+
+    async def _check_redis(self, windows: list[tuple[str, Limit]]) -> Decision:
+        redis = await get_redis()
+        if self._script is None:
+            self._script = redis.register_script(SLIDING_WINDOW_SCRIPT)
+        args = [int(time.time() * 1000)]
+        for _, limit in windows:
+            args += [int(limit.seconds * 1000), limit.count]
+        result = await self._script(keys=[key for key, _ in windows], args=args)
+        allowed = bool(int(result[0]))
+        decisions = []
+        for index, (_, limit) in enumerate(windows):
+            current, previous, elapsed_ms = (int(value) for value in result[1 + 3 * index:4 + 3 * index])
+            decisions.append(_window_decision(allowed, limit, current, previous, elapsed_ms / 1000))
+        return _tightest(decisions, allowed)
+
+    def stats(self) -> dict:
+        return {"rejected": self.rejected, "fallbacks": self.fallbacks,
+                "falling_back": int(time.monotonic() < self._fallback_until)}
+
+
+def client_ip(request: Request) -> str:
+    if settings.RATE_LIMIT_TRUST_FORWARDED_FOR:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            # The rightmost address was added by our own proxy and cannot be forged by the client.
+            return forwarded.rsplit(",", 1)[-1].strip()
+    return request.client.host if request.client else "unknown"
+
+
+def _account_key(account: str) -> str:
+    return hashlib.blake2b(account.strip().lower().encode(), digest_size=12).hexdigest()
+
+
+def form_field(name: str):
+    async def extract(request: Request) -> str | None:
+        # FastAPI has already parsed the form; Starlette caches it on the request.
+        value = (await request.form()).get(name)
+        return value if isinstance(value, str) else None
+    return extract
+
+
+def query_param(name: str):
+    async def extract(request: Request) -> str | None:
+        return request.query_params.get(name)
+    return extract
+
+
+def json_field(name: str):
+    async def extract(request: Request) -> str | None:
+        try:
+            body = await request.json()
+        except ValueError:
+            return None
+        value = body.get(name) if isinstance(body, dict) else None
+        return value if isinstance(value, str) else None
+    return extract
+
+
+def rate_limit(scope: str, per_ip: str, per_account: str, account=None):
+    """
+    Creates a route dependency enforcing per-IP and per-account limits for ``scope``.
+
+    Routes sharing a scope share the budget. Add it to the route's
+    ``dependencies`` so it runs before the endpoint's own dependencies.
+
+    Parameters:
+        scope (str): Budget name, e.g. ``"login"``.
+        per_ip (str): Limit per client IP, ``"<count>/<seconds>"``.
+        per_account (str): Limit per account, ``"<count>/<seconds>"``.
+        account: Async callable extracting the account from the request (see ``form_field``,
+            ``query_param`` and ``json_field``).
+
+    Raises:
+        HTTPException: 429 when a window is full.
+    """
+    ip_limit, account_limit = Limit.parse(per_ip), Limit.parse(per_account)
+
+    async def dependency(request: Request):
+        if not settings.RATE_LIMIT_ENABLED:
+            return
+        # All keys share the {rl} hash tag so the script may touch them together on a cluster.
+        windows = [(f"rl:{{rl}}:{scope}:ip:{client_ip(request)}", ip_limit)]
+        account_value = await account(request) if account is not None else None
+        if account_value:
+            windows.append((f"rl:{{rl}}:{scope}:acct:{_account_key(account_value)}", account_limit))
+        decision = await rate_limiter.check(windows)
+        if not decision.allowed:
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                                detail="Too many requests, try again later", headers=decision.headers())
+        request.state.rate_limit = decision
+
+    return dependency
+
+
+class RateLimitHeadersMiddleware:
+    """
+    Copies the headers of an allowed rate-limit decision onto the response,
+    whatever response class the endpoint returned.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                decision = scope.get("state", {}).get("rate_limit")
+                if decision is not None:
+                    headers = list(message.get("headers", []))
+                    headers += [(name.lower().encode(), value.encode()) for name, value in decision.headers().items()]
+                    message["headers"] = headers
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+rate_limiter = RateLimiter(
+    redis_timeout=settings.RATE_LIMIT_REDIS_TIMEOUT_MS / 1000,
+    fallback_seconds=settings.RATE_LIMIT_FALLBACK_SECONDS,
+)
@@ -1,12 +1,68 @@
 import os
+import time
+
 import redis.asyncio as aioredis
+from redis.asyncio.client import Pipeline
+
+from services.metrics import REDIS_COMMAND_DURATION, REDIS_ERRORS
 
 redis_client = None
 
+_command_timers = {}
+
+
+def _observe(command, seconds: float, failed: bool) -> None:
+    name = command.decode() if isinstance(command, bytes) else str(command)
+    timer = _command_timers.get(name)
+    if timer is None:
+        timer = _command_timers[name] = REDIS_COMMAND_DURATION.labels(name.upper())
+    timer.observe(seconds)
+    if failed:
+        REDIS_ERRORS.labels(name.upper()).inc()
+
+
+class InstrumentedPipeline(Pipeline):
+    async def execute(self, raise_on_error: bool = True):
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = await super().execute(raise_on_error)
+            failed = False
+            return result
+        finally:
+            _observe("PIPELINE", time.perf_counter() - start, failed)
+
+
+class InstrumentedRedis(aioredis.Redis):
+    """
+    Redis client that records the duration of every round trip.
+    """
+
+    async def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = await super().execute_command(*args, **options)
+            failed = False
+            return result
+        finally:
+            _observe(args[0], time.perf_counter() - start, failed)
+
+    def pipeline(self, transaction: bool = True, shard_hint: str | None = None) -> Pipeline:
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
 async def get_redis():
     global redis_client
     if redis_client is None:
-        redis_client = aioredis.from_url(
+        redis_client = InstrumentedRedis.from_url(
             f"redis://{os.getenv('REDIS_HOST', 'localhost')}:{os.getenv('REDIS_PORT', 6379)}"
         )
     return redis_client
+
+
+async def close_redis():
+    global redis_client
+    if redis_client is not None:
+        client, redis_client = redis_client, None
+        await client.aclose()
@@ -0,0 +1,274 @@
+"""
+Registered-email membership filter.
+
+Every worker keeps a Bloom filter of all emails in the ``users`` table, so a
+lookup for an email that was never registered (enumeration, credential
+stuffing, typos) is answered without a database query. ``might_exist`` never
+returns a false negative while the filter is trusted; a false positive, at
+``REGISTERED_EMAIL_FILTER_ERROR_RATE``, just costs the query it would have cost
+anyway.
+
+The filter is built by streaming ``users.email`` in batches, then kept current:
+signups call ``add``, which updates the local filter and publishes the email on
+``users:registered`` for the other workers. It is rebuilt every
+``REGISTERED_EMAIL_FILTER_REBUILD_SECONDS`` (with jitter, so workers don't
+scan together), early once it holds more emails than it was sized for, and
+after the pub/sub connection drops. Emails added in the last
+``recent_window`` seconds are re-applied after each rebuild, so a signup that
+raced the table scan is not lost.
+
+If a signup cannot be broadcast, the worker keeps bumping the shared
+``users:registered:generation`` counter and publishing on
+``users:registered:reset`` until Redis answers. Every worker then drops its
+filter and rebuilds it. Workers also poll the counter every ``check_interval``
+seconds in case they missed the reset message.
+
+Until the first build finishes, while the listener is disconnected and from a
+reset until the rebuild after it, the filter is not trusted and every lookup
+goes to the database. A scan that was running when the filter was reset is
+discarded.
+"""
+import asyncio
+import logging
+import random
+import time
+
+from sqlalchemy import func, select
+
+from database.models import User
+from services.bloom import BloomFilter
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+REGISTERED_CHANNEL = "users:registered"
+RESET_CHANNEL = "users:registered:reset"
+GENERATION_KEY = "users:registered:generation"
+
+
+class RegisteredEmailFilter:
+    def __init__(self, error_rate: float = 0.01, headroom: float = 2.0, rebuild_interval: float = 3600,
+                 recent_window: float = 600, batch_size: int = 10000, min_capacity: int = 1000,
+                 check_interval: float = 30):
+        self.error_rate = error_rate
+        self.headroom = headroom
+        self.rebuild_interval = rebuild_interval
+        self.recent_window = recent_window
+        self.batch_size = batch_size
+        self.min_capacity = min_capacity
+        self.check_interval = check_interval
+        self._bloom = None
+        # Bumped whenever the filter is dropped; a scan started before the bump is discarded.
+        self._generation = 0
+        self._shared_generation = None
+        self._reset_task = None
+        self._recent = {}
+        self._listening = False
+        self._redis = None
+        self._session_factory = None
+        self._rebuild_requested = None
+        self._tasks = []
+        self.checks = 0
+        self.rejections = 0
+        self.rebuilds = 0
+
+    @property
+    def trusted(self) -> bool:
+        return self._bloom is not None and self._listening
+
+    def might_exist(self, email: str) -> bool:
+        """
+        Returns False only for emails that are certainly not registered.
+        """
+        bloom = self._bloom
+        if bloom is None or not self._listening:
+            return True
+        self.checks += 1
+        if email in bloom:
+            return True
+        self.rejections += 1
+        return False
+
+    def _apply(self, email: str) -> None:
+        if email in self._recent:
+            self._recent[email] = time.monotonic()
+            return
+        self._recent[email] = time.monotonic()
+        bloom = self._bloom
+        if bloom is not None:
+            bloom.add(email)
+            if len(bloom) > bloom.capacity:
+                self._request_rebuild()
+
+    async def add(self, email: str) -> None:
+        """
+        Adds a newly registered email here and on every other worker.
+        """
+        self._apply(email)
+        if self._redis is None:
+            return
+        try:
+            await self._redis.publish(REGISTERED_CHANNEL, email)
+        except Exception as e:
+            logger.warning(f"Failed to broadcast registered email {email}, resetting the filter on every worker: {e}")
+            if self._reset_task is None or self._reset_task.done():
+                self._reset_task = asyncio.create_task(self._announce_reset())
+
+    async def _announce_reset(self) -> None:
+        delay = 0.1
+        while True:
+            try:
+                async with self._redis.pipeline(transaction=True) as pipe:
+                    pipe.incr(GENERATION_KEY)
+                    pipe.publish(RESET_CHANNEL, "1")
+                    await pipe.execute()
+                return
+            except Exception as e:
+                logger.warning(f"Registered email filter reset not announced yet: {e}")
+                await asyncio.sleep(delay)
+                delay = min(2 * delay, 5)
+
+    def _invalidate(self, rebuild: bool = True) -> None:
+        self._generation += 1
+        self._bloom = None
+        if rebuild:
+            self._request_rebuild()
+
+    async def _read_shared_generation(self) -> int | None:
+        if self._redis is None:
+            return None
+        try:
+            return int(await self._redis.get(GENERATION_KEY) or 0)
+        except Exception as e:
+            logger.warning(f"Failed to read the registered email filter generation: {e}")
+            return None
+
+    async def rebuild(self, session_factory) -> int:
+        """
+        Builds a new filter from the ``users`` table and swaps it in.
+
+        Returns:
+            int: The number of emails loaded from the table.
+        """
+        started = time.perf_counter()
+        generation = self._generation
+        shared_generation = await self._read_shared_generation()
+        loaded = 0
+        async with session_factory() as db:
+            count = await db.scalar(select(func.count()).select_from(User))
+            bloom = BloomFilter(max(self.min_capacity, int(count * self.headroom)), self.error_rate)
+            result = await db.stream_scalars(select(User.email).execution_options(yield_per=self.batch_size))
+            async for emails in result.partitions():
+                bloom.update(emails)
+                loaded += len(emails)
+        cutoff = time.monotonic() - self.recent_window
+        self._recent = {email: added for email, added in self._recent.items() if added >= cutoff}
+        bloom.update(self._recent)
+        if generation != self._generation:
+            logger.info("Registered email filter was reset during the rebuild, discarding it")
+            return loaded
+        self._bloom = bloom
+        self._shared_generation = shared_generation
+        self.rebuilds += 1
+        logger.info(f"Registered email filter rebuilt with {loaded} emails "
+                    f"in {(time.perf_counter() - started) * 1000:.0f} ms")
+        return loaded
+
+    def _request_rebuild(self) -> None:
+        if self._rebuild_requested is not None:
+            self._rebuild_requested.set()
+
+    def stats(self) -> dict:
+        bloom = self._bloom
+        return {
+            "trusted": int(self.trusted),
+            "emails": len(bloom) if bloom is not None else 0,
+            "capacity": bloom.capacity if bloom is not None else 0,
+            "bytes": len(bloom.bits) if bloom is not None else 0,
+            "checks": self.checks,
+            "rejections": self.rejections,
+            "rebuilds": self.rebuilds,
+        }
+
+    async def start(self, redis, session_factory) -> None:
+        """
+        Starts the pub/sub listener and the rebuild job; the first build runs in the background.
+        """
+        self._redis = redis
+        self._session_factory = session_factory
+        self._rebuild_requested = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._listen()), asyncio.create_task(self._rebuild_loop())]
+
+    async def stop(self) -> None:
+        tasks = self._tasks + ([self._reset_task] if self._reset_task is not None else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+        self._reset_task = None
+        self._listening = False
+        self._redis = None
+
+    async def _rebuild_loop(self) -> None:
+        while True:
+            # Cleared before the scan, so a request made while it runs triggers another one.
+            self._rebuild_requested.clear()
+            try:
+                await self.rebuild(self._session_factory)
+                delay = self.rebuild_interval * random.uniform(0.9, 1.1)
+            except Exception as e:
+                logger.warning(f"Registered email filter rebuild failed: {e}")
+                delay = min(60, self.rebuild_interval)
+            deadline = time.monotonic() + delay
+            while not self._rebuild_requested.is_set() and time.monotonic() < deadline:
+                try:
+                    await asyncio.wait_for(self._rebuild_requested.wait(),
+                                           timeout=min(self.check_interval, deadline - time.monotonic()))
+                except asyncio.TimeoutError:
+                    await self._check_shared_generation()
+
+    async def _check_shared_generation(self) -> None:
+        if self._shared_generation is None:
+            return
+        shared_generation = await self._read_shared_generation()
+        if shared_generation is not None and shared_generation != self._shared_generation:
+            logger.info("Registered email filter was reset by another worker")
+            self._invalidate()
+
+    async def _listen(self) -> None:
+        reconnecting = False
+        while True:
+            pubsub = self._redis.pubsub()
+            try:
+                await pubsub.subscribe(REGISTERED_CHANNEL, RESET_CHANNEL)
+                if reconnecting:
+                    # Signups on other workers may have been missed while disconnected.
+                    self._invalidate()
+                    reconnecting = False
+                self._listening = True
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    channel = message["channel"]
+                    if (channel.decode() if isinstance(channel, bytes) else channel) == RESET_CHANNEL:
+                        self._invalidate()
+                        continue
+                    email = message["data"]
+                    self._apply(email.decode() if isinstance(email, bytes) else email)
+            except asyncio.CancelledError:
+                await pubsub.aclose()
+                raise
+            except Exception as e:
+                logger.warning(f"Registered email listener disconnected: {e}")
+                # Untrusted until the rebuild after reconnecting.
+                self._listening = False
+                self._invalidate(rebuild=False)
+                reconnecting = True
+                await pubsub.aclose()
+                await asyncio.sleep(1)
+
+
+registered_emails = RegisteredEmailFilter(
+    error_rate=settings.REGISTERED_EMAIL_FILTER_ERROR_RATE,
+    rebuild_interval=settings.REGISTERED_EMAIL_FILTER_REBUILD_SECONDS,
+)
@@ -0,0 +1,141 @@
+"""
+Process-wide resources and their lifecycle.
+
+Two kinds of entries:
+
+* lifecycle steps (``add``) - warm-up run by the app lifespan before the worker
+  accepts traffic (open DB and Redis connections, fill caches, start
+  listeners) and the matching shutdown, run in reverse order;
+* lazy resources (``lazy``) - heavy subsystems (SMTP config, Cloudinary SDK)
+  that are imported and initialized on first use, so importing the app stays
+  cheap. Their optional close hook only runs if they were ever initialized.
+
+Startup and first-use timings are kept in ``timings`` for the startup benchmark.
+"""
+import inspect
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable
+
+logger = logging.getLogger(__name__)
+
+
+async def _call(hook, *args):
+    result = hook(*args)
+    if inspect.isawaitable(result):
+        await result
+
+
+@dataclass
+class LifecycleStep:
+    name: str
+    start: Callable | None = None
+    stop: Callable | None = None
+    required: bool = False
+    started: bool = False
+
+
+class Lazy:
+    """
+    A value built by ``factory`` on the first ``get`` (thread-safe).
+    """
+
+    def __init__(self, registry: "ResourceRegistry", name: str, factory: Callable[[], Any],
+                 close: Callable | None = None):
+        self._registry = registry
+        self.name = name
+        self.factory = factory
+        self.close = close
+        self._value = None
+        self._initialized = False
+        self._lock = threading.Lock()
+
+    @property
+    def initialized(self) -> bool:
+        return self._initialized
+
+    def get(self):
+        if self._initialized:
+            return self._value
+        with self._lock:
+            if not self._initialized:
+                start = time.perf_counter()
+                self._value = self.factory()
+                self._initialized = True
+                self._registry.timings[self.name] = time.perf_counter() - start
+                logger.info(f"Initialized {self.name} on first use")
+        return self._value
+
+    def reset(self) -> None:
+        with self._lock:
+            self._value = None
+            self._initialized = False
+
+
+class ResourceRegistry:
+    def __init__(self):
+        self._steps = []
+        self._lazy = []
+        self.timings = {}
+
+    def add(self, name: str, start: Callable | None = None, stop: Callable | None = None,
+            required: bool = False) -> None:
+        """
+        Registers a lifecycle step.
+
+        Parameters:
+            name (str): Name used in logs and timings.
+            start: Sync or async callable run at startup, in registration order.
+            stop: Sync or async callable run at shutdown, in reverse order.
+            required (bool): Abort startup when ``start`` fails instead of logging a warning.
+        """
+        self._steps.append(LifecycleStep(name, start, stop, required))
+
+    def lazy(self, name: str, factory: Callable[[], Any], close: Callable | None = None) -> Lazy:
+        """
+        Creates a lazily initialized resource; ``close(value)`` runs at shutdown if it was used.
+        """
+        resource = Lazy(self, name, factory, close)
+        self._lazy.append(resource)
+        return resource
+
+    async def startup(self) -> None:
+        total = time.perf_counter()
+        for step in self._steps:
+            if step.start is not None:
+                start = time.perf_counter()
+                try:
+                    await _call(step.start)
+                except Exception as e:
+                    if step.required:
+                        logger.error(f"Startup step {step.name} failed: {e}")
+                        await self.shutdown()
+                        raise
+                    logger.warning(f"Startup step {step.name} failed: {e}")
+                self.timings[step.name] = time.perf_counter() - start
+            step.started = True
+        self.timings["startup"] = time.perf_counter() - total
+        logger.info(f"Resources ready in {self.timings['startup'] * 1000:.1f} ms")
+
+    async def shutdown(self) -> None:
+        for resource in reversed(self._lazy):
+            if resource.initialized and resource.close is not None:
+                try:
+                    await _call(resource.close, resource.get())
+                except Exception as e:
+                    logger.warning(f"Closing {resource.name} failed: {e}")
+                resource.reset()
+        for step in reversed(self._steps):
+            if not step.started:
+                continue
+            step.started = False
+            if step.stop is not None:
+                try:
+                    await _call(step.stop)
+                except Exception as e:
+                    logger.warning(f"Shutdown step {step.name} failed: {e}")
+
+
+resources = ResourceRegistry()
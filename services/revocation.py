@@ -0,0 +1,178 @@
+"""
+Access-token revocation.
+
+Two kinds of records live in Redis sorted sets:
+
+* ``auth:revoked:jti`` - single tokens, scored by the token's ``exp`` so they
+  can be dropped once the token would have expired anyway;
+* ``auth:revoked:users`` - per-user watermarks: every token of that user issued
+  at or before the score (a unix timestamp with sub-second precision, like
+  access-token ``iat``) is revoked. Kept for one access
+  token lifetime, after which no token older than the watermark is valid.
+
+Every worker mirrors both sets in memory (a Bloom filter in front of an exact
+dict for tokens, a dict for watermarks), loads them on start, applies changes
+broadcast on ``auth:revoked`` and re-syncs periodically and after a pub/sub
+reconnect. ``is_revoked`` therefore never leaves the process.
+"""
+import asyncio
+import json
+import logging
+import time
+
+from services.bloom import BloomFilter
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+REVOKED_TOKENS_KEY = "auth:revoked:jti"
+REVOKED_USERS_KEY = "auth:revoked:users"
+REVOCATION_CHANNEL = "auth:revoked"
+
+
+def _text(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class RevocationList:
+    def __init__(self, watermark_ttl: int, bloom_capacity: int = 100000, resync_interval: float = 60):
+        self.watermark_ttl = watermark_ttl
+        self.bloom_capacity = bloom_capacity
+        self.resync_interval = resync_interval
+        self._tokens = {}
+        self._bloom = BloomFilter(bloom_capacity)
+        self._watermarks = {}
+        self._redis = None
+        self._tasks = []
+        self.revoked_hits = 0
+
+    def is_revoked(self, claims: dict) -> bool:
+        jti = claims.get("jti")
+        if jti is not None and jti in self._bloom and jti in self._tokens:
+            self.revoked_hits += 1
+            return True
+        watermark = self._watermarks.get(claims.get("sub"))
+        if watermark is not None and claims.get("iat", 0) <= watermark:
+            self.revoked_hits += 1
+            return True
+        return False
+
+    def _apply_token(self, jti: str, expires_at: float) -> None:
+        self._tokens[jti] = expires_at
+        self._bloom.add(jti)
+
+    def _apply_watermark(self, email: str, watermark: float) -> None:
+        if watermark > self._watermarks.get(email, 0):
+            self._watermarks[email] = watermark
+
+    async def revoke_token(self, jti: str, expires_at: float) -> None:
+        """
+        Revokes one access token until its expiry.
+        """
+        self._apply_token(jti, expires_at)
+        await self._publish(REVOKED_TOKENS_KEY, jti, expires_at)
+
+    async def revoke_user(self, email: str, at: float | None = None) -> None:
+        """
+        Revokes every access token of a user issued at or before ``at`` (now by default).
+        """
+        watermark = float(at if at is not None else time.time())
+        self._apply_watermark(email, watermark)
+        await self._publish(REVOKED_USERS_KEY, email, watermark)
+
+    async def _publish(self, key: str, member: str, score: float) -> None:
+        if self._redis is None:
+            logger.warning(f"Revocation of {member} is not shared, Redis is not connected")
+            return
+        async with self._redis.pipeline(transaction=True) as pipe:
+            if key == REVOKED_USERS_KEY:
+                pipe.zadd(key, {member: score}, gt=True)
+            else:
+                pipe.zadd(key, {member: score})
+            pipe.publish(REVOCATION_CHANNEL, json.dumps([key, member, score]))
+            await pipe.execute()
+
+    async def sync(self) -> None:
+        """
+        Replaces the local mirror with the current Redis state and drops expired records.
+        """
+        now = time.time()
+        watermark_floor = now - self.watermark_ttl
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.zremrangebyscore(REVOKED_TOKENS_KEY, "-inf", now)
+            pipe.zremrangebyscore(REVOKED_USERS_KEY, "-inf", watermark_floor)
+            pipe.zrangebyscore(REVOKED_TOKENS_KEY, now, "+inf", withscores=True)
+            pipe.zrangebyscore(REVOKED_USERS_KEY, watermark_floor, "+inf", withscores=True)
+            _, _, tokens, users = await pipe.execute()
+
+        # Keep records that arrived over pub/sub while the snapshot was taken.
+        merged_tokens = {jti: exp for jti, exp in self._tokens.items() if exp > now}
+        merged_tokens.update((_text(jti), exp) for jti, exp in tokens)
+        bloom = BloomFilter(max(self.bloom_capacity, 2 * len(merged_tokens)))
+        bloom.update(merged_tokens)
+        merged_watermarks = {email: ts for email, ts in self._watermarks.items() if ts > watermark_floor}
+        self._tokens, self._bloom, self._watermarks = merged_tokens, bloom, merged_watermarks
+        for email, watermark in users:
+            self._apply_watermark(_text(email), watermark)
+
+    def stats(self) -> dict:
+        return {"tokens": len(self._tokens), "users": len(self._watermarks), "revoked_hits": self.revoked_hits}
+
+    async def start(self, redis) -> None:
+        self._redis = redis
+        try:
+            await self.sync()
+        except Exception as e:
+            logger.warning(f"Initial revocation list sync failed: {e}")
+        self._tasks = [asyncio.create_task(self._listen()), asyncio.create_task(self._resync())]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._redis = None
+
+    def _handle(self, data) -> None:
+        key, member, score = json.loads(_text(data))
+        if key == REVOKED_USERS_KEY:
+            self._apply_watermark(member, score)
+        else:
+            self._apply_token(member, score)
+
+    async def _listen(self) -> None:
+        reconnecting = False
+        while True:
+            pubsub = self._redis.pubsub()
+            try:
+                await pubsub.subscribe(REVOCATION_CHANNEL)
+                if reconnecting:
+                    # Revocations published while disconnected were missed.
+                    await self.sync()
+                    reconnecting = False
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        self._handle(message["data"])
+            except asyncio.CancelledError:
+                await pubsub.aclose()
+                raise
+            except Exception as e:
+                logger.warning(f"Revocation listener disconnected: {e}")
+                reconnecting = True
+                await pubsub.aclose()
+                await asyncio.sleep(1)
+
+    async def _resync(self) -> None:
+        while True:
+            await asyncio.sleep(self.resync_interval)
+            try:
+                await self.sync()
+            except Exception as e:
+                logger.warning(f"Revocation list sync failed: {e}")
+
+
+revocation_list = RevocationList(
+    watermark_ttl=settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    bloom_capacity=settings.REVOCATION_BLOOM_CAPACITY,
+    resync_interval=settings.REVOCATION_RESYNC_SECONDS,
+)
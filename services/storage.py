@@ -0,0 +1,105 @@
+import asyncio
+import io
+import os
+from abc import ABC, abstractmethod
+from pathlib import Path
+
+from services.resources import resources
+from settings import settings
+
+
+class AvatarStorage(ABC):
+    """
+    Where processed avatar images are stored. Keys look like ``avatars/<sha256>/<size>.webp``.
+    """
+
+    @abstractmethod
+    async def exists(self, key: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def save(self, key: str, data: bytes, content_type: str) -> str:
+        ...
+
+    @abstractmethod
+    def url_for(self, key: str) -> str:
+        ...
+
+
+class LocalAvatarStorage(AvatarStorage):
+    def __init__(self, root: str, base_url: str):
+        self.root = Path(root)
+        self.base_url = base_url.rstrip("/")
+
+    def _path(self, key: str) -> Path:
+        return self.root / key.removeprefix("avatars/")
+
+    async def exists(self, key: str) -> bool:
+        return await asyncio.to_thread(self._path(key).exists)
+
+    async def save(self, key: str, data: bytes, content_type: str) -> str:
+        path = self._path(key)
+
+        def write():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(path.suffix + ".tmp")
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, path)
+
+        await asyncio.to_thread(write)
+        return self.url_for(key)
+
+    def url_for(self, key: str) -> str:
+        return f"{self.base_url}/{key.removeprefix('avatars/')}"
+
+
+def _configure_cloudinary():
+    import cloudinary
+    import cloudinary.uploader
+
+    cloudinary.config(
+        cloud_name=settings.CLOUDINARY_CLOUD_NAME,
+        api_key=settings.CLOUDINARY_API_KEY,
+        api_secret=settings.CLOUDINARY_API_SECRET,
+    )
+    return cloudinary
+
+
+cloudinary_sdk = resources.lazy("cloudinary", _configure_cloudinary)
+
+
+class CloudinaryAvatarStorage(AvatarStorage):
+    """
+    Uploads with the content-hash key as public_id and overwrite disabled, so
+    re-uploading identical content is a no-op on Cloudinary's side. The blocking
+    SDK calls run in a thread. The SDK is imported and configured on first use.
+    """
+
+    def __init__(self):
+        self._known = set()
+
+    async def exists(self, key: str) -> bool:
+        return key in self._known
+
+    async def save(self, key: str, data: bytes, content_type: str) -> str:
+        cloudinary = cloudinary_sdk.get()
+        public_id = key.rsplit(".", 1)[0]
+        result = await asyncio.to_thread(
+            cloudinary.uploader.upload, io.BytesIO(data), public_id=public_id, overwrite=False,
+            resource_type="image",
+        )
+        self._known.add(key)
+        return result["secure_url"]
+
+    def url_for(self, key: str) -> str:
+        cloudinary = cloudinary_sdk.get()
+        public_id, extension = key.rsplit(".", 1)
+        return cloudinary.CloudinaryImage(public_id).build_url(format=extension, secure=True)
+
+
+def create_avatar_storage(backend: str, local_dir: str, base_url: str) -> AvatarStorage:
+    if backend == "local":
+        return LocalAvatarStorage(local_dir, base_url)
+    if backend == "cloudinary":
+        return CloudinaryAvatarStorage()
+    raise ValueError(f"Unknown avatar storage backend: {backend}")
@@ -0,0 +1,151 @@
+"""
+Refresh-token storage.
+
+Every login starts a token *family* (``fid`` claim). Each refresh rotates the
+family to a new ``jti``; presenting an older ``jti`` of the same family is
+treated as token reuse and revokes the whole family. A user can hold several
+families at once, one per session.
+
+``RedisRefreshTokenStore`` keeps families in Redis hashes that expire after
+``REFRESH_TOKEN_EXPIRE_DAYS`` and rotates with a single Lua script call.
+``PostgresRefreshTokenStore`` is the fallback; it keeps one session per user in
+the ``users.refresh_token`` column. Tokens issued before families existed carry
+no ``fid`` and are migrated on their next refresh (see ``Auth.rotate_refresh_token``),
+after which the column is no longer written by the Redis backend.
+"""
+import enum
+import logging
+from abc import ABC, abstractmethod
+
+from database.db import SessionLocal
+from repository import cached_users
+from services.redis_cache import get_redis
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class Rotation(enum.IntEnum):
+    UNKNOWN = 0
+    ROTATED = 1
+    REUSED = -1
+
+
+ROTATE_SCRIPT = """
+local current = redis.call('HGET', KEYS[1], 'jti')
+if not current then
+    return 0
+end
+if current ~= ARGV[1] then
+    redis.call('DEL', KEYS[1])
+    redis.call('SREM', KEYS[2], ARGV[3])
+    return -1
+end
+redis.call('HSET', KEYS[1], 'jti', ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+redis.call('EXPIRE', KEYS[2], ARGV[4])
+return 1
+"""
+
+
+class RefreshTokenStore(ABC):
+    @abstractmethod
+    async def create_family(self, email: str, family_id: str, jti: str) -> None:
+        ...
+
+    @abstractmethod
+    async def rotate(self, email: str, family_id: str, jti: str, new_jti: str) -> Rotation:
+        ...
+
+    @abstractmethod
+    async def revoke_family(self, email: str, family_id: str) -> None:
+        ...
+
+    @abstractmethod
+    async def revoke_user(self, email: str) -> None:
+        ...
+
+
+class RedisRefreshTokenStore(RefreshTokenStore):
+    def __init__(self, ttl_seconds: int):
+        self.ttl_seconds = ttl_seconds
+        self._rotate_script = None
+
+    @staticmethod
+    def family_key(email: str, family_id: str) -> str:
+        # The {email} hash tag keeps a user's keys in one cluster slot for the script.
+        return f"rt:{{{email}}}:family:{family_id}"
+
+    @staticmethod
+    def families_key(email: str) -> str:
+        return f"rt:{{{email}}}:families"
+
+    async def create_family(self, email: str, family_id: str, jti: str) -> None:
+        redis = await get_redis()
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.hset(self.family_key(email, family_id), "jti", jti)
+            pipe.expire(self.family_key(email, family_id), self.ttl_seconds)
+            pipe.sadd(self.families_key(email), family_id)
+            pipe.expire(self.families_key(email), self.ttl_seconds)
+            await pipe.execute()
+
+    async def rotate(self, email: str, family_id: str, jti: str, new_jti: str) -> Rotation:
+        redis = await get_redis()
+        if self._rotate_script is None:
+            self._rotate_script = redis.register_script(ROTATE_SCRIPT)
+        result = await self._rotate_script(
+            keys=[self.family_key(email, family_id), self.families_key(email)],
+            args=[jti, new_jti, family_id, self.ttl_seconds],
+        )
+        return Rotation(int(result))
+
+    async def revoke_family(self, email: str, family_id: str) -> None:
+        redis = await get_redis()
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.delete(self.family_key(email, family_id))
+            pipe.srem(self.families_key(email), family_id)
+            await pipe.execute()
+
+    async def revoke_user(self, email: str) -> None:
+        redis = await get_redis()
+        family_ids = await redis.smembers(self.families_key(email))
+        keys = [self.family_key(email, fid.decode() if isinstance(fid, bytes) else fid) for fid in family_ids]
+        await redis.delete(self.families_key(email), *keys)
+
+
+class PostgresRefreshTokenStore(RefreshTokenStore):
+    """
+    Single-session fallback that stores ``<fid>:<jti>`` in ``users.refresh_token``.
+    Rotation is a conditional UPDATE that only matches the current value.
+    """
+
+    async def create_family(self, email: str, family_id: str, jti: str) -> None:
+        async with SessionLocal() as db:
+            await cached_users.update_token(email, f"{family_id}:{jti}", db)
+
+    async def rotate(self, email: str, family_id: str, jti: str, new_jti: str) -> Rotation:
+        async with SessionLocal() as db:
+            if await cached_users.update_token(email, f"{family_id}:{new_jti}", db, expected=f"{family_id}:{jti}"):
+                return Rotation.ROTATED
+            if await cached_users.clear_token_family(email, family_id, db):
+                return Rotation.REUSED
+            return Rotation.UNKNOWN
+
+    async def revoke_family(self, email: str, family_id: str) -> None:
+        async with SessionLocal() as db:
+            await cached_users.clear_token_family(email, family_id, db)
+
+    async def revoke_user(self, email: str) -> None:
+        async with SessionLocal() as db:
+            await cached_users.update_token(email, None, db)
+
+
+def create_token_store(backend: str) -> RefreshTokenStore:
+    if backend == "postgres":
+        return PostgresRefreshTokenStore()
+    if backend == "redis":
+        return RedisRefreshTokenStore(ttl_seconds=settings.REFRESH_TOKEN_EXPIRE_DAYS * 24 * 3600)
+    raise ValueError(f"Unknown refresh token backend: {backend}")
+
+
+token_store = create_token_store(settings.REFRESH_TOKEN_BACKEND)
@@ -0,0 +1,106 @@
+"""
+Offline verification of this app's access tokens for other services.
+
+The module depends only on PyJWT (with ``cryptography``) and httpx and does not
+import anything else from this project, so sibling services can install or copy
+it as is::
+
+    verifier = JWKSVerifier("https://auth.example.com/.well-known/jwks.json")
+    claims = await verifier.verify(bearer_token)
+
+Keys are fetched from the JWKS endpoint and kept for the ``max-age`` the server
+sends, then revalidated with ``If-None-Match``. A token signed with an unknown
+``kid`` (a freshly rotated key) triggers an early refresh. Concurrent callers
+share one in-flight request, and fetches after the first are at most one per
+``min_refresh_interval``, so garbage tokens or a ``max-age=0`` server cannot
+hammer the endpoint.
+"""
+import asyncio
+import re
+import time
+
+import httpx
+import jwt
+
+ALLOWED_ALGORITHMS = ("EdDSA", "ES256")
+
+
+class JWKSVerifier:
+    def __init__(self, jwks_url: str, default_max_age: float = 300, min_refresh_interval: float = 30,
+                 leeway: float = 0, client: httpx.AsyncClient | None = None):
+        self.jwks_url = jwks_url
+        self.default_max_age = default_max_age
+        self.min_refresh_interval = min_refresh_interval
+        self.leeway = leeway
+        self._client = client
+        self._keys = {}
+        self._etag = None
+        self._expires_at = 0.0
+        self._last_attempt = None
+        self._refreshing = None
+
+    async def verify(self, token: str, scope: str | None = "access_token") -> dict:
+        """
+        Verifies a token's signature, expiry and scope against the published keys.
+
+        Returns:
+            dict: The token claims.
+
+        Raises:
+            jwt.InvalidTokenError: If the token is malformed, expired, signed with an
+                unknown key or has another scope.
+        """
+        kid = jwt.get_unverified_header(token).get("kid")
+        key = await self._key(kid)
+        if key is None:
+            raise jwt.InvalidTokenError(f"Unknown signing key: {kid}")
+        claims = jwt.decode(token, key.key, algorithms=[key.algorithm_name], leeway=self.leeway,
+                            options={"require": ["exp", "sub"], "verify_aud": False})
+        if scope is not None and claims.get("scope") != scope:
+            raise jwt.InvalidTokenError("Invalid token scope")
+        return claims
+
+    async def _key(self, kid):
+        if self._refreshing is not None:
+            await asyncio.shield(self._refreshing)
+        else:
+            now = time.monotonic()
+            stale = now >= self._expires_at or kid not in self._keys
+            if stale and (self._last_attempt is None or now - self._last_attempt >= self.min_refresh_interval):
+                await self.refresh()
+        return self._keys.get(kid)
+
+    async def refresh(self) -> None:
+        """
+        Fetches the key set now; callers arriving while a fetch is running share it.
+        """
+        if self._refreshing is None:
+            self._refreshing = asyncio.ensure_future(self._fetch())
+        await asyncio.shield(self._refreshing)
+
+    async def _fetch(self) -> None:
+        self._last_attempt = time.monotonic()
+        try:
+            headers = {"If-None-Match": self._etag} if self._etag else {}
+            client = self._client or httpx.AsyncClient(timeout=5)
+            try:
+                response = await client.get(self.jwks_url, headers=headers)
+            finally:
+                if self._client is None:
+                    await client.aclose()
+            fetched_at = time.monotonic()
+            if response.status_code != 304:
+                response.raise_for_status()
+                keys = {}
+                for jwk in response.json().get("keys", []):
+                    if jwk.get("alg") in ALLOWED_ALGORITHMS:
+                        keys[jwk.get("kid")] = jwt.PyJWK(jwk)
+                self._keys = keys
+                self._etag = response.headers.get("etag")
+            self._expires_at = fetched_at + self._max_age(response.headers.get("cache-control", ""))
+        finally:
+            self._refreshing = None
+
+    def _max_age(self, cache_control: str) -> float:
+        match = re.search(r"max-age=(\d+)", cache_control)
+        return float(match.group(1)) if match else self.default_max_age
@@ -0,0 +1,173 @@
+"""
+Write-behind buffer for non-critical per-row updates.
+
+Fields like ``users.last_login_at`` change on every login but nothing reads
+them on the request path, so committing them there only adds latency and WAL.
+``record`` merges the new values into an in-process dict keyed by row (the
+latest value per column wins) and returns immediately; a background task
+flushes the dict every ``flush_interval`` seconds, or as soon as it holds
+``max_pending`` rows, in one transaction:
+
+* on PostgreSQL one ``UPDATE ... FROM (VALUES ...)`` per batch;
+* elsewhere one executemany ``UPDATE ... WHERE key = ?`` per batch.
+
+``stop`` flushes what is left, so a clean shutdown loses nothing; a crash
+loses at most one interval of updates. A failed flush puts its rows back
+(values recorded since then win) and is retried on the next interval.
+
+Only use it for columns that may lag behind: cached copies of the row are
+not invalidated by a flush.
+"""
+import asyncio
+import logging
+import time
+
+from sqlalchemy import Table, bindparam, column, update, values
+
+from database.models import User
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindBuffer:
+    def __init__(self, table: Table, key: str, flush_interval: float = 5, max_pending: int = 10000,
+                 batch_size: int = 1000):
+        self.table = table
+        self.key = key
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self._pending = {}
+        self._engine = None
+        self._task = None
+        self._wakeup = None
+        self._flush_lock = asyncio.Lock()
+        self.recorded = 0
+        self.flushed = 0
+        self.batches = 0
+        self.failures = 0
+        self.dropped = 0
+        self.last_flush_seconds = 0.0
+
+    def record(self, key, **values) -> None:
+        """
+        Buffers ``values`` for the row whose key column equals ``key``.
+        """
+        self.recorded += 1
+        pending = self._pending.get(key)
+        if pending is None:
+            self._pending[key] = values
+        else:
+            pending.update(values)
+        if len(self._pending) >= self.max_pending and self._wakeup is not None:
+            self._wakeup.set()
+
+    def _statement(self, dialect: str, names: tuple, rows: list[dict]):
+        key_column = self.table.c[self.key]
+        if dialect == "postgresql":
+            pending = values(column(self.key, key_column.type),
+                             *(column(name, self.table.c[name].type) for name in names),
+                             name="pending").data([(row[self.key], *(row[name] for name in names)) for row in rows])
+            return update(self.table).where(key_column == pending.c[self.key]).values(
+                {name: pending.c[name] for name in names}), None
+        # Bind names must differ from column names in an UPDATE's SET clause.
+        statement = update(self.table).where(key_column == bindparam("k_" + self.key)).values(
+            {name: bindparam("v_" + name) for name in names})
+        parameters = [{"k_" + self.key: row[self.key], **{"v_" + name: row[name] for name in names}}
+                      for row in rows]
+        return statement, parameters
+
+    async def _write(self, batch: dict) -> None:
+        # Rows recorded with different column sets need different statements.
+        groups = {}
+        for key, row_values in batch.items():
+            groups.setdefault(tuple(sorted(row_values)), []).append({self.key: key, **row_values})
+        async with self._engine.begin() as connection:
+            dialect = connection.dialect.name
+            for names, rows in groups.items():
+                for offset in range(0, len(rows), self.batch_size):
+                    statement, parameters = self._statement(dialect, names, rows[offset:offset + self.batch_size])
+                    await connection.execute(statement, parameters)
+                    self.batches += 1
+
+    def _restore(self, batch: dict) -> None:
+        for key, row_values in batch.items():
+            newer = self._pending.get(key)
+            self._pending[key] = {**row_values, **newer} if newer else row_values
+        overflow = len(self._pending) - 2 * self.max_pending
+        if overflow > 0:
+            # Dicts keep insertion order: drop the rows buffered longest ago.
+            for key in list(self._pending)[:overflow]:
+                del self._pending[key]
+            self.dropped += overflow
+            logger.warning(f"Write-behind buffer for {self.table.name} dropped {overflow} rows")
+
+    async def flush(self) -> int:
+        """
+        Writes every buffered row.
+
+        Returns:
+            int: The number of rows written.
+        """
+        async with self._flush_lock:
+            if not self._pending or self._engine is None:
+                return 0
+            batch, self._pending = self._pending, {}
+            started = time.perf_counter()
+            try:
+                await self._write(batch)
+            except BaseException as e:
+                self.failures += 1
+                self._restore(batch)
+                if not isinstance(e, Exception):
+                    raise
+                logger.warning(f"Write-behind flush of {len(batch)} {self.table.name} rows failed: {e}")
+                return 0
+            self.last_flush_seconds = time.perf_counter() - started
+            self.flushed += len(batch)
+            return len(batch)
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "recorded": self.recorded,
+            "flushed": self.flushed,
+            "batches": self.batches,
+            "failures": self.failures,
+            "dropped": self.dropped,
+            "last_flush_seconds": self.last_flush_seconds,
+        }
+
+    async def start(self, engine) -> None:
+        self._engine = engine
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        """
+        Stops the flush task and writes what is still buffered.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+        self._wakeup = None
+
+    async def _flush_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+
+user_updates = WriteBehindBuffer(
+    User.__table__, "email",
+    flush_interval=settings.WRITE_BEHIND_FLUSH_SECONDS,
+    max_pending=settings.WRITE_BEHIND_MAX_PENDING,
+    batch_size=settings.WRITE_BEHIND_BATCH_SIZE,
+)
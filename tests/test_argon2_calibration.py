@@ -0,0 +1,36 @@
+import unittest
+from unittest.mock import patch
+
+from services import argon2_calibration
+
+
+def fake_benchmark(time_cost, memory_cost, parallelism, rounds):
+    latency = time_cost * memory_cost / (1024 * 1000)
+    return {"time_cost": time_cost, "memory_cost": memory_cost, "parallelism": parallelism,
+            "p50": latency, "p99": latency * 1.5}
+
+
+class TestCalibration(unittest.TestCase):
+
+    @patch('services.argon2_calibration.benchmark', side_effect=fake_benchmark)
+    def test_picks_strongest_candidate_within_targets(self, mock_benchmark):
+        best, results = argon2_calibration.calibrate(0.25, 0.5, max_memory_mb=64, max_parallelism=1)
+
+        self.assertLessEqual(best["p50"], 0.25)
+        self.assertLessEqual(best["p99"], 0.5)
+        self.assertLessEqual(best["memory_cost"], 64 * 1024)
+        self.assertTrue(all(r["memory_cost"] <= 64 * 1024 for r in results))
+
+    @patch('services.argon2_calibration.benchmark', side_effect=fake_benchmark)
+    def test_no_candidate(self, mock_benchmark):
+        best, _ = argon2_calibration.calibrate(0.0001, 0.0001, max_memory_mb=16, max_parallelism=1)
+
+        self.assertIsNone(best)
+
+    def test_percentile(self):
+        self.assertEqual(argon2_calibration.percentile([3, 1, 2], 50), 2)
+        self.assertEqual(argon2_calibration.percentile([1, 2, 3], 99), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
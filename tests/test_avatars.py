@@ -0,0 +1,79 @@
+import io
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import AsyncMock
+
+from fastapi import HTTPException, UploadFile
+from PIL import Image
+
+from services.avatars import AvatarService, avatar_key, spool_upload
+from services.storage import LocalAvatarStorage
+
+
+def make_upload(data: bytes) -> UploadFile:
+    return UploadFile(file=io.BytesIO(data), filename="avatar.png")
+
+
+def make_png(width=400, height=300) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), "red").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class TestAvatarService(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.storage = LocalAvatarStorage(self.tmp.name, "/static/avatars")
+        self.service = AvatarService(self.storage, max_bytes=1024 * 1024, workers=1)
+
+    def tearDown(self):
+        self.service.shutdown()
+        self.tmp.cleanup()
+
+    async def test_renders_square_webp_sizes(self):
+        urls = await self.service.process(make_upload(make_png()))
+
+        self.assertEqual(sorted(urls), [64, 128, 256])
+        for size, url in urls.items():
+            self.assertTrue(url.startswith("/static/avatars/") and url.endswith(f"/{size}.webp"))
+            path = Path(self.tmp.name) / url.removeprefix("/static/avatars/")
+            with Image.open(path) as image:
+                self.assertEqual(image.format, "WEBP")
+                self.assertEqual(image.size, (size, size))
+
+    async def test_identical_upload_is_deduplicated(self):
+        data = make_png()
+        first = await self.service.process(make_upload(data))
+        self.storage.save = AsyncMock()
+
+        second = await self.service.process(make_upload(data))
+
+        self.assertEqual(first, second)
+        self.storage.save.assert_not_awaited()
+        self.assertEqual((self.service.processed, self.service.deduplicated), (1, 1))
+
+    async def test_rejects_non_image(self):
+        with self.assertRaises(HTTPException) as ctx:
+            await self.service.process(make_upload(b"not an image"))
+        self.assertEqual(ctx.exception.status_code, 400)
+
+    async def test_rejects_oversized_upload_while_streaming(self):
+        with self.assertRaises(HTTPException) as ctx:
+            await spool_upload(make_upload(b"x" * 2048), max_bytes=1024)
+        self.assertEqual(ctx.exception.status_code, 413)
+
+    async def test_spool_digest_matches_content(self):
+        import hashlib
+
+        data = make_png()
+        spool, digest = await spool_upload(make_upload(data), max_bytes=len(data))
+        with spool:
+            self.assertEqual(spool.read(), data)
+        self.assertEqual(digest, hashlib.sha256(data).hexdigest())
+        self.assertEqual(avatar_key(digest, 64), f"avatars/{digest}/64.webp")
+
+
+if __name__ == '__main__':
+    unittest.main()
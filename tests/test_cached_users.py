@@ -0,0 +1,126 @@
+import asyncio
+import unittest
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock, patch, ANY
+
+from database.models import User
+from repository import cached_users
+
+
+def make_user(email="test@example.com"):
+    return User(id=1, username="test_user", email=email, password="hash",
+                created_at=datetime(2024, 9, 18, 15, 33, 35), confirmed=True)
+
+
+class TestSerialization(unittest.TestCase):
+
+    def test_round_trip_keeps_datetime(self):
+        user = cached_users.deserialize(cached_users.serialize(make_user()))
+
+        self.assertEqual(user.email, "test@example.com")
+        self.assertEqual(user.created_at, datetime(2024, 9, 18, 15, 33, 35))
+        self.assertTrue(user.confirmed)
+
+    def test_key_is_namespaced_and_versioned(self):
+        key = cached_users.user_key("test@example.com")
+
+        self.assertTrue(key.startswith(f"users:g{cached_users._generation}:v{cached_users.SCHEMA_VERSION}."))
+        self.assertTrue(key.endswith(":email:test@example.com"))
+
+
+class TestCachedUsers(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.redis = MagicMock()
+        self.redis.mget = AsyncMock()
+        self.redis.get = AsyncMock(return_value=None)
+        self.redis.set = AsyncMock(return_value=True)
+        self.redis.delete = AsyncMock()
+        self.redis.incr = AsyncMock(return_value=3)
+        self.pipe = MagicMock()
+        self.pipe.execute = AsyncMock()
+        self.redis.pipeline.return_value.__aenter__ = AsyncMock(return_value=self.pipe)
+        self.redis.pipeline.return_value.__aexit__ = AsyncMock(return_value=False)
+        patcher = patch('repository.cached_users.get_redis', new=AsyncMock(return_value=self.redis))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch('repository.cached_users.repository_users.get_users_by_emails', new_callable=AsyncMock)
+    async def test_hit_skips_database(self, mock_get_users):
+        self.redis.mget.return_value = [cached_users.serialize(make_user())]
+
+        user = await cached_users.get_user_by_email("test@example.com", MagicMock())
+
+        self.assertEqual(user.email, "test@example.com")
+        mock_get_users.assert_not_awaited()
+
+    @patch('repository.cached_users.repository_users.get_users_by_emails', new_callable=AsyncMock)
+    async def test_multi_get_loads_only_misses(self, mock_get_users):
+        self.redis.mget.return_value = [cached_users.serialize(make_user("a@example.com")), None, None]
+        mock_get_users.return_value = [make_user("b@example.com")]
+
+        users = await cached_users.get_users_by_emails(
+            ["a@example.com", "b@example.com", "c@example.com"], MagicMock())
+
+        self.assertEqual(set(users), {"a@example.com", "b@example.com"})
+        mock_get_users.assert_awaited_once_with(["b@example.com", "c@example.com"], ANY)
+        self.pipe.set.assert_called_once()
+
+    @patch('repository.cached_users.repository_users.get_user_by_email', new_callable=AsyncMock)
+    async def test_redis_failure_falls_back_to_database(self, mock_get_user):
+        self.redis.mget.side_effect = ConnectionError("down")
+        self.redis.set.side_effect = ConnectionError("down")
+        mock_get_user.return_value = make_user()
+
+        user = await cached_users.get_user_by_email("test@example.com", MagicMock())
+
+        self.assertEqual(user.email, "test@example.com")
+
+    @patch('repository.cached_users.repository_users.get_user_by_email')
+    async def test_concurrent_misses_query_once(self, mock_get_user):
+        self.redis.mget.return_value = [None]
+
+        async def slow_lookup(email, db):
+            await asyncio.sleep(0.01)
+            return make_user(email)
+
+        mock_get_user.side_effect = slow_lookup
+
+        users = await asyncio.gather(*[cached_users.get_user_by_email("test@example.com", MagicMock())
+                                       for _ in range(5)])
+
+        self.assertEqual(mock_get_user.call_count, 1)
+        self.assertTrue(all(user.email == "test@example.com" for user in users))
+        self.redis.delete.assert_awaited_once_with(cached_users.lock_key("test@example.com"))
+
+    @patch('repository.cached_users.repository_users.get_user_by_email', new_callable=AsyncMock)
+    async def test_lock_holder_elsewhere_fills_cache(self, mock_get_user):
+        self.redis.mget.return_value = [None]
+        self.redis.set.return_value = None
+        self.redis.get.return_value = cached_users.serialize(make_user())
+
+        user = await cached_users.get_user_by_email("test@example.com", MagicMock())
+
+        self.assertEqual(user.email, "test@example.com")
+        mock_get_user.assert_not_awaited()
+
+    async def test_bump_generation_changes_keys(self):
+        old_key = cached_users.user_key("test@example.com")
+
+        await cached_users.bump_generation()
+
+        self.assertEqual(cached_users._generation, 3)
+        self.assertNotEqual(cached_users.user_key("test@example.com"), old_key)
+        cached_users._generation = 0
+
+    @patch('repository.cached_users.repository_users.confirmed_email', new_callable=AsyncMock)
+    async def test_write_invalidates(self, mock_confirmed_email):
+        await cached_users.confirmed_email("test@example.com", MagicMock())
+
+        mock_confirmed_email.assert_awaited_once()
+        self.redis.delete.assert_awaited_once_with(cached_users.user_key("test@example.com"))
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import asyncio
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from services.hashing import PasswordHasher, HashingOverloaded
+
+
+def make_hasher(**kwargs):
+    options = dict(time_cost=1, memory_cost=1024, parallelism=1, pool_size=2,
+                   memory_budget_mb=64, queue_size=4, queue_timeout=1,
+                   executor=ThreadPoolExecutor(max_workers=2))
+    options.update(kwargs)
+    return PasswordHasher(**options)
+
+
+class TestPasswordHasher(unittest.IsolatedAsyncioTestCase):
+
+    async def test_hash_and_verify(self):
+        hasher = make_hasher()
+
+        hashed = await hasher.hash("secret1")
+
+        self.assertTrue(hashed.startswith("$argon2"))
+        self.assertTrue(await hasher.verify("secret1", hashed))
+        self.assertFalse(await hasher.verify("wrong", hashed))
+        hasher.shutdown()
+
+    def test_memory_budget_limits_concurrency(self):
+        hasher = make_hasher(memory_cost=102400, pool_size=8, memory_budget_mb=250)
+
+        self.assertEqual(hasher.max_concurrency, 2)
+
+    async def test_full_queue_is_rejected(self):
+        hasher = make_hasher(pool_size=1, queue_size=0)
+        hasher._semaphore = asyncio.Semaphore(0)
+
+        with self.assertRaises(HashingOverloaded) as context:
+            await hasher.hash("secret1")
+
+        self.assertEqual(context.exception.status_code, 503)
+        self.assertIn("Retry-After", context.exception.headers)
+
+    async def test_queue_wait_times_out(self):
+        hasher = make_hasher(pool_size=1, queue_timeout=0.05)
+        hasher._semaphore = asyncio.Semaphore(0)
+
+        with self.assertRaises(HashingOverloaded):
+            await hasher.hash("secret1")
+
+        self.assertEqual(hasher.waiting, 0)
+
+    async def test_cancelled_caller_keeps_slot_until_job_ends(self):
+        hasher = make_hasher(pool_size=1)
+        started, finish = threading.Event(), threading.Event()
+
+        def slow_hash(params, password):
+            started.set()
+            finish.wait(5)
+            return "hashed"
+
+        task = asyncio.create_task(hasher._run("hash", slow_hash, "secret1"))
+        await asyncio.to_thread(started.wait, 5)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+
+        self.assertEqual(hasher.in_flight, 1)
+        self.assertTrue(hasher._semaphore.locked())
+
+        finish.set()
+        for _ in range(100):
+            if hasher.in_flight == 0:
+                break
+            await asyncio.sleep(0.01)
+
+        self.assertEqual(hasher.in_flight, 0)
+        self.assertFalse(hasher._semaphore.locked())
+        hasher.shutdown()
+
+
+class TestRehashOnLogin(unittest.TestCase):
+
+    def test_needs_rehash_for_outdated_parameters(self):
+        from passlib.context import CryptContext
+        from services.auth import auth_service
+
+        old_hash = CryptContext(schemes=["argon2"], argon2__time_cost=1,
+                                argon2__memory_cost=1024, argon2__parallelism=1).hash("secret1")
+
+        self.assertTrue(auth_service.needs_rehash(old_hash))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+from unittest.mock import AsyncMock, patch
+
+import httpx
+from fastapi import FastAPI
+
+from database.db import get_db
+from database.models import User
+from routes.auth import router as auth_router
+from services.auth import auth_service
+from services.principal_cache import PrincipalCache
+from services.revocation import RevocationList
+from settings import settings
+
+
+def make_user(email):
+    return User(id=hash(email) % 1000, username=email.split("@")[0], email=email, password="hash", confirmed=True)
+
+
+class TestIntrospect(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        app = FastAPI()
+        app.include_router(auth_router)
+        app.dependency_overrides[get_db] = lambda: None
+        self.client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+        self.principal_cache = PrincipalCache(maxsize=10, ttl=60)
+        self.revocations = RevocationList(watermark_ttl=900)
+        for target, value in (("services.auth.principal_cache", self.principal_cache),
+                              ("services.auth.revocation_list", self.revocations)):
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        for name, value in (("INTROSPECTION_CLIENT_SECRET", "gateway-secret"), ("RATE_LIMIT_ENABLED", False)):
+            patcher = patch.object(settings, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.headers = {"X-Introspection-Secret": "gateway-secret"}
+
+    async def asyncTearDown(self):
+        await self.client.aclose()
+
+    async def test_batch_resolves_users_with_one_lookup(self):
+        cached = make_user("cached@example.com")
+        self.principal_cache.put(cached)
+        tokens = [await auth_service.create_access_token(data={"sub": email})
+                  for email in ("a@example.com", "cached@example.com", "a@example.com", "gone@example.com")]
+        revoked = await auth_service.create_access_token(data={"sub": "a@example.com"})
+        await self.revocations.revoke_token(auth_service.decode_access_payload(revoked)["jti"], 2 ** 31)
+        refresh = await auth_service.create_refresh_token(data={"sub": "a@example.com"})
+        lookup = AsyncMock(return_value={"a@example.com": make_user("a@example.com")})
+
+        with patch("services.auth.cached_users.get_users_by_emails", lookup):
+            response = await self.client.post("/auth/introspect", headers=self.headers,
+                                              json={"tokens": tokens + [revoked, refresh, "garbage"]})
+
+        self.assertEqual(response.status_code, 200)
+        results = response.json()["results"]
+        self.assertEqual([result["active"] for result in results], [True, True, True, False, False, False, False])
+        self.assertEqual(results[1]["username"], "cached")
+        self.assertEqual(results[0]["scope"], "access_token")
+        lookup.assert_awaited_once()
+        self.assertEqual(sorted(lookup.await_args.args[0]), ["a@example.com", "gone@example.com"])
+        self.assertRegex(response.headers["cache-control"], r"^private, max-age=[0-5]$")
+
+    async def test_batch_size_is_limited(self):
+        response = await self.client.post("/auth/introspect", headers=self.headers, json={"tokens": ["x"] * 101})
+
+        self.assertEqual(response.status_code, 422)
+
+    async def test_caller_must_present_the_client_secret(self):
+        token = await auth_service.create_access_token(data={"sub": "a@example.com"})
+
+        for headers in ({}, {"X-Introspection-Secret": "wrong"}):
+            response = await self.client.post("/auth/introspect", headers=headers, json={"tokens": [token]})
+            self.assertEqual(response.status_code, 401)
+
+        with patch.object(settings, "INTROSPECTION_CLIENT_SECRET", ""):
+            response = await self.client.post("/auth/introspect", headers=self.headers, json={"tokens": [token]})
+        self.assertEqual(response.status_code, 401)
+
+
+if __name__ == '__main__':
+    unittest.main()
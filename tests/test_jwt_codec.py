@@ -0,0 +1,89 @@
+import time
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from jose import JWTError
+
+from services.jwt_codec import (HmacBackend, InvalidToken, JoseBackend, PyJWTBackend, TokenCodec,
+                                VerifiedTokenCache)
+
+SECRET = "test-secret-key-" + "0123456789abcdef" * 4
+
+
+def claims(minutes=15):
+    now = datetime.utcnow()
+    return {"sub": "test@example.com", "iat": now, "exp": now + timedelta(minutes=minutes),
+            "scope": "access_token"}
+
+
+class TestBackends(unittest.TestCase):
+    backends = (JoseBackend, PyJWTBackend, HmacBackend)
+
+    def test_tokens_are_interchangeable_between_backends(self):
+        for encoder in self.backends:
+            token = encoder().encode(claims(), SECRET, "HS256")
+            for decoder in self.backends:
+                with self.subTest(encoder=encoder.name, decoder=decoder.name):
+                    payload = decoder().decode(token, SECRET, ["HS256"])
+                    self.assertEqual(payload["sub"], "test@example.com")
+                    self.assertIsInstance(payload["exp"], int)
+
+    def test_rejects_bad_signature_expiry_and_algorithm(self):
+        for backend in self.backends:
+            with self.subTest(backend=backend.name):
+                codec = backend()
+                with self.assertRaises(JWTError):
+                    codec.decode(codec.encode(claims(), SECRET[::-1], "HS256"), SECRET, ["HS256"])
+                with self.assertRaises(InvalidToken):
+                    codec.decode(codec.encode(claims(minutes=-1), SECRET, "HS256"), SECRET, ["HS256"])
+                with self.assertRaises(InvalidToken):
+                    codec.decode(codec.encode(claims(), SECRET, "HS512"), SECRET, ["HS256"])
+
+    def test_hmac_rejects_malformed_tokens(self):
+        for token in ("", "abc", "a.b.c", "e30.e30."):
+            with self.assertRaises(InvalidToken):
+                HmacBackend().decode(token, SECRET, ["HS256"])
+
+
+class TestTokenCodec(unittest.TestCase):
+
+    def test_cache_skips_verification_on_repeat(self):
+        codec = TokenCodec(HmacBackend(), SECRET, "HS256", cache_size=10)
+        token = codec.encode(claims())
+
+        with patch.object(codec.backend, "decode", wraps=codec.backend.decode) as decode:
+            first = codec.decode(token)
+            second = codec.decode(token)
+
+        self.assertEqual(first, second)
+        self.assertEqual(decode.call_count, 1)
+        self.assertEqual(codec.cache.stats()["hits"], 1)
+
+    def test_cache_bypass(self):
+        codec = TokenCodec(HmacBackend(), SECRET, "HS256", cache_size=10)
+        token = codec.encode(claims())
+
+        codec.decode(token, use_cache=False)
+
+        self.assertEqual(codec.cache.stats()["size"], 0)
+
+    def test_cached_entry_expires_with_token(self):
+        cache = VerifiedTokenCache(maxsize=10)
+        cache.put("token", {"sub": "a", "exp": time.time() - 1})
+
+        self.assertIsNone(cache.get("token"))
+
+    def test_cache_is_bounded_and_returns_copies(self):
+        cache = VerifiedTokenCache(maxsize=2)
+        exp = time.time() + 60
+        for name in ("a", "b", "c"):
+            cache.put(name, {"sub": name, "exp": exp})
+
+        self.assertIsNone(cache.get("a"))
+        cache.get("c")["sub"] = "mutated"
+        self.assertEqual(cache.get("c")["sub"], "c")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+import asyncio
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from pathlib import Path
+from unittest.mock import patch
+
+import httpx
+import jwt
+from fastapi import FastAPI
+
+from routes.jwks import router as jwks_router
+from services.jwt_codec import HmacBackend, InvalidToken
+from services.jwt_keys import KeySet, create_token_codec, generate, main as keys_main
+from services.token_verifier import JWKSVerifier
+
+SECRET = "test-secret-key-0123456789abcdef-0123456789abcdef"
+
+
+def claims(minutes=15):
+    now = datetime.utcnow()
+    return {"sub": "test@example.com", "iat": now, "exp": now + timedelta(minutes=minutes),
+            "scope": "access_token"}
+
+
+class TestKeySet(unittest.TestCase):
+
+    def test_signs_with_first_key_and_verifies_all(self):
+        for algorithm in ("EdDSA", "ES256"):
+            with self.subTest(algorithm=algorithm):
+                old_key, new_key = generate(algorithm), generate(algorithm)
+                old_codec = create_token_codec("pyjwt", SECRET, "HS256", KeySet(old_key), 10, accept_hmac=False)
+                new_codec = create_token_codec("pyjwt", SECRET, "HS256", KeySet(new_key, [old_key.public_key()]),
+                                               10, accept_hmac=False)
+
+                token = new_codec.encode(claims())
+                self.assertEqual(jwt.get_unverified_header(token)["alg"], algorithm)
+                self.assertEqual(jwt.get_unverified_header(token)["kid"], new_codec.kid)
+                self.assertEqual(new_codec.decode(old_codec.encode(claims()))["sub"], "test@example.com")
+                with self.assertRaises(InvalidToken):
+                    old_codec.decode(token)
+
+    def test_legacy_hmac_tokens(self):
+        key_set = KeySet(generate("EdDSA"))
+        legacy_token = HmacBackend().encode(claims(), SECRET, "HS256")
+
+        accepting = create_token_codec("pyjwt", SECRET, "HS256", key_set, 10, accept_hmac=True)
+        rejecting = create_token_codec("pyjwt", SECRET, "HS256", key_set, 10, accept_hmac=False)
+
+        self.assertEqual(accepting.decode(legacy_token)["sub"], "test@example.com")
+        with self.assertRaises(InvalidToken):
+            rejecting.decode(legacy_token)
+
+    def test_asymmetric_keys_require_pyjwt(self):
+        with self.assertRaises(ValueError):
+            create_token_codec("jose", SECRET, "HS256", KeySet(generate("ES256")), 10, accept_hmac=True)
+
+    def test_without_keys_signs_hmac(self):
+        codec = create_token_codec("hmac", SECRET, "HS256", KeySet(), 10, accept_hmac=True)
+
+        self.assertEqual(jwt.get_unverified_header(codec.encode(claims()))["alg"], "HS256")
+        self.assertEqual(KeySet().document, b'{"keys":[]}')
+
+    def test_generate_command_and_loading(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "jwt.pem"
+            keys_main(["generate", "--algorithm", "ES256", str(path)])
+
+            key_set = KeySet.from_files([str(path)])
+
+        self.assertEqual(key_set.signing_algorithm, "ES256")
+        self.assertEqual(list(key_set.keys), [key_set.signing_kid])
+
+
+class TestJWKSEndpoint(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.key_set = KeySet(generate("EdDSA"))
+        self.codec = create_token_codec("pyjwt", SECRET, "HS256", self.key_set, 10, accept_hmac=False)
+        app = FastAPI()
+        app.include_router(jwks_router)
+        self.client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+        patcher = patch("services.auth.auth_service.key_set", self.key_set)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def asyncTearDown(self):
+        await self.client.aclose()
+
+    async def test_etag_and_conditional_request(self):
+        response = await self.client.get("/.well-known/jwks.json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["keys"][0]["kid"], self.key_set.signing_kid)
+        self.assertIn("max-age=", response.headers["cache-control"])
+
+        cached = await self.client.get("/.well-known/jwks.json", headers={"If-None-Match": response.headers["etag"]})
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached.content, b"")
+
+    async def test_verifier_checks_tokens_offline(self):
+        verifier = JWKSVerifier("http://test/.well-known/jwks.json", client=self.client)
+
+        with patch.object(self.client, "get", wraps=self.client.get) as get:
+            for _ in range(3):
+                self.assertEqual((await verifier.verify(self.codec.encode(claims())))["sub"], "test@example.com")
+            self.assertEqual(get.call_count, 1)
+
+        with self.assertRaises(jwt.InvalidTokenError):
+            await verifier.verify(self.codec.encode(claims(minutes=-1)))
+        with self.assertRaises(jwt.InvalidTokenError):
+            await verifier.verify(self.codec.encode({**claims(), "scope": "refresh_token"}))
+
+    async def test_verifier_shares_and_rate_limits_refreshes(self):
+        verifier = JWKSVerifier("http://test/.well-known/jwks.json", client=self.client)
+        other = create_token_codec("pyjwt", SECRET, "HS256", KeySet(generate("EdDSA")), 10, accept_hmac=False)
+
+        with patch.object(self.client, "get", wraps=self.client.get) as get:
+            results = await asyncio.gather(*(verifier.verify(self.codec.encode(claims())) for _ in range(5)))
+            self.assertEqual(len(results), 5)
+            for _ in range(3):
+                with self.assertRaises(jwt.InvalidTokenError):
+                    await verifier.verify(other.encode(claims()))
+
+            self.assertEqual(get.call_count, 1)
+
+    async def test_verifier_rejects_unknown_kid(self):
+        verifier = JWKSVerifier("http://test/.well-known/jwks.json", client=self.client)
+        other = create_token_codec("pyjwt", SECRET, "HS256", KeySet(generate("EdDSA")), 10, accept_hmac=False)
+
+        with self.assertRaises(jwt.InvalidTokenError):
+            await verifier.verify(other.encode(claims()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+import asyncio
+import unittest
+from pathlib import Path
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import aiosmtplib
+from fastapi_mail import ConnectionConfig
+
+from services.mail_queue import MailDispatcher, MailMessage, MailQueueFull
+
+config = ConnectionConfig(
+    MAIL_USERNAME="user",
+    MAIL_PASSWORD="password",
+    MAIL_FROM="noreply@example.com",
+    MAIL_PORT=2525,
+    MAIL_SERVER="localhost",
+    MAIL_STARTTLS=False,
+    MAIL_SSL_TLS=False,
+    USE_CREDENTIALS=True,
+    TEMPLATE_FOLDER=Path(__file__).parent.parent / "services" / "templates",
+)
+
+
+def make_message(i=0):
+    return MailMessage(recipient=f"user{i}@example.com", subject="Confirm your email ",
+                       template_name="email_template.html",
+                       template_body={"host": "http://localhost/", "username": "user", "token": "token"})
+
+
+def make_smtp():
+    smtp = MagicMock()
+    smtp.is_connected = True
+    smtp.connect = AsyncMock()
+    smtp.login = AsyncMock()
+    smtp.send_message = AsyncMock()
+    smtp.quit = AsyncMock()
+    return smtp
+
+
+class TestMailDispatcher(unittest.IsolatedAsyncioTestCase):
+
+    @patch('services.mail_queue.aiosmtplib.SMTP')
+    async def test_messages_share_one_connection(self, mock_smtp_class):
+        smtp = make_smtp()
+        mock_smtp_class.return_value = smtp
+        dispatcher = MailDispatcher(config, pool_size=1, batch_size=10)
+
+        for i in range(5):
+            await dispatcher.enqueue(make_message(i))
+        await dispatcher.stop()
+
+        self.assertEqual(dispatcher.sent, 5)
+        self.assertEqual(dispatcher.connections_opened, 1)
+        smtp.login.assert_awaited_once_with("user", "password")
+        self.assertEqual(smtp.send_message.await_count, 5)
+
+    @patch('services.mail_queue.aiosmtplib.SMTP')
+    async def test_retries_after_disconnect(self, mock_smtp_class):
+        smtp = make_smtp()
+        smtp.send_message.side_effect = [aiosmtplib.SMTPServerDisconnected("bye"), None]
+        mock_smtp_class.return_value = smtp
+        dispatcher = MailDispatcher(config, pool_size=1, retry_base_delay=0)
+
+        await dispatcher.enqueue(make_message())
+        await dispatcher.stop()
+
+        self.assertEqual(dispatcher.sent, 1)
+        self.assertEqual(dispatcher.retries, 1)
+        self.assertEqual(dispatcher.connections_opened, 2)
+
+    @patch('services.mail_queue.aiosmtplib.SMTP')
+    async def test_gives_up_after_max_retries(self, mock_smtp_class):
+        smtp = make_smtp()
+        smtp.send_message.side_effect = aiosmtplib.SMTPResponseException(451, "try later")
+        mock_smtp_class.return_value = smtp
+        dispatcher = MailDispatcher(config, pool_size=1, max_retries=2, retry_base_delay=0)
+
+        await dispatcher.enqueue(make_message())
+        await dispatcher.stop()
+
+        self.assertEqual(dispatcher.failed, 1)
+        self.assertEqual(smtp.send_message.await_count, 3)
+
+    async def test_backpressure_when_queue_is_full(self):
+        dispatcher = MailDispatcher(config, pool_size=1, queue_size=1, enqueue_timeout=0.01)
+        dispatcher._queue = asyncio.Queue(maxsize=1)
+        dispatcher._workers = [MagicMock()]
+        await dispatcher.enqueue(make_message())
+
+        with self.assertRaises(MailQueueFull):
+            await dispatcher.enqueue(make_message())
+
+    async def test_enqueue_nowait_rejects_when_full(self):
+        dispatcher = MailDispatcher(config, pool_size=1, queue_size=1)
+        dispatcher._queue = asyncio.Queue(maxsize=1)
+        dispatcher._workers = [MagicMock()]
+        dispatcher.enqueue_nowait(make_message())
+
+        with self.assertRaises(MailQueueFull):
+            dispatcher.enqueue_nowait(make_message())
+        self.assertTrue(dispatcher.full)
+
+    async def test_full_queue_is_reported_to_the_client(self):
+        from services import email
+
+        with patch.object(email.mail_dispatcher, "enqueue_nowait", side_effect=MailQueueFull("queue is full")), \
+                self.assertLogs("services.email", "WARNING") as logs, \
+                self.assertRaises(email.MailUnavailable) as context:
+            await email.send_reset_email("user@example.com", "token", "http://localhost/")
+
+        self.assertEqual(context.exception.status_code, 503)
+        self.assertIn("Retry-After", context.exception.headers)
+        self.assertIn("user@example.com", logs.output[0])
+
+    @patch('services.mail_queue.aiosmtplib.SMTP')
+    async def test_worker_survives_unexpected_errors(self, mock_smtp_class):
+        mock_smtp_class.return_value = make_smtp()
+        dispatcher = MailDispatcher(config, pool_size=1)
+        deliver = dispatcher._deliver
+        calls = []
+
+        async def flaky_deliver(smtp, message):
+            calls.append(message)
+            if len(calls) == 1:
+                raise RuntimeError("boom")
+            return await deliver(smtp, message)
+
+        loop = asyncio.get_running_loop()
+        first, second = make_message(0), make_message(1)
+        first.result, second.result = loop.create_future(), loop.create_future()
+        with patch.object(dispatcher, "_deliver", side_effect=flaky_deliver), \
+                self.assertLogs("services.mail_queue", "ERROR"):
+            await dispatcher.enqueue(first)
+            self.assertFalse(await first.result)
+            await dispatcher.enqueue(second)
+            self.assertTrue(await second.result)
+            await dispatcher.stop()
+
+        self.assertEqual(dispatcher.failed, 1)
+        self.assertEqual(dispatcher.sent, 1)
+
+    def test_render(self):
+        email = MailDispatcher(config).render(make_message())
+
+        self.assertEqual(email["To"], "user0@example.com")
+        self.assertIn("token", email.get_content())
+
+
+if __name__ == '__main__':
+    unittest.main()
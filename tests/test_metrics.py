@@ -0,0 +1,96 @@
+import unittest
+
+import fakeredis
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient
+from prometheus_client import REGISTRY
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from routes.metrics import router as metrics_router
+from services import metrics
+from services.redis_cache import InstrumentedRedis
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+class TestRouteMetrics(unittest.IsolatedAsyncioTestCase):
+
+    async def test_requests_are_labelled_by_route_template(self):
+        app = FastAPI()
+
+        @app.get("/items/{item_id}")
+        async def read_item(item_id: int):
+            return {"id": item_id}
+
+        app.include_router(metrics_router)
+        metrics.instrument_routes(app)
+        metrics.instrument_routes(app)
+        labels = dict(method="GET", route="/items/{item_id}", status="200")
+        before = sample("http_request_duration_seconds_count", **labels)
+
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+            for item_id in range(3):
+                await client.get(f"/items/{item_id}")
+            await client.get("/missing")
+            response = await client.get("/metrics")
+
+        self.assertEqual(sample("http_request_duration_seconds_count", **labels) - before, 3)
+        self.assertEqual(sample("http_requests_in_progress", method="GET", route="/items/{item_id}"), 0)
+        self.assertIsNone(REGISTRY.get_sample_value(
+            "http_request_duration_seconds_count", dict(method="GET", route="/missing", status="404")))
+        self.assertIn(b'route="/items/{item_id}"', response.content)
+
+
+class TestEngineMetrics(unittest.IsolatedAsyncioTestCase):
+
+    async def test_statements_are_timed_by_operation(self):
+        engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+        metrics.instrument_engine(engine, "test")
+        before = sample("db_query_duration_seconds_count", engine="test", operation="select")
+
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+            await conn.execute(text("select 2"))
+            with self.assertRaises(Exception):
+                await conn.execute(text("SELECT * FROM missing_table"))
+        await engine.dispose()
+
+        self.assertEqual(sample("db_query_duration_seconds_count", engine="test", operation="select") - before, 2)
+
+
+class TestRedisMetrics(unittest.IsolatedAsyncioTestCase):
+
+    async def test_commands_and_pipelines_are_timed(self):
+        redis = InstrumentedRedis(connection_pool=fakeredis.FakeAsyncRedis().connection_pool)
+        before_set = sample("redis_command_duration_seconds_count", command="SET")
+        before_pipeline = sample("redis_command_duration_seconds_count", command="PIPELINE")
+
+        await redis.set("key", "value")
+        async with redis.pipeline() as pipe:
+            pipe.get("key").incr("counter")
+            await pipe.execute()
+        await redis.aclose()
+
+        self.assertEqual(sample("redis_command_duration_seconds_count", command="SET") - before_set, 1)
+        self.assertEqual(sample("redis_command_duration_seconds_count", command="PIPELINE") - before_pipeline, 1)
+
+
+class TestComponentStats(unittest.TestCase):
+
+    def test_registered_sources_are_exported(self):
+        metrics.register_stats("test_component", lambda: {"hits": 7, "enabled": True, "name": "x"})
+        metrics.register_stats("broken_component", lambda: 1 / 0)
+
+        body, content_type = metrics.render()
+
+        self.assertIn("text/plain", content_type)
+        self.assertEqual(sample("app_component_stat", component="test_component", stat="hits"), 7)
+        self.assertIsNone(REGISTRY.get_sample_value("app_component_stat",
+                                                    dict(component="test_component", stat="enabled")))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import asyncio
+import json
+import unittest
+
+import fakeredis
+
+from services import outbox
+from services.mail_queue import MailMessage, MailQueueFull
+
+
+class FakeDispatcher:
+    def __init__(self, deliver=True):
+        self.deliver = deliver
+        self.messages = []
+
+    async def enqueue(self, message):
+        self.messages.append(message)
+        message.finish(self.deliver)
+
+
+class FullDispatcher(FakeDispatcher):
+    def __init__(self, capacity):
+        super().__init__()
+        self.capacity = capacity
+
+    async def enqueue(self, message):
+        if len(self.messages) >= self.capacity:
+            raise MailQueueFull("Mail queue is full")
+        await super().enqueue(message)
+
+
+def make_message():
+    return MailMessage(recipient="user@example.com", subject="Confirm your email ",
+                       template_name="email_template.html", template_body={"token": "token"})
+
+
+class TestOutbox(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.redis = fakeredis.FakeAsyncRedis()
+
+    async def asyncTearDown(self):
+        await self.redis.aclose()
+
+    def make_consumer(self, dispatcher, name="worker-1"):
+        return outbox.OutboxConsumer(self.redis, dispatcher, consumer_name=name, block_ms=10, claim_idle_ms=0)
+
+    async def test_publish_and_consume(self):
+        await outbox.publish(self.redis, make_message())
+        dispatcher = FakeDispatcher()
+        consumer = self.make_consumer(dispatcher)
+        await consumer.ensure_group()
+
+        await consumer.run_once()
+
+        self.assertEqual(len(dispatcher.messages), 1)
+        self.assertEqual(dispatcher.messages[0].template_body, {"token": "token"})
+        pending = await self.redis.xpending(outbox.STREAM, outbox.GROUP)
+        self.assertEqual(pending["pending"], 0)
+
+    async def test_redelivered_entry_is_not_sent_twice(self):
+        dedup = await outbox.publish(self.redis, make_message())
+        await self.redis.set(outbox.SENT_KEY_PREFIX + dedup, 1)
+        dispatcher = FakeDispatcher()
+        consumer = self.make_consumer(dispatcher)
+        await consumer.ensure_group()
+
+        await consumer.run_once()
+
+        self.assertEqual(dispatcher.messages, [])
+        self.assertEqual(consumer.duplicates, 1)
+
+    async def test_abandoned_entry_is_reclaimed(self):
+        await outbox.publish(self.redis, make_message())
+        crashed = self.make_consumer(FakeDispatcher(), name="crashed")
+        await crashed.ensure_group()
+        await self.redis.xreadgroup(outbox.GROUP, "crashed", {outbox.STREAM: ">"}, count=10)
+        dispatcher = FakeDispatcher()
+        consumer = self.make_consumer(dispatcher)
+
+        await consumer.run_once()
+
+        self.assertEqual(len(dispatcher.messages), 1)
+
+    async def test_failed_delivery_is_dead_lettered(self):
+        await outbox.publish(self.redis, make_message())
+        consumer = self.make_consumer(FakeDispatcher(deliver=False))
+        await consumer.ensure_group()
+
+        await consumer.run_once()
+
+        self.assertEqual(await self.redis.xlen(outbox.DEAD_LETTER_STREAM), 1)
+        self.assertEqual(consumer.dead_lettered, 1)
+
+    async def test_dead_letter_stream_is_capped(self):
+        for _ in range(250):
+            await outbox.publish(self.redis, make_message())
+        consumer = outbox.OutboxConsumer(self.redis, FakeDispatcher(deliver=False), consumer_name="worker-1",
+                                         batch_size=250, block_ms=10, claim_idle_ms=0, dead_letter_maxlen=10)
+        await consumer.ensure_group()
+
+        with self.assertLogs("services.outbox", "ERROR"):
+            await consumer.run_once()
+
+        self.assertEqual(consumer.dead_lettered, 250)
+        # Approximate trimming drops whole stream nodes (100 entries), never more than maxlen.
+        self.assertLess(await self.redis.xlen(outbox.DEAD_LETTER_STREAM), 250)
+        self.assertGreaterEqual(await self.redis.xlen(outbox.DEAD_LETTER_STREAM), 10)
+
+    async def test_full_dispatcher_leaves_entries_pending(self):
+        for _ in range(3):
+            await outbox.publish(self.redis, make_message())
+        dispatcher = FullDispatcher(capacity=1)
+        consumer = self.make_consumer(dispatcher)
+        await consumer.ensure_group()
+
+        with self.assertLogs("services.outbox", "WARNING"):
+            await consumer.run_once()
+
+        self.assertEqual(consumer.processed, 1)
+        self.assertEqual(consumer.deferred, 2)
+        pending = await self.redis.xpending(outbox.STREAM, outbox.GROUP)
+        self.assertEqual(pending["pending"], 2)
+
+        dispatcher.capacity = 3
+        await consumer.run_once()
+
+        self.assertEqual(consumer.processed, 3)
+        pending = await self.redis.xpending(outbox.STREAM, outbox.GROUP)
+        self.assertEqual(pending["pending"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from database.models import User
+from services.principal_cache import PrincipalCache, INVALIDATION_CHANNEL
+
+
+def make_user(email="test@example.com"):
+    return User(id=1, username="test_user", email=email, password="hash", confirmed=True)
+
+
+class TestPrincipalCache(unittest.IsolatedAsyncioTestCase):
+
+    def test_hit_returns_fresh_detached_copy(self):
+        cache = PrincipalCache(maxsize=10, ttl=60)
+        cache.put(make_user())
+
+        first = cache.get("test@example.com")
+        second = cache.get("test@example.com")
+
+        self.assertEqual(first.email, "test@example.com")
+        self.assertIsNot(first, second)
+        self.assertEqual(cache.stats()["hits"], 2)
+
+    def test_miss_and_expiry(self):
+        cache = PrincipalCache(maxsize=10, ttl=-1)
+        cache.put(make_user())
+
+        self.assertIsNone(cache.get("test@example.com"))
+        self.assertIsNone(cache.get("other@example.com"))
+        self.assertEqual(cache.stats()["misses"], 2)
+
+    def test_lru_eviction(self):
+        cache = PrincipalCache(maxsize=2, ttl=60)
+        cache.put(make_user("a@example.com"))
+        cache.put(make_user("b@example.com"))
+        cache.get("a@example.com")
+        cache.put(make_user("c@example.com"))
+
+        self.assertIsNone(cache.get("b@example.com"))
+        self.assertIsNotNone(cache.get("a@example.com"))
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    async def test_invalidate_broadcasts(self):
+        cache = PrincipalCache(maxsize=10, ttl=60)
+        cache.put(make_user())
+        cache._redis = AsyncMock()
+
+        await cache.invalidate("test@example.com")
+
+        self.assertIsNone(cache.get("test@example.com"))
+        cache._redis.publish.assert_awaited_once_with(INVALIDATION_CHANNEL, "test@example.com")
+
+    @patch('repository.users.principal_cache')
+    async def test_repository_write_invalidates(self, mock_cache):
+        from repository.users import update_totp_secret
+
+        mock_session = AsyncMock()
+        mock_session.execute.return_value.scalar = MagicMock(return_value="test@example.com")
+        mock_cache.invalidate = AsyncMock()
+
+        await update_totp_secret(1, "secret", mock_session)
+
+        mock_cache.invalidate.assert_awaited_once_with("test@example.com")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient
+
+from routes.profiles import router as profiles_router
+from services.profiling import ProfileStore, ProfilingMiddleware, StackSampler, make_token, verify_token
+
+SECRET = "profiling-secret"
+
+
+def busy_wait(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+async def slow_dependency():
+    await asyncio.sleep(0.05)
+
+
+class TestTokens(unittest.TestCase):
+
+    def test_token_round_trip_and_expiry(self):
+        self.assertTrue(verify_token(SECRET, make_token(SECRET, ttl=60)))
+        self.assertFalse(verify_token("other-secret", make_token(SECRET, ttl=60)))
+        self.assertFalse(verify_token(SECRET, make_token(SECRET, ttl=-1)))
+        self.assertFalse(verify_token("", make_token("", ttl=60)))
+        self.assertFalse(verify_token(SECRET, "garbage"))
+
+
+class TestProfilingMiddleware(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = ProfileStore(self.directory.name, keep=2)
+        self.sampler = StackSampler(interval=0.002)
+
+        app = FastAPI()
+
+        @app.get("/work/{item_id}")
+        async def work(item_id: int):
+            await slow_dependency()
+            busy_wait(0.03)
+            return {"id": item_id}
+
+        app.include_router(profiles_router)
+        app.add_middleware(ProfilingMiddleware, sampler=self.sampler, store=self.store, secret=SECRET)
+        self.client = AsyncClient(transport=ASGITransport(app=app), base_url="http://test")
+        self.token = make_token(SECRET)
+
+    async def asyncTearDown(self):
+        await self.client.aclose()
+        self.directory.cleanup()
+
+    async def test_requests_without_token_are_not_profiled(self):
+        response = await self.client.get("/work/1", headers={"X-Profile-Token": "1.bad"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("x-profile-id", response.headers)
+        self.assertFalse(self.sampler.running)
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+    async def test_profile_records_awaits_and_cpu_time(self):
+        response = await self.client.get("/work/1", headers={"X-Profile-Token": self.token})
+        profile_id = response.headers["x-profile-id"]
+
+        [meta] = self.store.list()
+        self.assertEqual(meta["id"], profile_id)
+        self.assertEqual(meta["route"], "/work/{item_id}")
+        self.assertEqual(meta["status"], 200)
+        self.assertGreater(meta["samples"], 0)
+        with open(self.store.path(profile_id)) as f:
+            collapsed = f.read()
+        self.assertIn("slow_dependency", collapsed)
+        self.assertIn("<await", collapsed)
+        self.assertIn("busy_wait", collapsed)
+        for line in collapsed.splitlines():
+            stack, count = line.rsplit(" ", 1)
+            self.assertTrue(count.isdigit())
+
+    async def test_admin_endpoints_list_download_and_prune(self):
+        headers = {"X-Profile-Token": self.token}
+        ids = [(await self.client.get(f"/work/{i}", headers=headers)).headers["x-profile-id"] for i in range(3)]
+
+        with patch("routes.profiles.settings.PROFILING_SECRET", SECRET), \
+                patch("routes.profiles.profile_store", self.store):
+            forbidden = await self.client.get("/admin/profiles")
+            listing = await self.client.get("/admin/profiles", params={"route": "/work/{item_id}"}, headers=headers)
+            download = await self.client.get(f"/admin/profiles/{ids[-1]}", headers=headers)
+            pruned = await self.client.get(f"/admin/profiles/{ids[0]}", headers=headers)
+            traversal = await self.client.get("/admin/profiles/..%2Fsecrets", headers=headers)
+
+        self.assertEqual(forbidden.status_code, 403)
+        self.assertEqual([meta["id"] for meta in listing.json()], ids[:0:-1])
+        self.assertEqual(download.status_code, 200)
+        self.assertIn("work", download.text)
+        self.assertEqual(pruned.status_code, 404)
+        self.assertEqual(traversal.status_code, 404)
+
+    async def test_sample_rate_profiles_without_token(self):
+        middleware = ProfilingMiddleware(None, self.sampler, self.store, sample_rate=0.5)
+        scope = {"type": "http", "path": "/work/1", "headers": []}
+
+        with patch("services.profiling.random.random", side_effect=[0.1, 0.9]):
+            self.assertEqual(middleware._trigger(scope), "sampled")
+            self.assertIsNone(middleware._trigger(scope))
+
+    async def test_profiling_is_disabled_without_running_task_lookup(self):
+        with patch("services.profiling._current_tasks", None), self.assertLogs("services.profiling", "WARNING"):
+            sampler = StackSampler()
+            middleware = ProfilingMiddleware(None, sampler, self.store, secret=SECRET, sample_rate=1.0)
+
+        scope = {"type": "http", "path": "/work/1", "headers": [(b"x-profile-token", self.token.encode())]}
+        self.assertFalse(sampler.available)
+        self.assertIsNone(middleware._trigger(scope))
+
+
+if __name__ == '__main__':
+    unittest.main()
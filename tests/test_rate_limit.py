@@ -0,0 +1,131 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, patch
+
+import fakeredis
+from fastapi import Depends, FastAPI, Form
+from fastapi.responses import RedirectResponse
+from httpx import ASGITransport, AsyncClient
+
+from services.rate_limit import (Limit, LocalLimiter, RateLimiter, RateLimitHeadersMiddleware, form_field,
+                                 rate_limit)
+
+
+class TestRedisRateLimiter(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.server = fakeredis.FakeServer()
+        self.redis = fakeredis.FakeAsyncRedis(server=self.server)
+        patcher = patch("services.rate_limit.get_redis", AsyncMock(return_value=self.redis))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.limiter = RateLimiter(redis_timeout=1)
+
+    async def asyncTearDown(self):
+        await self.redis.aclose()
+
+    async def test_both_windows_are_enforced_in_one_call(self):
+        ip, account = ("ip:1", Limit(5, 60)), ("acct:a", Limit(3, 60))
+
+        decisions = [await self.limiter.check([ip, account]) for _ in range(4)]
+        other_account = await self.limiter.check([ip, ("acct:b", Limit(3, 60))])
+
+        self.assertEqual([decision.allowed for decision in decisions], [True, True, True, False])
+        self.assertEqual([decision.remaining for decision in decisions[:3]], [2, 1, 0])
+        self.assertGreater(decisions[3].retry_after, 0)
+        self.assertIn("Retry-After", decisions[3].headers())
+        # The rejected attempt was not counted against the IP window.
+        self.assertTrue(other_account.allowed)
+        self.assertEqual(other_account.remaining, 1)
+        self.assertEqual(self.limiter.rejected, 1)
+
+    async def test_workers_share_the_window(self):
+        other_worker = RateLimiter(redis_timeout=1)
+        window = [("ip:1", Limit(2, 60))]
+
+        self.assertTrue((await self.limiter.check(window)).allowed)
+        self.assertTrue((await other_worker.check(window)).allowed)
+        self.assertFalse((await self.limiter.check(window)).allowed)
+
+    async def test_previous_window_is_weighted_by_overlap(self):
+        window = [("ip:1", Limit(4, 60))]
+        with patch("services.rate_limit.time.time", return_value=6000.0):
+            for _ in range(4):
+                self.assertTrue((await self.limiter.check(window)).allowed)
+            self.assertFalse((await self.limiter.check(window)).allowed)
+
+        # 15s into the next window 3/4 of the previous four requests still count.
+        with patch("services.rate_limit.time.time", return_value=6075.0):
+            decisions = [await self.limiter.check(window) for _ in range(2)]
+        self.assertEqual([decision.allowed for decision in decisions], [True, False])
+        self.assertAlmostEqual(decisions[1].retry_after, 15)
+        # At 45s only one of them does.
+        with patch("services.rate_limit.time.time", return_value=6105.0):
+            decisions = [await self.limiter.check(window) for _ in range(3)]
+        self.assertEqual([decision.allowed for decision in decisions], [True, True, False])
+
+
+class TestFallback(unittest.IsolatedAsyncioTestCase):
+
+    async def test_unavailable_redis_falls_back_to_local_buckets(self):
+        limiter = RateLimiter(redis_timeout=1, fallback_seconds=60)
+        get_redis = AsyncMock(side_effect=ConnectionError("down"))
+
+        with patch("services.rate_limit.get_redis", get_redis), self.assertLogs("services.rate_limit", "WARNING"):
+            decisions = [await limiter.check([("ip:1", Limit(2, 60))]) for _ in range(3)]
+
+        self.assertEqual([decision.allowed for decision in decisions], [True, True, False])
+        get_redis.assert_awaited_once()
+        self.assertEqual(limiter.stats()["falling_back"], 1)
+
+    async def test_slow_redis_times_out(self):
+        limiter = RateLimiter(redis_timeout=0.01, fallback_seconds=0)
+
+        async def slow_redis():
+            await asyncio.sleep(1)
+
+        with patch("services.rate_limit.get_redis", slow_redis), self.assertLogs("services.rate_limit", "WARNING"):
+            decision = await limiter.check([("ip:1", Limit(2, 60))])
+
+        self.assertTrue(decision.allowed)
+        self.assertEqual(limiter.fallbacks, 1)
+
+    def test_token_bucket_refills(self):
+        limiter = LocalLimiter()
+        window = [("ip:1", Limit(2, 10))]
+
+        self.assertEqual([limiter.check(window, now=0).allowed for _ in range(3)], [True, True, False])
+        self.assertFalse(limiter.check(window, now=4).allowed)
+        self.assertTrue(limiter.check(window, now=5).allowed)
+
+
+class TestRateLimitDependency(unittest.IsolatedAsyncioTestCase):
+
+    async def test_rejects_before_the_endpoint_and_sets_headers(self):
+        redis = fakeredis.FakeAsyncRedis()
+        verify = AsyncMock(return_value=True)
+        app = FastAPI()
+        app.add_middleware(RateLimitHeadersMiddleware)
+        limit = rate_limit("login", "10/60", "2/60", account=form_field("username"))
+
+        @app.post("/login", dependencies=[Depends(limit)])
+        async def login(username: str = Form(...), password: str = Form(...)):
+            await verify(password)
+            return RedirectResponse(url="/dashboard", status_code=302)
+
+        with patch("services.rate_limit.get_redis", AsyncMock(return_value=redis)), \
+                patch("services.rate_limit.rate_limiter", RateLimiter(redis_timeout=1)):
+            async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+                responses = [await client.post("/login", data={"username": "User@Example.com", "password": "x"})
+                             for _ in range(3)]
+
+        self.assertEqual([response.status_code for response in responses], [302, 302, 429])
+        self.assertEqual(responses[0].headers["x-ratelimit-limit"], "2")
+        self.assertEqual(responses[0].headers["x-ratelimit-remaining"], "1")
+        self.assertIn("retry-after", responses[2].headers)
+        self.assertEqual(verify.await_count, 2)
+        await redis.aclose()
+
+
+if __name__ == '__main__':
+    unittest.main()
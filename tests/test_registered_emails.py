@@ -0,0 +1,145 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import fakeredis
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from database.models import Base, User
+from repository import cached_users
+from services.registered_emails import RegisteredEmailFilter
+
+
+class TestRegisteredEmailFilter(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.engine = create_async_engine("sqlite+aiosqlite://")
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.execute(insert(User), [{"username": f"user{i}", "email": f"user{i}@example.com",
+                                               "password": "hash"} for i in range(500)])
+        self.session_local = async_sessionmaker(self.engine)
+        self.server = fakeredis.FakeServer()
+        self.redis = fakeredis.FakeAsyncRedis(server=self.server)
+        self.filters = []
+
+    async def asyncTearDown(self):
+        for emails in self.filters:
+            await emails.stop()
+        await self.redis.aclose()
+        await self.engine.dispose()
+
+    def make_filter(self, **kwargs):
+        emails = RegisteredEmailFilter(batch_size=64, **kwargs)
+        self.filters.append(emails)
+        return emails
+
+    async def start(self, emails, redis=None):
+        await emails.start(redis or self.redis, self.session_local)
+        # Let the listener subscribe and the first build finish.
+        for _ in range(50):
+            if emails.trusted:
+                break
+            await asyncio.sleep(0.01)
+        self.assertTrue(emails.trusted)
+
+    async def test_untrusted_filter_answers_maybe(self):
+        emails = self.make_filter()
+
+        self.assertTrue(emails.might_exist("nobody@example.com"))
+
+        await emails.rebuild(self.session_local)
+        # Built, but not listening for signups on other workers yet.
+        self.assertTrue(emails.might_exist("nobody@example.com"))
+
+    async def test_rebuild_has_no_false_negatives(self):
+        emails = self.make_filter()
+        await self.start(emails)
+
+        self.assertTrue(all(emails.might_exist(f"user{i}@example.com") for i in range(500)))
+        false_positives = sum(emails.might_exist(f"other{i}@example.com") for i in range(2000))
+        self.assertLess(false_positives, 100)
+        self.assertEqual(emails.stats()["emails"], 500)
+
+    async def test_add_reaches_other_workers(self):
+        first, second = self.make_filter(), self.make_filter()
+        await self.start(first)
+        await self.start(second)
+
+        await first.add("new@example.com")
+        for _ in range(50):
+            if second.might_exist("new@example.com"):
+                break
+            await asyncio.sleep(0.01)
+
+        self.assertTrue(first.might_exist("new@example.com"))
+        self.assertTrue(second.might_exist("new@example.com"))
+
+    async def test_recent_additions_survive_rebuild(self):
+        emails = self.make_filter()
+        await self.start(emails)
+        # Committed after the table scan started, so the scan misses it.
+        await emails.add("late@example.com")
+
+        await emails.rebuild(self.session_local)
+
+        self.assertTrue(emails.might_exist("late@example.com"))
+
+    async def test_rebuild_reset_during_scan_is_discarded(self):
+        emails = self.make_filter()
+
+        def resetting_session_factory():
+            # E.g. the listener reconnects while the table is being scanned.
+            emails._invalidate()
+            return self.session_local()
+
+        await emails.rebuild(resetting_session_factory)
+
+        self.assertEqual(emails.stats()["emails"], 0)
+        self.assertEqual(emails.stats()["rebuilds"], 0)
+
+    async def test_failed_broadcast_resets_other_workers(self):
+        first_redis = fakeredis.FakeAsyncRedis(server=self.server)
+        self.addAsyncCleanup(first_redis.aclose)
+        first, second = self.make_filter(), self.make_filter()
+        await self.start(first, first_redis)
+        await self.start(second)
+        async with self.session_local() as db:
+            db.add(User(username="new", email="new@example.com", password="hash"))
+            await db.commit()
+
+        with patch.object(first_redis, "publish", new=AsyncMock(side_effect=ConnectionError("timeout"))):
+            await first.add("new@example.com")
+        for _ in range(100):
+            if second.stats()["rebuilds"] >= 2 and second.trusted:
+                break
+            await asyncio.sleep(0.01)
+
+        self.assertTrue(second.might_exist("new@example.com"))
+        self.assertEqual(int(await self.redis.get("users:registered:generation")), 1)
+
+
+class TestCachedUsersFilter(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        redis = MagicMock()
+        redis.mget = AsyncMock(return_value=[None])
+        patcher = patch('repository.cached_users.get_redis', new=AsyncMock(return_value=redis))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch('repository.cached_users.repository_users.get_user_by_email', new_callable=AsyncMock)
+    @patch('repository.cached_users.registered_emails')
+    async def test_definite_miss_skips_database(self, mock_filter, mock_get_user):
+        mock_filter.might_exist.return_value = False
+
+        user = await cached_users.get_user_by_email("nobody@example.com", MagicMock())
+
+        self.assertIsNone(user)
+        mock_filter.might_exist.assert_called_once_with("nobody@example.com")
+        mock_get_user.assert_not_awaited()
+
+
+if __name__ == '__main__':
+    unittest.main()
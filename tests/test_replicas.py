@@ -0,0 +1,78 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from sqlalchemy import insert, update
+
+from database.db import ReplicaRouter, build_engine, build_sessionmaker
+from database.models import Base, User
+from repository import users as repository_users
+
+
+class TestReplicaRouting(unittest.IsolatedAsyncioTestCase):
+    """
+    Uses two SQLite files as primary and replica. The replica holds a stale copy
+    of the user, so the returned username shows which database served the read.
+    """
+
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.primary = build_engine(f"sqlite+aiosqlite:///{os.path.join(self.tmp.name, 'primary.db')}")
+        self.replica = build_engine(f"sqlite+aiosqlite:///{os.path.join(self.tmp.name, 'replica.db')}")
+        for engine, username in ((self.primary, "primary"), (self.replica, "replica")):
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+                await conn.execute(insert(User).values(id=1, username=username, email="test@example.com",
+                                                       password="hash", confirmed=False))
+        self.router = ReplicaRouter(self.primary, [self.replica], sticky_seconds=60)
+        self.session_local = build_sessionmaker(self.router)
+
+    async def asyncTearDown(self):
+        await self.primary.dispose()
+        await self.replica.dispose()
+        self.tmp.cleanup()
+
+    async def test_reads_go_to_replica(self):
+        async with self.session_local() as db:
+            user = await repository_users.get_user_by_email("test@example.com", db)
+
+        self.assertEqual(user.username, "replica")
+
+    async def test_session_reads_primary_after_write(self):
+        async with self.session_local() as db:
+            await db.execute(update(User).where(User.id == 1).values(confirmed=True))
+            user = await repository_users.get_user_by_email("test@example.com", db)
+
+        self.assertEqual(user.username, "primary")
+
+    async def test_read_your_writes_window(self):
+        self.router.mark_write("test@example.com")
+
+        async with self.session_local() as db:
+            sticky = await repository_users.get_user_by_email("test@example.com", db)
+        async with self.session_local() as db:
+            other = await repository_users.get_user_by_id(1, db)
+
+        self.assertEqual(sticky.username, "primary")
+        self.assertEqual(other.username, "replica")
+
+    def test_least_connections_strategy(self):
+        router = ReplicaRouter(self.primary, [self.replica, self.primary], strategy="least_connections")
+
+        self.assertIn(router.choose(), (self.replica, self.primary))
+        with self.assertRaises(ValueError):
+            ReplicaRouter(self.primary, [], strategy="random")
+
+    def test_expired_sticky_keys_are_pruned_on_write(self):
+        router = ReplicaRouter(self.primary, [self.replica], sticky_seconds=60)
+        with patch("database.db.time.monotonic", side_effect=[0, 1, 100]):
+            router.mark_write("a@example.com")
+            router.mark_write("b@example.com")
+            router.mark_write("c@example.com")
+
+        self.assertEqual(list(router._sticky_until), ["c@example.com"])
+
+
+if __name__ == '__main__':
+    unittest.main()
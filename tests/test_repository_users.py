@@ -1,7 +1,9 @@
 import unittest
 from unittest.mock import AsyncMock, patch, MagicMock, ANY
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.future import select
-from database.models import User
+from database.models import Base, User
 from database.schemas import UserModel
 
 from repository.users import (
@@ -11,6 +13,7 @@ from repository.users import (
     get_user_by_id,
     update_totp_secret,
     confirmed_email,
+    update_password,
     get_user_from_data
 )
 
@@ -39,24 +42,54 @@ class TestUserService(unittest.IsolatedAsyncioTestCase):
             email="test@example.com",
             password="pass123"
         )
+        mock_session.get_bind.return_value.dialect.name = "postgresql"
+        mock_result = MagicMock()
+        mock_result.first.return_value = User(email=user_data.email)
+        mock_session.scalars = AsyncMock(return_value=mock_result)
         mock_session.commit = AsyncMock()
-        mock_session.refresh = AsyncMock()
+
         new_user = await create_user(user_data, mock_session)
 
-        mock_session.add.assert_called_once()
+        stmt = mock_session.scalars.call_args.args[0]
+        self.assertIn("ON CONFLICT (email) DO NOTHING", str(stmt.compile(dialect=postgresql.dialect())))
         mock_session.commit.assert_awaited_once()
-        mock_session.refresh.assert_awaited_once()
         self.assertEqual(new_user.email, user_data.email)
 
+    async def test_create_user_unsupported_dialect(self):
+        db = MagicMock()
+        db.get_bind.return_value.dialect.name = "mysql"
+
+        with self.assertRaises(RuntimeError):
+            await create_user(UserModel(username="test_user", email="test@example.com", password="pass123"), db)
+
+    async def test_create_user_duplicate_email(self):
+        engine = create_async_engine("sqlite+aiosqlite://")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_local = async_sessionmaker(engine)
+        user_data = UserModel(username="test_user", email="test@example.com", password="pass123")
+
+        async with session_local() as db:
+            first = await create_user(user_data, db)
+            second = await create_user(user_data, db)
+        await engine.dispose()
+
+        self.assertEqual(first.email, "test@example.com")
+        self.assertIsNone(second)
+
     @patch('repository.users.Session', autospec=True)
     async def test_update_token(self, mock_session):
-        user = User(email="test@example.com", refresh_token=None)
-        token = "new_refresh_token"
+        mock_result = MagicMock()
+        mock_result.scalar.return_value = 1
+        mock_session.execute = AsyncMock(return_value=mock_result)
         mock_session.commit = AsyncMock()
 
-        await update_token(user, token, mock_session)
+        updated = await update_token("test@example.com", "new_refresh_token", mock_session)
 
-        self.assertEqual(user.refresh_token, token)
+        self.assertTrue(updated)
+        stmt = str(mock_session.execute.call_args.args[0])
+        self.assertIn("UPDATE users SET refresh_token", stmt)
+        self.assertIn("RETURNING users.id", stmt)
         mock_session.commit.assert_awaited_once()
 
     @patch('repository.users.Session', autospec=True)
@@ -75,32 +108,49 @@ class TestUserService(unittest.IsolatedAsyncioTestCase):
 
     @patch('repository.users.Session', autospec=True)
     async def test_update_totp_secret(self, mock_session):
-        user = User(email="test@example.com", totp_secret=None)
-        totp_secret = "new_totp_secret"
+        mock_result = MagicMock()
+        mock_result.scalar.return_value = "test@example.com"
+        mock_session.execute = AsyncMock(return_value=mock_result)
         mock_session.commit = AsyncMock()
 
-        await update_totp_secret(user, totp_secret, mock_session)
+        email = await update_totp_secret(1, "new_totp_secret", mock_session)
 
-        self.assertEqual(user.totp_secret, totp_secret)
+        self.assertEqual(email, "test@example.com")
+        mock_session.execute.assert_awaited_once()
         mock_session.commit.assert_awaited_once()
 
     @patch('repository.users.Session', autospec=True)
     async def test_confirmed_email(self, mock_session):
-        email = "test@example.com"
-        mock_user = User(email=email, confirmed=False)
         mock_result = MagicMock()
+        mock_result.scalar.return_value = 1
         mock_session.execute = AsyncMock(return_value=mock_result)
-        mock_scalars = MagicMock()
-        mock_result.scalars.return_value = mock_scalars
-        mock_scalars.first.return_value = mock_user
         mock_session.commit = AsyncMock()
 
-        await confirmed_email(email, mock_session)
+        confirmed = await confirmed_email("test@example.com", mock_session)
 
-        mock_session.execute.assert_called_once_with(ANY)
-        self.assertTrue(mock_user.confirmed)
+        self.assertTrue(confirmed)
+        mock_session.execute.assert_awaited_once()
+        self.assertIn("confirmed IS NOT true", str(mock_session.execute.call_args.args[0]))
         mock_session.commit.assert_awaited_once()
 
+    async def test_conditional_updates(self):
+        engine = create_async_engine("sqlite+aiosqlite://")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_local = async_sessionmaker(engine)
+
+        async with session_local() as db:
+            await create_user(UserModel(username="test_user", email="test@example.com", password="pass123"), db)
+            first = await confirmed_email("test@example.com", db)
+            second = await confirmed_email("test@example.com", db)
+            unknown = await confirmed_email("nobody@example.com", db)
+            stale = await update_password("test@example.com", "new", db, expected="not-the-hash")
+            fresh = await update_password("test@example.com", "new", db, expected="pass123")
+        await engine.dispose()
+
+        self.assertEqual((first, second, unknown), (True, False, False))
+        self.assertEqual((stale, fresh), (False, True))
+
     async def test_get_user_from_data(self):
         data = {
             "id": 1,
@@ -0,0 +1,58 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+
+from services.resources import ResourceRegistry
+
+
+class TestResourceRegistry(unittest.IsolatedAsyncioTestCase):
+
+    async def test_steps_start_in_order_and_stop_in_reverse(self):
+        registry = ResourceRegistry()
+        calls = []
+        registry.add("redis", start=lambda: calls.append("start redis"), stop=AsyncMock(
+            side_effect=lambda: calls.append("stop redis")))
+        registry.add("database", start=AsyncMock(side_effect=lambda: calls.append("start database")),
+                     stop=lambda: calls.append("stop database"))
+
+        await registry.startup()
+        await registry.shutdown()
+        await registry.shutdown()
+
+        self.assertEqual(calls, ["start redis", "start database", "stop database", "stop redis"])
+        self.assertIn("database", registry.timings)
+
+    async def test_optional_step_failure_is_logged_and_required_failure_unwinds(self):
+        registry = ResourceRegistry()
+        first_stop = MagicMock()
+        registry.add("cache", start=AsyncMock(side_effect=ConnectionError("down")))
+        registry.add("redis", start=MagicMock(), stop=first_stop)
+        registry.add("database", start=AsyncMock(side_effect=ConnectionError("down")), required=True,
+                     stop=MagicMock())
+
+        with self.assertLogs("services.resources", "WARNING"), self.assertRaises(ConnectionError):
+            await registry.startup()
+
+        first_stop.assert_called_once()
+        registry._steps[2].stop.assert_not_called()
+
+    async def test_lazy_resource_is_built_once_and_closed_only_if_used(self):
+        registry = ResourceRegistry()
+        factory = MagicMock(return_value="client")
+        close = AsyncMock()
+        used = registry.lazy("mail", factory, close=close)
+        unused_close = MagicMock()
+        registry.lazy("cloudinary", MagicMock(), close=unused_close)
+
+        self.assertFalse(used.initialized)
+        self.assertEqual(used.get(), "client")
+        self.assertEqual(used.get(), "client")
+        await registry.shutdown()
+
+        factory.assert_called_once()
+        close.assert_awaited_once_with("client")
+        unused_close.assert_not_called()
+        self.assertFalse(used.initialized)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+import asyncio
+import time
+import unittest
+from unittest.mock import AsyncMock, patch
+
+import fakeredis
+from fastapi import HTTPException
+
+from services.auth import auth_service
+from services.bloom import BloomFilter
+from services.revocation import REVOKED_TOKENS_KEY, REVOKED_USERS_KEY, RevocationList
+
+
+class TestBloomFilter(unittest.TestCase):
+
+    def test_no_false_negatives_and_low_false_positive_rate(self):
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        bloom.update(f"member-{i}" for i in range(1000))
+
+        self.assertTrue(all(f"member-{i}" in bloom for i in range(1000)))
+        false_positives = sum(f"other-{i}" in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+    def test_serialization_round_trip(self):
+        bloom = BloomFilter(capacity=100)
+        bloom.add("a@example.com")
+
+        restored = BloomFilter.from_bytes(bloom.to_bytes())
+
+        self.assertIn("a@example.com", restored)
+        self.assertEqual(len(restored), 1)
+
+
+class TestRevocationList(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.server = fakeredis.FakeServer()
+        self.redis = fakeredis.FakeAsyncRedis(server=self.server)
+        self.revocations = RevocationList(watermark_ttl=900, bloom_capacity=100, resync_interval=3600)
+
+    async def asyncTearDown(self):
+        await self.revocations.stop()
+        await self.redis.aclose()
+
+    def claims(self, jti="jti-1", iat=None, email="user@example.com"):
+        return {"sub": email, "jti": jti, "iat": int(iat if iat is not None else time.time()),
+                "exp": time.time() + 900}
+
+    async def test_revoke_token_and_user_locally(self):
+        await self.revocations.revoke_token("jti-1", time.time() + 900)
+        self.assertTrue(self.revocations.is_revoked(self.claims("jti-1")))
+        self.assertFalse(self.revocations.is_revoked(self.claims("jti-2")))
+
+        await self.revocations.revoke_user("user@example.com", at=1000)
+        self.assertTrue(self.revocations.is_revoked(self.claims("jti-3", iat=999)))
+        self.assertFalse(self.revocations.is_revoked(self.claims("jti-3", iat=1001)))
+        self.assertFalse(self.revocations.is_revoked(self.claims("jti-3", iat=999, email="other@example.com")))
+
+    async def test_start_loads_existing_records_and_drops_expired(self):
+        now = time.time()
+        await self.redis.zadd(REVOKED_TOKENS_KEY, {"live": now + 60, "expired": now - 60})
+        await self.redis.zadd(REVOKED_USERS_KEY, {"user@example.com": int(now), "old@example.com": now - 3600})
+
+        await self.revocations.start(self.redis)
+        await asyncio.sleep(0.05)
+
+        self.assertTrue(self.revocations.is_revoked(self.claims("live", iat=now + 10)))
+        self.assertFalse(self.revocations.is_revoked(self.claims("expired", iat=now + 10)))
+        self.assertTrue(self.revocations.is_revoked(self.claims("x", iat=now - 10)))
+        self.assertEqual(await self.redis.zcard(REVOKED_TOKENS_KEY), 1)
+        self.assertEqual(self.revocations.stats()["users"], 1)
+
+    async def test_revocations_propagate_to_other_workers(self):
+        other_redis = fakeredis.FakeAsyncRedis(server=self.server)
+        other = RevocationList(watermark_ttl=900, bloom_capacity=100, resync_interval=3600)
+        await self.revocations.start(self.redis)
+        await other.start(other_redis)
+        await asyncio.sleep(0.05)
+
+        await self.revocations.revoke_token("jti-1", time.time() + 900)
+        await self.revocations.revoke_user("user@example.com")
+        for _ in range(50):
+            if other.stats()["tokens"] and other.stats()["users"]:
+                break
+            await asyncio.sleep(0.01)
+
+        self.assertTrue(other.is_revoked(self.claims("jti-1", iat=time.time() + 10)))
+        self.assertTrue(other.is_revoked(self.claims("jti-2")))
+        await other.stop()
+        await other_redis.aclose()
+
+
+class TestAccessTokenRevocation(unittest.IsolatedAsyncioTestCase):
+
+    async def test_revoked_access_token_is_rejected(self):
+        revocations = RevocationList(watermark_ttl=900)
+        token = await auth_service.create_access_token(data={"sub": "user@example.com"})
+        payload = auth_service.decode_access_payload(token)
+        self.assertIn("jti", payload)
+
+        with patch("services.auth.revocation_list", revocations):
+            await revocations.revoke_token(payload["jti"], payload["exp"])
+            with self.assertRaises(HTTPException) as ctx:
+                auth_service.decode_access_payload(token)
+        self.assertEqual(ctx.exception.status_code, 401)
+
+    async def test_revoke_sessions_sets_watermark_and_clears_refresh_tokens(self):
+        revocations = RevocationList(watermark_ttl=900)
+        token = await auth_service.create_access_token(data={"sub": "user@example.com"})
+
+        with patch("services.auth.revocation_list", revocations), \
+                patch("services.auth.token_store.revoke_user", new_callable=AsyncMock) as revoke_refresh:
+            await auth_service.revoke_sessions("user@example.com")
+            with self.assertRaises(HTTPException):
+                auth_service.decode_access_payload(token)
+
+        revoke_refresh.assert_awaited_once_with("user@example.com")
+
+    async def test_login_right_after_revocation_is_not_revoked(self):
+        revocations = RevocationList(watermark_ttl=900)
+        old_token = await auth_service.create_access_token(data={"sub": "user@example.com"})
+
+        with patch("services.auth.revocation_list", revocations):
+            await revocations.revoke_user("user@example.com")
+            # Same second as the revocation: only sub-second iat tells the tokens apart.
+            new_token = await auth_service.create_access_token(data={"sub": "user@example.com"})
+            with self.assertRaises(HTTPException):
+                auth_service.decode_access_payload(old_token)
+            payload = auth_service.decode_access_payload(new_token)
+
+            # Logging out with the new token revokes it, and a later login works again.
+            await revocations.revoke_user("user@example.com", at=payload["iat"])
+            with self.assertRaises(HTTPException):
+                auth_service.decode_access_payload(new_token)
+            relogin = await auth_service.create_access_token(data={"sub": "user@example.com"})
+            self.assertEqual(auth_service.decode_access_payload(relogin)["sub"], "user@example.com")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from fastapi import HTTPException
+
+from services.auth import auth_service
+from services.token_store import RedisRefreshTokenStore, Rotation, create_token_store, PostgresRefreshTokenStore
+
+
+class TestRedisRefreshTokenStore(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.redis = MagicMock()
+        self.script = AsyncMock(return_value=1)
+        self.redis.register_script.return_value = self.script
+        patcher = patch('services.token_store.get_redis', new=AsyncMock(return_value=self.redis))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_rotate_is_one_script_call(self):
+        store = RedisRefreshTokenStore(ttl_seconds=60)
+
+        result = await store.rotate("test@example.com", "fam", "old", "new")
+
+        self.assertEqual(result, Rotation.ROTATED)
+        self.script.assert_awaited_once_with(
+            keys=["rt:{test@example.com}:family:fam", "rt:{test@example.com}:families"],
+            args=["old", "new", "fam", 60],
+        )
+
+    async def test_rotate_reports_reuse(self):
+        self.script.return_value = -1
+        store = RedisRefreshTokenStore(ttl_seconds=60)
+
+        result = await store.rotate("test@example.com", "fam", "stale", "new")
+
+        self.assertEqual(result, Rotation.REUSED)
+
+    def test_backend_selection(self):
+        self.assertIsInstance(create_token_store("postgres"), PostgresRefreshTokenStore)
+        self.assertIsInstance(create_token_store("redis"), RedisRefreshTokenStore)
+        with self.assertRaises(ValueError):
+            create_token_store("memcached")
+
+
+class TestRefreshTokenRotation(unittest.IsolatedAsyncioTestCase):
+
+    @patch('services.auth.token_store')
+    async def test_rotation_keeps_family(self, mock_store):
+        mock_store.create_family = AsyncMock()
+        mock_store.rotate = AsyncMock(return_value=Rotation.ROTATED)
+        token = await auth_service.issue_refresh_token("test@example.com", family_id="fam")
+
+        access_token, refresh_token = await auth_service.rotate_refresh_token(token, MagicMock())
+
+        payload = await auth_service.decode_refresh_payload(refresh_token)
+        self.assertEqual(payload["fid"], "fam")
+        self.assertEqual(payload["sub"], "test@example.com")
+        mock_store.rotate.assert_awaited_once()
+
+    @patch('services.auth.token_store')
+    async def test_reused_token_is_rejected(self, mock_store):
+        mock_store.create_family = AsyncMock()
+        mock_store.rotate = AsyncMock(return_value=Rotation.REUSED)
+        token = await auth_service.issue_refresh_token("test@example.com")
+
+        with self.assertRaises(HTTPException) as context:
+            await auth_service.rotate_refresh_token(token, MagicMock())
+
+        self.assertEqual(context.exception.status_code, 401)
+
+    @patch('services.auth.cached_users.update_token', new_callable=AsyncMock)
+    @patch('services.auth.token_store')
+    async def test_legacy_token_is_migrated(self, mock_store, mock_update_token):
+        mock_store.create_family = AsyncMock()
+        mock_update_token.return_value = True
+        legacy_token = await auth_service.create_refresh_token(data={"sub": "test@example.com"})
+
+        _, refresh_token = await auth_service.rotate_refresh_token(legacy_token, MagicMock())
+
+        payload = await auth_service.decode_refresh_payload(refresh_token)
+        self.assertIn("fid", payload)
+        mock_update_token.assert_awaited_once_with("test@example.com", None, unittest.mock.ANY,
+                                                   expected=legacy_token)
+        mock_store.create_family.assert_awaited_once()
+
+    @patch('services.auth.cached_users.update_token', new_callable=AsyncMock)
+    @patch('services.auth.token_store')
+    async def test_unknown_legacy_token_clears_column(self, mock_store, mock_update_token):
+        mock_update_token.return_value = False
+        legacy_token = await auth_service.create_refresh_token(data={"sub": "test@example.com"})
+
+        with self.assertRaises(HTTPException):
+            await auth_service.rotate_refresh_token(legacy_token, MagicMock())
+
+        self.assertEqual(mock_update_token.await_count, 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -49,7 +49,7 @@ class TestUserRepository(unittest.IsolatedAsyncioTestCase):
 @patch('repository.users.get_user_by_email', new_callable=AsyncMock)
 @patch('repository.users.create_user', new_callable=AsyncMock)
 @patch('services.email.send_email', new_callable=AsyncMock)
-@patch('services.auth.auth_service.get_password_hash', new_callable=MagicMock)
+@patch('services.auth.auth_service.get_password_hash', new_callable=AsyncMock)
 async def test_signup_success(mock_get_password_hash, mock_send_email, mock_create_user, mock_get_user_by_email):
 
     mock_get_user_by_email.return_value = None
@@ -69,15 +69,11 @@ async def test_signup_success(mock_get_password_hash, mock_send_email, mock_crea
     )
 
 
-    background_tasks = BackgroundTasks()
     request = MagicMock(Request)
 
     from routes.auth import signup
 
-    response = await signup(body, background_tasks, request)
-
-    for task in background_tasks.tasks:
-        await task()
+    response = await signup(body, request)
 
     mock_create_user.assert_called_once()
 
@@ -85,9 +81,14 @@ async def test_signup_success(mock_get_password_hash, mock_send_email, mock_crea
 
     assert response["message"] == "User created"
 
-    @patch('repository.users.get_user_by_email', new_callable=AsyncMock)
-    async def test_signup_user_already_exists(self, mock_get_user_by_email):
-        mock_get_user_by_email.return_value = MagicMock()
+
+class TestSignup(unittest.IsolatedAsyncioTestCase):
+
+    @patch('repository.cached_users.create_user', new_callable=AsyncMock)
+    @patch('services.auth.auth_service.get_password_hash', new_callable=AsyncMock)
+    @patch('repository.cached_users.peek', new_callable=AsyncMock)
+    async def test_signup_user_already_exists(self, mock_peek, mock_get_password_hash, mock_create_user):
+        mock_peek.return_value = MagicMock()
 
         body = UserModel(
             email="existinguser@example.com",
@@ -95,15 +96,33 @@ async def test_signup_success(mock_get_password_hash, mock_send_email, mock_crea
             password="password"
         )
 
-        background_tasks = BackgroundTasks()
         request = MagicMock(Request)
 
         from routes.auth import signup
 
         with self.assertRaises(HTTPException) as context:
-            await signup(body, background_tasks, request)
+            await signup(body, request, MagicMock())
 
         self.assertEqual(context.exception.status_code, 409)
+        mock_peek.assert_awaited_once_with("existinguser@example.com")
+        mock_get_password_hash.assert_not_awaited()
+        mock_create_user.assert_not_awaited()
+
+
+class TestRequestEmail(unittest.IsolatedAsyncioTestCase):
+
+    @patch('routes.auth.send_email', new_callable=AsyncMock)
+    @patch('repository.cached_users.get_user_by_email', new_callable=AsyncMock)
+    async def test_unknown_email_gets_neutral_response(self, mock_get_user_by_email, mock_send_email):
+        mock_get_user_by_email.return_value = None
+
+        from database.schemas import RequestEmail
+        from routes.auth import request_email
+
+        response = await request_email(RequestEmail(email="nobody@example.com"), MagicMock(Request), MagicMock())
+
+        self.assertEqual(response, {"message": "Check your email for confirmation."})
+        mock_send_email.assert_not_awaited()
 
 
 if __name__ == '__main__':
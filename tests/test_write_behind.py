@@ -0,0 +1,82 @@
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from database.models import Base, User
+from services.write_behind import WriteBehindBuffer
+
+
+class TestWriteBehindBuffer(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.engine = create_async_engine("sqlite+aiosqlite://")
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.session_local = async_sessionmaker(self.engine)
+        async with self.session_local() as db:
+            db.add_all([User(username=f"user{i}", email=f"user{i}@example.com", password="hash")
+                        for i in range(5)])
+            await db.commit()
+        self.buffer = WriteBehindBuffer(User.__table__, "email", flush_interval=3600, batch_size=2)
+        await self.buffer.start(self.engine)
+
+    async def asyncTearDown(self):
+        await self.buffer.stop()
+        await self.engine.dispose()
+
+    async def last_logins(self) -> dict:
+        async with self.session_local() as db:
+            result = await db.execute(select(User.email, User.last_login_at))
+            return dict(result.all())
+
+    async def test_flush_coalesces_and_batches(self):
+        for i in range(5):
+            self.buffer.record(f"user{i}@example.com", last_login_at=datetime(2024, 1, 1, i))
+        self.buffer.record("user0@example.com", last_login_at=datetime(2024, 2, 1))
+
+        self.assertEqual(await self.buffer.flush(), 5)
+
+        logins = await self.last_logins()
+        self.assertEqual(logins["user0@example.com"], datetime(2024, 2, 1))
+        self.assertEqual(logins["user4@example.com"], datetime(2024, 1, 1, 4))
+        self.assertEqual(self.buffer.stats()["batches"], 3)
+        self.assertEqual(self.buffer.stats()["pending"], 0)
+
+    async def test_stop_flushes_pending_rows(self):
+        self.buffer.record("user1@example.com", last_login_at=datetime(2024, 3, 1))
+
+        await self.buffer.stop()
+
+        self.assertEqual((await self.last_logins())["user1@example.com"], datetime(2024, 3, 1))
+
+    async def test_failed_flush_keeps_newer_values(self):
+        self.buffer.record("user1@example.com", last_login_at=datetime(2024, 3, 1))
+
+        async def failing_write(batch):
+            self.buffer.record("user1@example.com", last_login_at=datetime(2024, 4, 1))
+            raise ConnectionError("database is down")
+
+        with patch.object(self.buffer, "_write", side_effect=failing_write):
+            self.assertEqual(await self.buffer.flush(), 0)
+
+        self.assertEqual(self.buffer.stats()["failures"], 1)
+        self.assertEqual(await self.buffer.flush(), 1)
+        self.assertEqual((await self.last_logins())["user1@example.com"], datetime(2024, 4, 1))
+
+    def test_postgres_uses_update_from_values(self):
+        statement, parameters = self.buffer._statement(
+            "postgresql", ("last_login_at",), [{"email": "a@example.com", "last_login_at": datetime(2024, 1, 1)}])
+
+        sql = str(statement.compile(dialect=postgresql.dialect()))
+
+        self.assertIsNone(parameters)
+        self.assertIn("FROM (VALUES", sql)
+        self.assertIn("users.email = pending.email", sql)
+
+
+if __name__ == '__main__':
+    unittest.main()